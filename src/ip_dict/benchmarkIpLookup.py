@@ -0,0 +1,160 @@
+#!/usr/bin/env python
+# Copyright (c) 2014, Stanford University
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+Created on Oct 18, 2026
+
+Compares the lookup engines over the IpFullLocation 
+range table: binary search of the sorted range arrays
+(IpRangeTable), and the CIDR radix trie (IpRadixTrie).
+For tables of increasing size, cut from the full table,
+reports build time, memory of the engine's arrays, and 
+microseconds per lookup of random IPs.
+
+Also times the parsing of the table's lines by the 
+compiled parsers of DB15_SCHEMA and of a schema that keeps
+only the DB3 columns, against the csv.reader loop that
+IpFullLocation used before.
+
+@author: paepcke
+'''
+import argparse
+import csv
+import os
+import random
+import sys
+import time
+
+from ipRadixTrie import IpRadixTrie
+from ipRangeTable import IpRangeTable
+from ipTableSchema import DB3_COLUMNS, DB15_SCHEMA, IpTableSchema
+from ipToFullLocation import IpFullLocation
+
+NUM_LOOKUPS = 200000
+# Fractions of the full table to benchmark:
+TABLE_FRACTIONS = [1.0 / 64, 1.0 / 16, 1.0 / 4, 1.0]
+# Runs per parser of the parse benchmark:
+PARSE_REPEATS = 5
+
+#-----------------------------
+# subTable
+#-----------------------
+
+def subTable(rangeTable, fraction):
+    '''
+    Return an IpRangeTable with every 1/fraction'th
+    range of rangeTable.
+    '''
+    step = max(1, int(round(1 / fraction)))
+    rows = [(rangeTable.starts[rangeIdx], rangeTable.ends[rangeIdx]) + rangeTable.values(rangeIdx)
+            for rangeIdx in range(0, len(rangeTable), step)]
+    floatFields = [fieldName for fieldName in rangeTable.fieldNames if fieldName not in rangeTable.pools]
+    return IpRangeTable(rows, rangeTable.fieldNames, floatFields)
+
+#-----------------------------
+# arrayBytes
+#-----------------------
+
+def arrayBytes(*arrays):
+    return sum(column.itemsize * len(column) for column in arrays)
+
+#-----------------------------
+# timeLookups
+#-----------------------
+
+def timeLookups(engine, ipNums):
+    '''
+    Return microseconds per IP of engine.findRanges(ipNums).
+    '''
+    start = time.time()
+    engine.findRanges(ipNums)
+    return 1e6 * (time.time() - start) / len(ipNums)
+
+#-----------------------------
+# runBenchmark
+#-----------------------
+
+def runBenchmark(rangeTable, numLookups=NUM_LOOKUPS):
+    ipNums = [random.randrange(1 << 32) for _ in range(numLookups)]
+    print('%10s %10s %12s %12s %12s %12s %12s' % ('ranges', 'cidrs', 'trie build s', 
+                                                 'array KB', 'trie KB', 
+                                                 'array usec', 'trie usec'))
+    for fraction in TABLE_FRACTIONS:
+        table = subTable(rangeTable, fraction)
+        start = time.time()
+        trie = IpRadixTrie(table)
+        buildSecs = time.time() - start
+        print('%10d %10d %12.3f %12d %12d %12.3f %12.3f' %\
+              (len(table), trie.numCidrs, buildSecs,
+               arrayBytes(table.starts, table.ends) / 1024,
+               arrayBytes(trie.prefixes, trie.prefixLengths, 
+                          trie.children[0], trie.children[1], trie.rangeIdxs) / 1024,
+               timeLookups(table, ipNums),
+               timeLookups(trie, ipNums)))
+
+#-----------------------------
+# csvReaderRows
+#-----------------------
+
+def csvReaderRows(lines):
+    '''
+    Reference parser: the csv.reader loop that IpFullLocation
+    used before IpTableSchema, which converts every column of
+    each DB15 line, and strips quotes from the string columns.
+    '''
+    rows = []
+    for (startIP, endIP, twoLetter, country, region, city, latitude, longitude,
+         zipcode, timezone, countryPhoneCode, areaCode) in csv.reader(lines):
+        rows.append((int(startIP.strip('"')), int(endIP.strip('"')), 
+                     twoLetter.strip('"'), country.strip('"'), region.strip('"'), city.strip('"'),
+                     float(latitude), float(longitude), 
+                     zipcode.strip('"'), timezone.strip('"'), countryPhoneCode.strip('"'), areaCode.strip('"')))
+    return rows
+
+#-----------------------------
+# runParseBenchmark
+#-----------------------
+
+def runParseBenchmark(dbPath):
+    '''
+    Print seconds to parse the lines of a DB15 table,
+    best of PARSE_REPEATS runs.
+    '''
+    with open(dbPath, 'r') as fd:
+        lines = [line for line in fd if line[0] != '#' and not line.isspace()]
+    db3Columns = IpTableSchema(DB3_COLUMNS + [(name, colType, False) 
+                                              for (name, colType, _) in DB15_SCHEMA.columns[len(DB3_COLUMNS):]])
+    parsers = [('csv.reader loop', csvReaderRows),
+               ('DB15_SCHEMA', lambda lines: [DB15_SCHEMA.parseLine(line) for line in lines]),
+               ('DB3 columns', lambda lines: [db3Columns.parseLine(line) for line in lines])]
+    print('%20s %12s' % ('parser', 'parse s'))
+    for (label, parse) in parsers:
+        secs = []
+        for _ in range(PARSE_REPEATS):
+            start = time.time()
+            parse(lines)
+            secs.append(time.time() - start)
+        print('%20s %12.3f' % (label, min(secs)))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog=os.path.basename(sys.argv[0]), formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('-d', '--dbfile',
+                        help='fully qualified name of IP2Location DB15 CSV file. Default: the IpFullLocation default',
+                        default=None);
+    parser.add_argument('-n', '--numLookups',
+                        help='number of random IPs to look up. Default: %s' % NUM_LOOKUPS,
+                        type=int,
+                        default=NUM_LOOKUPS);
+    args = parser.parse_args();
+    runBenchmark(IpFullLocation(args.dbfile).rangeTable(), args.numLookups)
+    if args.dbfile is None:
+        args.dbfile = os.path.join(os.path.dirname(__file__), 'data', IpFullLocation.XLATION_CSV)
+    runParseBenchmark(args.dbfile)
@@ -0,0 +1,62 @@
+'''
+Created on Oct 18, 2026
+
+Opening of plain, gzip-, and zstd-compressed files,
+chosen by file name extension. Compressed streams are
+decompressed while they are read, and compressed while
+they are written, through a buffer of BUFFER_SIZE bytes;
+nothing is unpacked into temporary files.
+
+zstd support requires the optional zstandard package.
+
+@author: paepcke
+'''
+import gzip
+import io
+import os
+
+GZIP_EXTENSIONS = ('.gz', '.gzip')
+ZSTD_EXTENSIONS = ('.zst', '.zstd')
+
+BUFFER_SIZE = 1024 * 1024
+
+#-----------------------------
+# open_file
+#-----------------------
+
+def open_file(path, mode='r', buffer_size=BUFFER_SIZE):
+    '''
+    Open path for reading ('r') or writing ('w'). Files
+    ending in GZIP_EXTENSIONS or ZSTD_EXTENSIONS are 
+    decompressed or compressed on the fly. The result
+    is a buffered file object that can be iterated by 
+    line and used in with statements.
+
+    @param path: file to open
+    @type path: str
+    @param mode: 'r' or 'w', optionally with 'b'
+    @type mode: str
+    @param buffer_size: bytes to buffer
+    @type buffer_size: int
+    @raise ImportError: if path is a zstd file, and the zstandard 
+        package is not installed.
+    '''
+    writing = 'w' in mode
+    extension = os.path.splitext(path)[1].lower()
+    if extension in GZIP_EXTENSIONS:
+        stream = gzip.open(path, 'wb' if writing else 'rb')
+    elif extension in ZSTD_EXTENSIONS:
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("File %s is zstd-compressed; please install the zstandard package." % path)
+        if writing:
+            stream = zstandard.ZstdCompressor().stream_writer(open(path, 'wb'))
+        else:
+            stream = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'))
+    else:
+        return open(path, mode, buffer_size)
+    if writing:
+        return io.BufferedWriter(stream, buffer_size)
+    return io.BufferedReader(stream, buffer_size)
+
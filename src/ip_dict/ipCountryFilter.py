@@ -0,0 +1,149 @@
+# Copyright (c) 2014, Stanford University
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+Created on Oct 18, 2026
+
+Membership tests of IPs in a set of IP ranges, such
+as all ranges of a set of countries, without lookups.
+
+@author: paepcke
+'''
+from array import array
+import bisect
+
+
+class IpCountryFilter(object):
+    '''
+    Compiled set of IP ranges, such as those of the countries
+    that a geo-fence admits. The address space is cut into
+    /24 blocks, with one bit per block in each of two bitmaps:
+    
+        self.fullBlocks  : blocks that lie entirely in the set
+        self.mixedBlocks : blocks that lie partly in the set
+        
+    Most IPs are decided by their block's bits. IPs of mixed 
+    blocks are searched in the set's merged ranges:
+    
+        self.starts : array of start IPs of the merged ranges
+        self.ends   : array of end IPs of the merged ranges
+    
+    Each bitmap takes 2MB, independent of the number
+    of ranges.
+    '''
+    
+    # Number of /24 blocks in the IPv4 address space:
+    NUM_BLOCKS = 1 << 24
+
+    def __init__(self, ranges):
+        '''
+        @param ranges: (startIP, endIP) tuples of the set; 
+            may overlap, and may be in any order
+        @type ranges: iterable
+        '''
+        self.starts = array('I')
+        self.ends   = array('I')
+        for (start, end) in sorted(ranges):
+            if len(self.ends) > 0 and start <= self.ends[-1] + 1:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+        self.fullBlocks  = bytearray(IpCountryFilter.NUM_BLOCKS // 8)
+        self.mixedBlocks = bytearray(IpCountryFilter.NUM_BLOCKS // 8)
+        for (start, end) in zip(self.starts, self.ends):
+            # First and last block entirely in the range:
+            firstFull = (start + 255) >> 8
+            lastFull  = ((end + 1) >> 8) - 1
+            if firstFull <= lastFull:
+                self.setBits(self.fullBlocks, firstFull, lastFull)
+            if start & 255 != 0 or start >> 8 > lastFull:
+                self.setBits(self.mixedBlocks, start >> 8, start >> 8)
+            if end & 255 != 255 or end >> 8 < firstFull:
+                self.setBits(self.mixedBlocks, end >> 8, end >> 8)
+
+    #--------------------------
+    # contains 
+    #----------------
+
+    def contains(self, ipNum):
+        '''
+        Return True if the IP int is in the set. Takes
+        constant time, except for IPs of mixed blocks,
+        whose time is logarithmic in the number of ranges.
+        '''
+        block = ipNum >> 8
+        bit = 1 << (block & 7)
+        if self.fullBlocks[block >> 3] & bit:
+            return True
+        if not self.mixedBlocks[block >> 3] & bit:
+            return False
+        rangeIdx = bisect.bisect_right(self.starts, ipNum) - 1
+        return rangeIdx >= 0 and ipNum <= self.ends[rangeIdx]
+
+    #--------------------------
+    # membershipMask 
+    #----------------
+
+    def membershipMask(self, ipNums):
+        '''
+        Return 1 for each IP int in ipNums that is in the set,
+        and 0 for the others, and for None. ipNums may be a 
+        numpy array of ints, which is tested with array 
+        operations, and gives a numpy array of uint8. Otherwise
+        the result is an array('B').
+        '''
+        if hasattr(ipNums, 'dtype'):
+            import numpy
+            blocks = ipNums.astype(numpy.int64) >> 8
+            shifts = (blocks & 7).astype(numpy.uint8)
+            members = (numpy.frombuffer(self.fullBlocks, dtype=numpy.uint8)[blocks >> 3] >> shifts) & 1
+            mixed = numpy.flatnonzero((numpy.frombuffer(self.mixedBlocks, dtype=numpy.uint8)[blocks >> 3] >> shifts) & 1)
+            if len(mixed) > 0:
+                mixedIps = ipNums[mixed]
+                starts = numpy.frombuffer(self.starts, dtype=numpy.uint32)
+                ends   = numpy.frombuffer(self.ends, dtype=numpy.uint32)
+                rangeIdxs = numpy.searchsorted(starts, mixedIps, side='right') - 1
+                members[mixed] = (rangeIdxs >= 0) & (mixedIps <= ends[numpy.maximum(rangeIdxs, 0)])
+            return members
+        contains = self.contains
+        return array('B', (ipNum is not None and contains(ipNum) for ipNum in ipNums))
+
+    #--------------------------
+    # __contains__ 
+    #----------------
+
+    def __contains__(self, ipNum):
+        return self.contains(ipNum)
+
+    #--------------------------
+    # __len__ 
+    #----------------
+
+    def __len__(self):
+        '''
+        Number of merged ranges.
+        '''
+        return len(self.starts)
+
+    @staticmethod
+    def setBits(bitmap, firstBit, lastBit):
+        '''
+        Set bits firstBit to lastBit, inclusive; whole bytes
+        at a time where possible.
+        '''
+        while firstBit <= lastBit and firstBit & 7 != 0:
+            bitmap[firstBit >> 3] |= 1 << (firstBit & 7)
+            firstBit += 1
+        while lastBit >= firstBit and lastBit & 7 != 7:
+            bitmap[lastBit >> 3] |= 1 << (lastBit & 7)
+            lastBit -= 1
+        if firstBit < lastBit:
+            bitmap[firstBit >> 3:(lastBit >> 3) + 1] = b'\xff' * ((lastBit >> 3) + 1 - (firstBit >> 3))
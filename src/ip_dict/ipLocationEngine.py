@@ -0,0 +1,286 @@
+# Copyright (c) 2014, Stanford University
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+Created on Oct 18, 2026
+
+Loads an IP2Location DB15 table, which holds the country,
+region, city, and the other location fields of each range,
+once, and serves lookups in the result shapes of IpCountryDict,
+IpCountryStateDict, and IpFullLocation from that one copy:
+
+    engine = IpLocationEngine()
+    countries = engine.countryView()
+    countries.lookupIP('171.64.75.96')   --> ('US', 'USA', 'United States')
+    engine.countryStateView().get('171.64.75.96')
+    engine.fullLocationView().lookupIP('171.64.75.96')
+
+@author: paepcke
+'''
+import os
+
+from ipLookupRecord import recordType
+from ipRangeTable import IpRangeTable
+from ipReservedRanges import categoryId
+from ipTableSchema import DB15_SCHEMA
+from ipToCountry import IpCountryDict
+from ipToCountryState import IpCountryStateDict
+from ipToFullLocation import IpFullLocation
+
+
+# ISO 3166 three-letter codes by two-letter code; DB15
+# tables only hold the two-letter codes:
+THREE_LETTER_CODES = dict(codePair.split(':') for codePair in '''
+    AD:AND AE:ARE AF:AFG AG:ATG AI:AIA AL:ALB AM:ARM AO:AGO AQ:ATA AR:ARG AS:ASM AT:AUT AU:AUS AW:ABW AX:ALA AZ:AZE
+    BA:BIH BB:BRB BD:BGD BE:BEL BF:BFA BG:BGR BH:BHR BI:BDI BJ:BEN BL:BLM BM:BMU BN:BRN BO:BOL BQ:BES BR:BRA BS:BHS
+    BT:BTN BV:BVT BW:BWA BY:BLR BZ:BLZ CA:CAN CC:CCK CD:COD CF:CAF CG:COG CH:CHE CI:CIV CK:COK CL:CHL CM:CMR CN:CHN
+    CO:COL CR:CRI CU:CUB CV:CPV CW:CUW CX:CXR CY:CYP CZ:CZE DE:DEU DJ:DJI DK:DNK DM:DMA DO:DOM DZ:DZA EC:ECU EE:EST
+    EG:EGY EH:ESH ER:ERI ES:ESP ET:ETH FI:FIN FJ:FJI FK:FLK FM:FSM FO:FRO FR:FRA GA:GAB GB:GBR GD:GRD GE:GEO GF:GUF
+    GG:GGY GH:GHA GI:GIB GL:GRL GM:GMB GN:GIN GP:GLP GQ:GNQ GR:GRC GS:SGS GT:GTM GU:GUM GW:GNB GY:GUY HK:HKG HM:HMD
+    HN:HND HR:HRV HT:HTI HU:HUN ID:IDN IE:IRL IL:ISR IM:IMN IN:IND IO:IOT IQ:IRQ IR:IRN IS:ISL IT:ITA JE:JEY JM:JAM
+    JO:JOR JP:JPN KE:KEN KG:KGZ KH:KHM KI:KIR KM:COM KN:KNA KP:PRK KR:KOR KW:KWT KY:CYM KZ:KAZ LA:LAO LB:LBN LC:LCA
+    LI:LIE LK:LKA LR:LBR LS:LSO LT:LTU LU:LUX LV:LVA LY:LBY MA:MAR MC:MCO MD:MDA ME:MNE MF:MAF MG:MDG MH:MHL MK:MKD
+    ML:MLI MM:MMR MN:MNG MO:MAC MP:MNP MQ:MTQ MR:MRT MS:MSR MT:MLT MU:MUS MV:MDV MW:MWI MX:MEX MY:MYS MZ:MOZ NA:NAM
+    NC:NCL NE:NER NF:NFK NG:NGA NI:NIC NL:NLD NO:NOR NP:NPL NR:NRU NU:NIU NZ:NZL OM:OMN PA:PAN PE:PER PF:PYF PG:PNG
+    PH:PHL PK:PAK PL:POL PM:SPM PN:PCN PR:PRI PS:PSE PT:PRT PW:PLW PY:PRY QA:QAT RE:REU RO:ROU RS:SRB RU:RUS RW:RWA
+    SA:SAU SB:SLB SC:SYC SD:SDN SE:SWE SG:SGP SH:SHN SI:SVN SJ:SJM SK:SVK SL:SLE SM:SMR SN:SEN SO:SOM SR:SUR SS:SSD
+    ST:STP SV:SLV SX:SXM SY:SYR SZ:SWZ TC:TCA TD:TCD TF:ATF TG:TGO TH:THA TJ:TJK TK:TKL TL:TLS TM:TKM TN:TUN TO:TON
+    TR:TUR TT:TTO TV:TUV TW:TWN TZ:TZA UA:UKR UG:UGA UM:UMI US:USA UY:URY UZ:UZB VA:VAT VC:VCT VE:VEN VG:VGB VI:VIR
+    VN:VNM VU:VUT WF:WLF WS:WSM YE:YEM YT:MYT ZA:ZAF ZM:ZMB ZW:ZWE
+    '''.split())
+
+class IpLocationEngine(object):
+    '''
+    One column-wise copy (see IpRangeTable) of a DB15 table,
+    shared by any number of views. The views are cheap to
+    create, and hold no data of their own.
+    '''
+
+    def __init__(self, ipTablePath=None, schema=DB15_SCHEMA):
+        '''
+        Load the DB15 table, which may be gzip- or zstd-compressed 
+        (see compressed_files). Default: IpFullLocation.XLATION_CSV
+        in subdirectory 'data' of this script's directory.
+        
+        :param ipTablePath: DB15 CSV file
+        :type ipTablePath: {None | str}
+        :param schema: layout of the table; must keep the start IP, 
+            the end IP, and the columns of IpFullLocation.FIELD_NAMES
+        :type schema: IpTableSchema
+        '''
+        if schema.fieldNames[2:] != IpFullLocation.FIELD_NAMES:
+            raise ValueError("Schema must keep columns %s after the IPs." % IpFullLocation.FIELD_NAMES)
+        if ipTablePath is None:
+            tableSubPath = os.path.join('data/', IpFullLocation.XLATION_CSV)
+            ipTablePath = os.path.join(os.path.dirname(__file__), tableSubPath)
+        self.ipRangeTable = IpRangeTable(schema.readRows(ipTablePath), 
+                                         IpFullLocation.FIELD_NAMES, 
+                                         IpFullLocation.FLOAT_FIELDS,
+                                         IpFullLocation.RESERVED_FIELDS)
+
+    #--------------------------
+    # rangeTable 
+    #----------------
+
+    def rangeTable(self):
+        '''
+        :rtype: IpRangeTable
+        '''
+        return self.ipRangeTable
+
+    #--------------------------
+    # countryView 
+    #----------------
+
+    def countryView(self):
+        '''
+        :rtype: IpCountryView
+        '''
+        return IpCountryView(self)
+
+    #--------------------------
+    # countryStateView 
+    #----------------
+
+    def countryStateView(self):
+        '''
+        :rtype: IpCountryStateView
+        '''
+        return IpCountryStateView(self)
+
+    #--------------------------
+    # fullLocationView 
+    #----------------
+
+    def fullLocationView(self):
+        '''
+        :rtype: IpFullLocationView
+        '''
+        return IpFullLocationView(self)
+
+class IpEngineView(object):
+    '''
+    Lookups against the table of an IpLocationEngine. 
+    Subclasses name the fields of their results in 
+    FIELD_NAMES, and decide what IPs in no range return.
+    Reserved addresses give the subclass' RESERVED_RESULTS
+    without a search.
+    
+    Views decode fields for the IpLookupRecords of 
+    lookupRecord() in place of a range table, so their 
+    records hold the view's fields only.
+    '''
+    
+    def __init__(self, engine):
+        self.ipRangeTable = engine.rangeTable()
+        self.fieldNames = self.FIELD_NAMES
+        self.recordType = recordType(self.FIELD_NAMES)
+
+    #--------------------------
+    # get 
+    #----------------
+
+    def get(self, ipStr, default=None):
+        '''
+        Same as lookupIP, but returns default if
+        IP not found, rather than throwing a KeyError.
+        '''
+        try:
+            return self.lookupIP(ipStr)
+        except KeyError:
+            return default
+
+    #--------------------------
+    # lookupIP 
+    #----------------
+
+    def lookupIP(self, ipStr):
+        '''
+        :raise ValueError: when given IP address is not valid
+        :raise KeyError: when the IP is in no range, and the view 
+            has no result for such IPs. 
+        '''
+        (reserved, rangeIdx) = self.search(ipStr)
+        if reserved is not None:
+            return reserved
+        if rangeIdx == IpRangeTable.NOT_FOUND:
+            return self.notFound(ipStr)
+        return self.values(rangeIdx)
+
+    #--------------------------
+    # lookupRecord 
+    #----------------
+
+    def lookupRecord(self, ipStr):
+        '''
+        Return a compact IpLookupRecord with the fields of the 
+        view's FIELD_NAMES, decoded when read, as lookupRecord()
+        of the class that the view mirrors does. Reserved addresses
+        give their entry of RESERVED_RESULTS.
+        
+        :raise ValueError: when given IP address is not valid
+        :raise KeyError: when the IP is in no range.
+        '''
+        (reserved, rangeIdx) = self.search(ipStr)
+        if reserved is not None:
+            return reserved
+        if rangeIdx == IpRangeTable.NOT_FOUND:
+            raise KeyError("Ip %s not found in location translator." % ipStr)
+        return self.recordType(self, rangeIdx)
+
+    #--------------------------
+    # search 
+    #----------------
+
+    def search(self, ipStr):
+        '''
+        Return (the ReservedAddress of the IP, NOT_FOUND) for
+        reserved addresses, and (None, range index) otherwise.
+        
+        :raise ValueError: when given IP address is not valid
+        '''
+        ipNum = self.ipRangeTable.ipStrToInt(ipStr)
+        if ipNum is None:
+            raise ValueError("IP string is not a valid IP address: '%s'" % str(ipStr))
+        reserved = self.RESERVED_RESULTS[categoryId(ipNum)]
+        if reserved is not None:
+            return (reserved, IpRangeTable.NOT_FOUND)
+        return (None, self.ipRangeTable.findRange(ipNum))
+
+    #--------------------------
+    # value 
+    #----------------
+
+    def value(self, rangeIdx, fieldName):
+        return self.ipRangeTable.value(rangeIdx, fieldName)
+
+    #--------------------------
+    # values 
+    #----------------
+
+    def values(self, rangeIdx):
+        return tuple(self.value(rangeIdx, fieldName) for fieldName in self.FIELD_NAMES)
+
+    #--------------------------
+    # rangeTable 
+    #----------------
+
+    def rangeTable(self):
+        return self.ipRangeTable
+
+class IpCountryView(IpEngineView):
+    '''
+    lookupIP() and get() return what those of 
+    IpCountryDict return: (2-letter code, 3-letter code, 
+    country). Two-letter codes that are not in ISO 3166
+    get 3-letter code 'ZZZ'.
+    '''
+    
+    FIELD_NAMES = IpCountryDict.FIELD_NAMES
+    RESERVED_RESULTS = IpCountryDict.RESERVED_RESULTS
+
+    def value(self, rangeIdx, fieldName):
+        if fieldName == 'threeLetterCountry':
+            return THREE_LETTER_CODES.get(self.ipRangeTable.value(rangeIdx, 'twoLetterCountry'), 'ZZZ')
+        return self.ipRangeTable.value(rangeIdx, fieldName)
+
+    def notFound(self, ipStr):
+        return ('ZZ','ZZZ','unknown')
+
+class IpCountryStateView(IpEngineView):
+    '''
+    lookupIP() and get() return what those of 
+    IpCountryStateDict return: (2-letter code, country, 
+    region, city), or ('ZZ','ZZZ','unknown') for IPs 
+    in no range.
+    '''
+    
+    FIELD_NAMES = IpCountryStateDict.FIELD_NAMES
+    RESERVED_RESULTS = IpCountryStateDict.RESERVED_RESULTS
+
+    def notFound(self, ipStr):
+        return ('ZZ','ZZZ','unknown')
+
+class IpFullLocationView(IpEngineView):
+    '''
+    lookupIP() and get() return what those of 
+    IpFullLocation return: the values of all fields
+    of IpFullLocation.FIELD_NAMES. lookupIP() raises
+    KeyError for IPs in no range.
+    '''
+    
+    FIELD_NAMES = IpFullLocation.FIELD_NAMES
+    RESERVED_RESULTS = IpFullLocation.RESERVED_RESULTS
+
+    def values(self, rangeIdx):
+        return self.ipRangeTable.values(rangeIdx)
+
+    def notFound(self, ipStr):
+        raise KeyError("Ip %s not found in location translator." % ipStr)
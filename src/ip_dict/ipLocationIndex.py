@@ -0,0 +1,328 @@
+# Copyright (c) 2014, Stanford University
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+Created on Oct 18, 2026
+
+Inverted index from locations to the IP ranges 
+they hold, and counting of IPs by location.
+
+@author: paepcke
+'''
+from array import array
+import collections
+import itertools
+import multiprocessing
+
+from ipReservedRanges import CATEGORIES, PUBLIC, reservedMask
+
+
+class IpLocationIndex(object):
+    '''
+    For each distinct location of an IpRangeTable, the indexes
+    of its ranges, and the number of IP addresses in them. A 
+    location is the tuple of the range's values of keyFields, 
+    such as (twoLetterCountry, region). 
+    
+    Range indexes are stored grouped by location, in one array;
+    the ranges of location number i are
+    
+        self.rangeIdxs[self.offsets[i]:self.offsets[i+1]]
+        
+    in ascending order. Listing a location's ranges thus takes
+    time proportional to their number, and address counts
+    are precomputed.
+    
+    countIPs() tallies streams of IPs by location into an
+    array of ints, one per location number, plus one for IPs
+    in no range, and one per category of reserved addresses
+    (see ipReservedRanges). decodeCounts() turns such arrays
+    into {location : count}. Partial counts of chunks of a 
+    stream are merged by adding their arrays.
+    '''
+    
+    # IPs per pool task of countIPs():
+    COUNT_CHUNK_SIZE = 100000
+    # Chunks per worker process that countIPs() hands to 
+    # the pool before it waits for the oldest one's counts:
+    CHUNKS_IN_FLIGHT = 2
+
+    def __init__(self, rangeTable, keyFields):
+        '''
+        @param rangeTable: table to index
+        @type rangeTable: IpRangeTable
+        @param keyFields: names of the fields that make up a location
+        @type keyFields: [str]
+        '''
+        self.rangeTable = rangeTable
+        self.keyFields  = list(keyFields)
+        self.locations  = []
+        self.locationIds = {}
+        
+        # Location number of each range:
+        self.rangeLocations = rangeLocations = array('i')
+        for rangeIdx in range(len(rangeTable)):
+            location = tuple(rangeTable.value(rangeIdx, fieldName) for fieldName in self.keyFields)
+            try:
+                locationId = self.locationIds[location]
+            except KeyError:
+                locationId = self.locationIds[location] = len(self.locations)
+                self.locations.append(location)
+            rangeLocations.append(locationId)
+        
+        # Counting sort of the range indexes by location:
+        self.addressCounts = [0] * len(self.locations)
+        numRanges = [0] * len(self.locations)
+        for (rangeIdx, locationId) in enumerate(rangeLocations):
+            numRanges[locationId] += 1
+            self.addressCounts[locationId] += rangeTable.ends[rangeIdx] - rangeTable.starts[rangeIdx] + 1
+        self.offsets = array('L', [0])
+        for count in numRanges:
+            self.offsets.append(self.offsets[-1] + count)
+        self.rangeIdxs = array('i', [0]) * len(rangeLocations)
+        nextPos = array('L', self.offsets[:-1])
+        for (rangeIdx, locationId) in enumerate(rangeLocations):
+            self.rangeIdxs[nextPos[locationId]] = rangeIdx
+            nextPos[locationId] += 1
+        self.totalAddressCount = sum(self.addressCounts)
+
+    #--------------------------
+    # rangeIdxsOf 
+    #----------------
+
+    def rangeIdxsOf(self, location):
+        '''
+        Return the indexes of the ranges of the given location
+        tuple in ascending order; empty if the location is unknown.
+        '''
+        try:
+            locationId = self.locationIds[tuple(location)]
+        except KeyError:
+            return array('i')
+        return self.rangeIdxs[self.offsets[locationId]:self.offsets[locationId + 1]]
+
+    #--------------------------
+    # rangesOf 
+    #----------------
+
+    def rangesOf(self, location):
+        '''
+        Return the (startIP, endIP) tuples of the ranges of the
+        given location tuple in ascending order; empty if the 
+        location is unknown.
+        '''
+        starts = self.rangeTable.starts
+        ends   = self.rangeTable.ends
+        return [(starts[rangeIdx], ends[rangeIdx]) for rangeIdx in self.rangeIdxsOf(location)]
+
+    #--------------------------
+    # addressCountOf 
+    #----------------
+
+    def addressCountOf(self, location):
+        '''
+        Return the number of IP addresses of the given
+        location tuple; 0 if the location is unknown.
+        '''
+        try:
+            return self.addressCounts[self.locationIds[tuple(location)]]
+        except KeyError:
+            return 0
+
+    #--------------------------
+    # coverageOf 
+    #----------------
+
+    def coverageOf(self, location):
+        '''
+        Return the fraction of the addresses of all ranges
+        that belong to the given location tuple.
+        '''
+        if self.totalAddressCount == 0:
+            return 0.0
+        return float(self.addressCountOf(location)) / self.totalAddressCount
+
+    #--------------------------
+    # countIPs 
+    #----------------
+
+    def countIPs(self, ips, processes=1):
+        '''
+        Count IPs by location. Returns an array with the number
+        of IPs of location number i at position i. Position 
+        len(self) holds the number of invalid IPs and IPs in 
+        no range, and position len(self) + c the number of
+        reserved addresses of category id c. No result tuples 
+        are built along the way.
+        
+        With processes > 1, chunks of COUNT_CHUNK_SIZE IPs are 
+        counted by a pool of worker processes, and their partial
+        counts are added up. The workers inherit this index when
+        they are started, rather than receiving a copy. At most
+        CHUNKS_IN_FLIGHT chunks per process are read from ips 
+        ahead of the counting, so memory use does not grow with 
+        the length of ips.
+        
+        @param ips: IP strings, or IPs as ints, or a numpy
+            array of IP ints; best in ascending order (see 
+            IpRangeTable.findRangesSorted())
+        @type ips: iterable
+        @param processes: number of worker processes
+        @type processes: int
+        @rtype: array
+        '''
+        if processes <= 1:
+            counts = self.newCounts()
+            self.countInto(counts, ips)
+            return counts
+        chunks = ipBatches(ips, IpLocationIndex.COUNT_CHUNK_SIZE)
+        pool = multiprocessing.Pool(processes, initCountWorker, (self,))
+        try:
+            counts = self.newCounts()
+            inFlight = collections.deque()
+            for chunk in chunks:
+                if len(inFlight) >= processes * IpLocationIndex.CHUNKS_IN_FLIGHT:
+                    self.mergeCounts(counts, inFlight.popleft().get())
+                inFlight.append(pool.apply_async(countChunk, (chunk,)))
+            while inFlight:
+                self.mergeCounts(counts, inFlight.popleft().get())
+            return counts
+        finally:
+            pool.close()
+            pool.join()
+
+    #--------------------------
+    # countInto 
+    #----------------
+
+    def countInto(self, counts, ips):
+        '''
+        Add the IPs of ips to counts, an array from
+        newCounts() or countIPs(). Reserved addresses are
+        found COUNT_CHUNK_SIZE IPs at a time by reservedMask(),
+        and are not searched.
+        '''
+        rangeLocations = self.rangeLocations
+        # Slot of IPs in no range; reserved category c 
+        # is counted at noRange + c:
+        noRange = len(self.locations)
+        ipStrToInt = self.rangeTable.ipStrToInt
+        for batch in ipBatches(ips, IpLocationIndex.COUNT_CHUNK_SIZE):
+            if hasattr(batch, 'dtype'):
+                # Classified with numpy array operations:
+                categories = reservedMask(batch)
+                ipNums = batch.tolist()
+            else:
+                ipNums = [ip if isinstance(ip, (int, long)) else ipStrToInt(ip) for ip in batch]
+                categories = reservedMask(ipNums)
+            rangeIdxs = self.rangeTable.findRangesSorted(None if category != PUBLIC else ipNum
+                                                         for (ipNum, category) in zip(ipNums, categories))
+            for (rangeIdx, category) in zip(rangeIdxs, categories):
+                if rangeIdx < 0:
+                    counts[noRange + category] += 1
+                else:
+                    counts[rangeLocations[rangeIdx]] += 1
+
+    #--------------------------
+    # newCounts 
+    #----------------
+
+    def newCounts(self):
+        return array('L', [0]) * (len(self.locations) + len(CATEGORIES))
+
+    #--------------------------
+    # mergeCounts 
+    #----------------
+
+    @staticmethod
+    def mergeCounts(counts, partialCounts):
+        '''
+        Add partialCounts to counts in place.
+        '''
+        for (locationId, count) in enumerate(partialCounts):
+            if count:
+                counts[locationId] += count
+
+    #--------------------------
+    # decodeCounts 
+    #----------------
+
+    def decodeCounts(self, counts):
+        '''
+        Return {location : count} for the locations with 
+        non-zero count. The count of IPs in no range is under
+        None, and that of reserved addresses under their 
+        category, such as 'private', if non-zero.
+        '''
+        noRange = len(self.locations)
+        decoded = dict((self.locations[locationId], int(count)) 
+                       for (locationId, count) in enumerate(counts[:noRange]) if count)
+        for (category, count) in enumerate(counts[noRange:]):
+            if count:
+                decoded[None if category == PUBLIC else CATEGORIES[category]] = int(count)
+        return decoded
+
+    #--------------------------
+    # __contains__ 
+    #----------------
+
+    def __contains__(self, location):
+        return tuple(location) in self.locationIds
+
+    #--------------------------
+    # __iter__ 
+    #----------------
+
+    def __iter__(self):
+        return iter(self.locations)
+
+    #--------------------------
+    # __len__ 
+    #----------------
+
+    def __len__(self):
+        return len(self.locations)
+
+#--------------------------
+# ipBatches 
+#----------------
+
+def ipBatches(ips, batchSize):
+    '''
+    Generate lists of up to batchSize IPs of ips, or 
+    slices if ips is a numpy array.
+    '''
+    if hasattr(ips, 'dtype'):
+        for start in range(0, len(ips), batchSize):
+            yield ips[start:start + batchSize]
+        return
+    ips = iter(ips)
+    batch = list(itertools.islice(ips, batchSize))
+    while batch:
+        yield batch
+        batch = list(itertools.islice(ips, batchSize))
+
+# ---------------------------- Pool Workers -----------    
+
+# Index of the worker process, set when the worker starts:
+workerIndex = None
+
+def initCountWorker(index):
+    global workerIndex
+    workerIndex = index
+
+def countChunk(ips):
+    '''
+    Return the counts of one chunk of IPs, as 
+    IpLocationIndex.countIPs() does.
+    '''
+    counts = workerIndex.newCounts()
+    workerIndex.countInto(counts, ips)
+    return counts
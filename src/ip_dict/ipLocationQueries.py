@@ -0,0 +1,123 @@
+# Copyright (c) 2014, Stanford University
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+Created on Oct 18, 2026
+
+Location queries shared by the ip_dict lookup classes
+whose tables have country, region, and city fields.
+
+@author: paepcke
+'''
+
+
+class IpLocationQueries(object):
+    '''
+    Mixin for lookup classes whose rangeTable() has the
+    fields twoLetterCountry, region, and city. Answers 
+    questions about locations from the range table's 
+    location indexes (see IpRangeTable.locationIndex()).
+    '''
+
+    # Location fields of each countByLocation() level:
+    LOCATION_LEVELS = {'country' : ('twoLetterCountry',),
+                       'region'  : ('twoLetterCountry', 'region'),
+                       'city'    : ('twoLetterCountry', 'region', 'city')
+                       }
+
+    #--------------------------
+    # rangesIn 
+    #----------------
+
+    def rangesIn(self, twoLetterCountry, region=None, city=None):
+        '''
+        Return the (startIP, endIP) tuples of all ranges of a
+        country, or of a region of a country, or of a city of a 
+        region, in ascending order. Empty for unknown locations.
+        Uses a precomputed index, so takes time proportional
+        to the number of ranges returned.
+        :param twoLetterCountry: two-letter country code
+        :type twoLetterCountry: str
+        :param region: region within the country
+        :type region: {None | str}
+        :param city: city within the region
+        :type city: {None | str}
+        :rtype: [(int,int)]
+        :raise ValueError: if a city is given without a region.
+        '''
+        (keyFields, location) = self.locationKey(twoLetterCountry, region, city)
+        return self.rangeTable().locationIndex(keyFields).rangesOf(location)
+
+    #--------------------------
+    # addressCountIn 
+    #----------------
+
+    def addressCountIn(self, twoLetterCountry, region=None, city=None):
+        '''
+        Return the number of IP addresses of a location, as
+        specified for rangesIn(); 0 for unknown locations.
+        Takes constant time.
+        '''
+        (keyFields, location) = self.locationKey(twoLetterCountry, region, city)
+        return self.rangeTable().locationIndex(keyFields).addressCountOf(location)
+
+    #--------------------------
+    # coverageIn 
+    #----------------
+
+    def coverageIn(self, twoLetterCountry, region=None, city=None):
+        '''
+        Return the fraction of all addresses in the table that 
+        belong to a location, as specified for rangesIn().
+        '''
+        (keyFields, location) = self.locationKey(twoLetterCountry, region, city)
+        return self.rangeTable().locationIndex(keyFields).coverageOf(location)
+
+    #--------------------------
+    # countByLocation 
+    #----------------
+
+    def countByLocation(self, ips, level='country', processes=1):
+        '''
+        Count IPs by location, without building a lookup 
+        result per IP. Return {location : count}, where 
+        locations are (twoLetterCountry,), (twoLetterCountry, region),
+        or (twoLetterCountry, region, city) tuples, depending on
+        level. Invalid IPs and IPs in no range are counted under
+        None, reserved addresses under their category, such as
+        'private'. See IpLocationIndex.countIPs().
+        :param ips: IP strings, or IPs as ints
+        :type ips: iterable
+        :param level: one of LOCATION_LEVELS
+        :type level: str
+        :param processes: number of worker processes
+        :type processes: int
+        :rtype: {tuple : int}
+        '''
+        index = self.rangeTable().locationIndex(self.LOCATION_LEVELS[level])
+        return index.decodeCounts(index.countIPs(ips, processes))
+
+    #--------------------------
+    # locationKey 
+    #----------------
+
+    @staticmethod
+    def locationKey(twoLetterCountry, region, city):
+        '''
+        Return the range table fields and values that 
+        identify the given location.
+        '''
+        if region is None:
+            if city is not None:
+                raise ValueError("City %s given without a region." % city)
+            return (('twoLetterCountry',), (twoLetterCountry,))
+        if city is None:
+            return (('twoLetterCountry', 'region'), (twoLetterCountry, region))
+        return (('twoLetterCountry', 'region', 'city'), (twoLetterCountry, region, city))
@@ -0,0 +1,100 @@
+# Copyright (c) 2014, Stanford University
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+Created on Oct 18, 2026
+
+Compact lookup results that refer to a range of an 
+IpRangeTable, and decode its fields only when they
+are read.
+
+@author: paepcke
+'''
+
+
+class IpLookupRecord(object):
+    '''
+    Result of a lookup: the range table and the index of
+    the range that holds the IP, and nothing else. The 
+    record types of recordType() add one read-only property
+    per field of the table, such as record.country, which
+    decodes the field on access. 
+    
+    Records also unpack like the tuples that lookupIP() 
+    returns:
+    
+        (twoLetter, country, region, city) = record
+    '''
+    
+    __slots__ = ('rangeTable', 'rangeIdx')
+    
+    def __init__(self, rangeTable, rangeIdx):
+        self.rangeTable = rangeTable
+        self.rangeIdx = rangeIdx
+
+    #--------------------------
+    # asTuple 
+    #----------------
+
+    def asTuple(self):
+        return self.rangeTable.values(self.rangeIdx)
+
+    def __getitem__(self, fieldPos):
+        return self.rangeTable.value(self.rangeIdx, self.rangeTable.fieldNames[fieldPos])
+
+    def __iter__(self):
+        return iter(self.asTuple())
+
+    def __len__(self):
+        return len(self.rangeTable.fieldNames)
+
+    def __eq__(self, other):
+        if isinstance(other, IpLookupRecord):
+            return self.asTuple() == other.asTuple()
+        return self.asTuple() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return '%s%s' % (type(self).__name__, self.asTuple())
+
+# Record types made so far: {(fieldName1, fieldName2, ...) : type}
+recordTypes = {}
+
+#--------------------------
+# recordType 
+#----------------
+
+def recordType(fieldNames):
+    '''
+    Return the IpLookupRecord subclass with one property
+    per field name. Tables with the same fields share one
+    record type.
+    
+    @param fieldNames: fields of a range table
+    @type fieldNames: [str]
+    @rtype: type
+    '''
+    fieldNames = tuple(fieldNames)
+    try:
+        return recordTypes[fieldNames]
+    except KeyError:
+        pass
+    classDict = {'__slots__' : ()}
+    for fieldName in fieldNames:
+        classDict[fieldName] = property(fieldGetter(fieldName), doc='Decoded %s field' % fieldName)
+    recordTypes[fieldNames] = type('IpLookupRecord', (IpLookupRecord,), classDict)
+    return recordTypes[fieldNames]
+
+def fieldGetter(fieldName):
+    def getField(record):
+        return record.rangeTable.value(record.rangeIdx, fieldName)
+    return getField
@@ -0,0 +1,287 @@
+# Copyright (c) 2014, Stanford University
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+Created on Oct 18, 2026
+
+Alternative lookup engine for the ip_dict range tables:
+every range is split into CIDR blocks, which are stored
+in a path-compressed binary trie (Patricia trie). A lookup
+follows at most one node per address bit, so its cost
+depends on the 32-bit address width, not on the number
+of ranges.
+
+The CIDR blocks, with the location fields of their
+ranges, can be exported for firewalls and longest-prefix
+match tools:
+
+    ipRadixTrie.py [-d dbfile] outfile
+
+@author: paepcke
+'''
+from array import array
+import argparse
+import csv
+import os
+import sys
+
+from compressed_files import open_file
+from ipRangeTable import IpRangeTable
+
+ADDRESS_BITS = 32
+ADDRESS_MASK = (1 << ADDRESS_BITS) - 1
+
+#-----------------------------
+# rangeToCidrs
+#-----------------------
+
+def rangeToCidrs(startIp, endIp):
+    '''
+    Return the shortest list of (network, prefixLength) CIDR 
+    blocks that exactly cover startIp..endIp, in ascending order.
+    '''
+    cidrs = []
+    while startIp <= endIp:
+        # Largest block that is aligned at startIp...
+        if startIp == 0:
+            blockBits = ADDRESS_BITS
+        else:
+            blockBits = (startIp & -startIp).bit_length() - 1
+        # ...and does not reach beyond endIp:
+        while startIp + (1 << blockBits) - 1 > endIp:
+            blockBits -= 1
+        cidrs.append((startIp, ADDRESS_BITS - blockBits))
+        startIp += 1 << blockBits
+    return cidrs
+
+#-----------------------------
+# cidrToStr
+#-----------------------
+
+def cidrToStr(network, prefixLength):
+    return '%d.%d.%d.%d/%d' % ((network >> 24) & 255, (network >> 16) & 255, 
+                               (network >> 8) & 255, network & 255,
+                               prefixLength)
+
+class IpRadixTrie(object):
+    '''
+    Patricia trie over the CIDR blocks of all ranges of
+    an IpRangeTable. Nodes are positions in flat arrays:
+    
+        self.prefixes       : the node's prefix bits, left aligned
+        self.prefixLengths  : number of valid bits in the prefix
+        self.children[0|1]  : node of the next bit 0 or 1, or NO_NODE
+        self.rangeIdxs      : range index of the node's CIDR block, 
+                              or NOT_FOUND for branching-only nodes
+    
+    self.root is the root node. Chains of nodes with one child
+    are collapsed into one node with a longer prefix, so
+    there are fewer than two nodes per CIDR block.
+    '''
+    
+    NO_NODE = -1
+
+    def __init__(self, rangeTable):
+        '''
+        @param rangeTable: ranges to index
+        @type rangeTable: IpRangeTable
+        '''
+        self.rangeTable = rangeTable
+        self.prefixes      = array('I')
+        self.prefixLengths = array('B')
+        self.children      = (array('i'), array('i'))
+        self.rangeIdxs     = array('i')
+        self.root = IpRadixTrie.NO_NODE
+        self.numCidrs = 0
+        for rangeIdx in range(len(rangeTable)):
+            for (network, prefixLength) in rangeToCidrs(rangeTable.starts[rangeIdx], 
+                                                        rangeTable.ends[rangeIdx]):
+                self.insert(network, prefixLength, rangeIdx)
+                self.numCidrs += 1
+
+    #--------------------------
+    # findRange 
+    #----------------
+
+    def findRange(self, ipNum):
+        '''
+        Return the index of the range that holds ipNum,
+        or IpRangeTable.NOT_FOUND. Takes at most 33 steps.
+        '''
+        # Locals, since this loop runs for every IP:
+        prefixes = self.prefixes
+        prefixLengths = self.prefixLengths
+        rangeIdxs = self.rangeIdxs
+        (zeroChildren, oneChildren) = self.children
+        found = IpRangeTable.NOT_FOUND
+        node = self.root
+        while node >= 0:
+            shift = ADDRESS_BITS - prefixLengths[node]
+            if (ipNum ^ prefixes[node]) >> shift:
+                break
+            if rangeIdxs[node] >= 0:
+                found = rangeIdxs[node]
+            if shift == 0:
+                break
+            if (ipNum >> (shift - 1)) & 1:
+                node = oneChildren[node]
+            else:
+                node = zeroChildren[node]
+        return found
+
+    #--------------------------
+    # findRanges 
+    #----------------
+
+    def findRanges(self, ipNums):
+        '''
+        Same as IpRangeTable.findRanges(), using the trie.
+        '''
+        rangeIdxs = array('i')
+        for ipNum in ipNums:
+            rangeIdxs.append(IpRangeTable.NOT_FOUND if ipNum is None else self.findRange(ipNum))
+        return rangeIdxs
+
+    #--------------------------
+    # lookupIP 
+    #----------------
+
+    def lookupIP(self, ipStr):
+        '''
+        Return the tuple of field values of the range
+        that holds the given IP string.
+        
+        :raise ValueError: if ipStr is not a valid IP address.
+        :raise KeyError: if the IP is in no range.
+        '''
+        ipNum = IpRangeTable.ipStrToInt(ipStr)
+        if ipNum is None:
+            raise ValueError("IP string is not a valid IP address: '%s'" % str(ipStr))
+        rangeIdx = self.findRange(ipNum)
+        if rangeIdx == IpRangeTable.NOT_FOUND:
+            raise KeyError("Ip %s not found in location translator." % ipStr)
+        return self.rangeTable.values(rangeIdx)
+
+    #--------------------------
+    # writeCidrs 
+    #----------------
+
+    def writeCidrs(self, outPath):
+        '''
+        Write a CSV file with one row per CIDR block, in 
+        ascending address order: the block in a.b.c.d/n
+        notation, followed by the fields of its range. The 
+        first row holds the column names. outPath may end 
+        in .gz or .zst (see compressed_files).
+        '''
+        with open_file(outPath, 'w') as fd:
+            writer = csv.writer(fd)
+            writer.writerow(['cidr'] + self.rangeTable.fieldNames)
+            for rangeIdx in range(len(self.rangeTable)):
+                values = list(self.rangeTable.values(rangeIdx))
+                for (network, prefixLength) in rangeToCidrs(self.rangeTable.starts[rangeIdx], 
+                                                            self.rangeTable.ends[rangeIdx]):
+                    writer.writerow([cidrToStr(network, prefixLength)] + values)
+
+    #--------------------------
+    # insert 
+    #----------------
+
+    def insert(self, network, prefixLength, rangeIdx):
+        '''
+        Store rangeIdx under the CIDR block network/prefixLength.
+        '''
+        if self.root == IpRadixTrie.NO_NODE:
+            self.root = self.newNode(network, prefixLength, rangeIdx)
+            return
+        parent = IpRadixTrie.NO_NODE
+        parentBit = 0
+        node = self.root
+        while True:
+            nodeLength = self.prefixLengths[node]
+            common = self.commonLength(network, prefixLength, self.prefixes[node], nodeLength)
+            if common < nodeLength:
+                # The new block branches off within this
+                # node's prefix. Split the node:
+                split = self.newNode(network & self.maskOf(common), common, IpRangeTable.NOT_FOUND)
+                if parent == IpRadixTrie.NO_NODE:
+                    self.root = split
+                else:
+                    self.children[parentBit][parent] = split
+                self.children[self.bitAt(self.prefixes[node], common)][split] = node
+                if common == prefixLength:
+                    self.rangeIdxs[split] = rangeIdx
+                else:
+                    self.children[self.bitAt(network, common)][split] =\
+                        self.newNode(network, prefixLength, rangeIdx)
+                return
+            if nodeLength == prefixLength:
+                self.rangeIdxs[node] = rangeIdx
+                return
+            bit = self.bitAt(network, nodeLength)
+            child = self.children[bit][node]
+            if child == IpRadixTrie.NO_NODE:
+                self.children[bit][node] = self.newNode(network, prefixLength, rangeIdx)
+                return
+            (parent, parentBit, node) = (node, bit, child)
+
+    #--------------------------
+    # __len__ 
+    #----------------
+
+    def __len__(self):
+        '''
+        Number of trie nodes.
+        '''
+        return len(self.rangeIdxs)
+
+    # ------------------------------------- Utility Methods ---------------
+
+    def newNode(self, prefix, prefixLength, rangeIdx):
+        self.prefixes.append(prefix)
+        self.prefixLengths.append(prefixLength)
+        self.children[0].append(IpRadixTrie.NO_NODE)
+        self.children[1].append(IpRadixTrie.NO_NODE)
+        self.rangeIdxs.append(rangeIdx)
+        return len(self.rangeIdxs) - 1
+
+    @staticmethod
+    def commonLength(prefix1, length1, prefix2, length2):
+        '''
+        Return the number of leading bits that two
+        prefixes share, up to the shorter length.
+        '''
+        return min(length1, length2, ADDRESS_BITS - (prefix1 ^ prefix2).bit_length())
+
+    @staticmethod
+    def bitAt(ipNum, position):
+        '''
+        Return the bit at position, counted from the
+        most significant bit, which is position 0.
+        '''
+        return (ipNum >> (ADDRESS_BITS - 1 - position)) & 1
+
+    @staticmethod
+    def maskOf(prefixLength):
+        return ADDRESS_MASK ^ ((1 << (ADDRESS_BITS - prefixLength)) - 1)
+
+if __name__ == '__main__':
+    
+    from ipToFullLocation import IpFullLocation
+    
+    parser = argparse.ArgumentParser(prog=os.path.basename(sys.argv[0]), formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('-d', '--dbfile',
+                        help='fully qualified name of IP2Location DB15 CSV file. Default: the IpFullLocation default',
+                        default=None);
+    parser.add_argument('outfile',
+                        help='CSV file for the CIDR blocks and their locations, optionally .gz or .zst'
+                        )
+    args = parser.parse_args();
+    IpRadixTrie(IpFullLocation(args.dbfile).rangeTable()).writeCidrs(args.outfile)
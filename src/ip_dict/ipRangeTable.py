@@ -0,0 +1,437 @@
+# Copyright (c) 2014, Stanford University
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+
+'''
+Created on Oct 18, 2026
+
+Column-wise copy of the range tables that the ip_dict
+lookup classes load, for lookups of many IPs at once.
+
+Lookup results can be written as Apache Arrow or Parquet 
+files; this requires the optional pyarrow package.
+
+@author: paepcke
+'''
+from array import array
+import bisect
+import itertools
+import os
+
+from ipLocationIndex import IpLocationIndex
+from ipLookupRecord import recordType
+from ipReservedRanges import CATEGORIES, PUBLIC, categoryId, reservedMask, reservedResults
+
+
+class IpRangeTable(object):
+    '''
+    All ranges of an ip_dict lookup table, sorted by start IP,
+    and stored in flat arrays:
+    
+        self.starts : array of range start IPs 
+        self.ends   : array of range end IPs
+        self.columns: {fieldName : array}, one entry per range
+        self.pools  : {fieldName : [distinct values]}
+        
+    String fields are dictionary encoded: their column holds,
+    for each range, the position of the range's value in the
+    field's pool. Float fields hold the values themselves, and
+    have no pool.
+    
+    Ranges are referred to by their position, the range index.
+    
+    Reserved addresses, such as private networks, are answered
+    before any search by all lookups of whole results, with 
+    the ReservedAddress of their category (see ipReservedRanges).
+    findRange() and its kin only search.
+    '''
+    
+    NOT_FOUND = -1
+    
+    # Ranges that findRangesSorted() steps over one by one
+    # before it searches for the next IP's range:
+    MERGE_STEPS = 8
+    
+    # IPs per batch that lookupSorted() classifies 
+    # with one reservedMask() call:
+    SORTED_BATCH_SIZE = 4096
+    
+    # IPs per Arrow record batch written by writeLookups():
+    ARROW_BATCH_SIZE = 65536
+    PARQUET_EXTENSIONS = ('.parquet', '.pq')
+
+    def __init__(self, rows, fieldNames, floatFields=(), reservedFields=None):
+        '''
+        @param rows: (startIP, endIP, field1, field2, ...) tuples,
+            sorted by startIP, and with one field per fieldName
+        @type rows: iterable
+        @param fieldNames: names of the fields after startIP and endIP
+        @type fieldNames: [str]
+        @param floatFields: names of fields that hold floats
+        @type floatFields: [str]
+        @param reservedFields: field values of reserved addresses.
+            Default: '-' for string fields, 0.0 for float fields
+        @type reservedFields: {None | tuple}
+        '''
+        self.fieldNames = list(fieldNames)
+        self.recordType = recordType(self.fieldNames)
+        if reservedFields is None:
+            reservedFields = tuple(0.0 if fieldName in floatFields else '-' 
+                                   for fieldName in self.fieldNames)
+        # Lookup result of each reserved category id:
+        self.reservedResults = reservedResults(reservedFields, self.fieldNames)
+        self.starts = array('I')
+        self.ends   = array('I')
+        self.columns = {}
+        self.pools = {}
+        # Built on demand by locationIndex():
+        self.locationIndexes = {}
+        poolIndexes = {}
+        for fieldName in self.fieldNames:
+            if fieldName in floatFields:
+                self.columns[fieldName] = array('d')
+            else:
+                self.columns[fieldName] = array('i')
+                self.pools[fieldName] = []
+                poolIndexes[fieldName] = {}
+        
+        for row in rows:
+            self.starts.append(row[0])
+            self.ends.append(row[1])
+            for (fieldName, value) in zip(self.fieldNames, row[2:]):
+                try:
+                    pool = self.pools[fieldName]
+                except KeyError:
+                    # Float field:
+                    self.columns[fieldName].append(value)
+                    continue
+                try:
+                    valueId = poolIndexes[fieldName][value]
+                except KeyError:
+                    valueId = poolIndexes[fieldName][value] = len(pool)
+                    pool.append(value)
+                self.columns[fieldName].append(valueId)
+
+    #--------------------------
+    # fromIpDict 
+    #----------------
+
+    @classmethod
+    def fromIpDict(cls, ipDict, fieldNames, floatFields=(), reservedFields=None):
+        '''
+        Build a table from the ipDict of an ip_dict lookup
+        class: {hashKey : [(startIP, endIP, field1, ...), ...]}.
+        '''
+        rows = sorted(row for rangeChain in ipDict.values() for row in rangeChain)
+        return cls(rows, fieldNames, floatFields, reservedFields)
+
+    #--------------------------
+    # findRange 
+    #----------------
+
+    def findRange(self, ipNum):
+        '''
+        Return the index of the range that holds ipNum,
+        or NOT_FOUND.
+        '''
+        rangeIdx = bisect.bisect_right(self.starts, ipNum) - 1
+        if rangeIdx < 0 or ipNum > self.ends[rangeIdx]:
+            return IpRangeTable.NOT_FOUND
+        return rangeIdx
+
+    #--------------------------
+    # lookupRecord 
+    #----------------
+
+    def lookupRecord(self, ipStr):
+        '''
+        Return an IpLookupRecord of the range that holds 
+        the IP. The record holds just the range index, and
+        decodes fields when they are read. Reserved addresses
+        give their ReservedAddress, whose fields can be read
+        by name as well.
+        
+        @raise ValueError: if ipStr is not a valid IP address.
+        @raise KeyError: if the IP is in no range.
+        '''
+        ipNum = self.ipStrToInt(ipStr)
+        if ipNum is None:
+            raise ValueError("IP string is not a valid IP address: '%s'" % str(ipStr))
+        reserved = self.reservedResults[categoryId(ipNum)]
+        if reserved is not None:
+            return reserved
+        rangeIdx = self.findRange(ipNum)
+        if rangeIdx == IpRangeTable.NOT_FOUND:
+            raise KeyError("Ip %s not found in location translator." % ipStr)
+        return self.recordType(self, rangeIdx)
+
+    #--------------------------
+    # findRanges 
+    #----------------
+
+    def findRanges(self, ipNums):
+        '''
+        Return an array with the range index of each
+        IP in ipNums. IPs that are None, or that are in
+        no range, get NOT_FOUND.
+        '''
+        rangeIdxs = array('i')
+        for ipNum in ipNums:
+            rangeIdxs.append(IpRangeTable.NOT_FOUND if ipNum is None else self.findRange(ipNum))
+        return rangeIdxs
+
+    #--------------------------
+    # findRangesSorted 
+    #----------------
+
+    def findRangesSorted(self, ipNums):
+        '''
+        Generate the range index of each IP in ipNums, like 
+        findRanges(), but by merging ipNums with the ranges
+        instead of searching: a cursor into the ranges only 
+        moves forward. For ascending ipNums, such as distinct
+        IP dumps ordered by IP, the total work is proportional
+        to the number of IPs plus the number of ranges.
+        
+        An IP that is lower than its predecessor, as in unsorted
+        or only partly clustered input, moves the cursor back 
+        by binary search, after which merging resumes. So does
+        an IP beyond the next MERGE_STEPS ranges. Results are
+        therefore correct for any order of ipNums, and unsorted
+        input costs no more than findRanges().
+        '''
+        starts = self.starts
+        ends   = self.ends
+        numRanges = len(starts)
+        # All ranges before the cursor end below prevIpNum:
+        cursor = 0
+        prevIpNum = 0
+        for ipNum in ipNums:
+            if ipNum is None:
+                yield IpRangeTable.NOT_FOUND
+                continue
+            if ipNum < prevIpNum:
+                cursor = bisect.bisect_left(ends, ipNum)
+            else:
+                steps = 0
+                while cursor < numRanges and ends[cursor] < ipNum:
+                    steps += 1
+                    if steps > IpRangeTable.MERGE_STEPS:
+                        cursor = bisect.bisect_left(ends, ipNum, cursor)
+                        break
+                    cursor += 1
+            prevIpNum = ipNum
+            if cursor < numRanges and starts[cursor] <= ipNum:
+                yield cursor
+            else:
+                yield IpRangeTable.NOT_FOUND
+
+    #--------------------------
+    # lookupSorted 
+    #----------------
+
+    def lookupSorted(self, ipStrs):
+        '''
+        Generate the tuple of field values for each IP string,
+        or None for IPs that are invalid or in no range. Uses
+        findRangesSorted(), so is fastest for ascending IPs.
+        Consecutive IPs in the same range share one tuple.
+        
+        Reserved addresses yield their ReservedAddress. They
+        are found SORTED_BATCH_SIZE IPs at a time by reservedMask(),
+        and skipped by the search.
+        '''
+        ipStrs = iter(ipStrs)
+        lastRangeIdx = IpRangeTable.NOT_FOUND
+        lastValues = None
+        batch = list(itertools.islice(ipStrs, IpRangeTable.SORTED_BATCH_SIZE))
+        while batch:
+            ipNums = [self.ipStrToInt(ipStr) for ipStr in batch]
+            categories = reservedMask(ipNums)
+            rangeIdxs = self.findRangesSorted(None if category != PUBLIC else ipNum
+                                              for (ipNum, category) in zip(ipNums, categories))
+            for (rangeIdx, category) in zip(rangeIdxs, categories):
+                if category != PUBLIC:
+                    yield self.reservedResults[category]
+                    continue
+                if rangeIdx != lastRangeIdx:
+                    lastRangeIdx = rangeIdx
+                    lastValues = None if rangeIdx == IpRangeTable.NOT_FOUND else self.values(rangeIdx)
+                yield lastValues
+            batch = list(itertools.islice(ipStrs, IpRangeTable.SORTED_BATCH_SIZE))
+
+    #--------------------------
+    # value 
+    #----------------
+
+    def value(self, rangeIdx, fieldName):
+        '''
+        Return the value of the given field of the
+        range with index rangeIdx.
+        '''
+        fieldValue = self.columns[fieldName][rangeIdx]
+        try:
+            return self.pools[fieldName][fieldValue]
+        except KeyError:
+            return fieldValue
+
+    #--------------------------
+    # values 
+    #----------------
+
+    def values(self, rangeIdx):
+        '''
+        Return the tuple of all field values of the 
+        range with index rangeIdx.
+        '''
+        return tuple(self.value(rangeIdx, fieldName) for fieldName in self.fieldNames)
+
+    #--------------------------
+    # gather 
+    #----------------
+
+    def gather(self, fieldName, rangeIdxs):
+        '''
+        Return a numpy array with the column entry of the given
+        field for each range index in the numpy array rangeIdxs: 
+        pool positions for string fields, values for float fields.
+        The column is taken straight from the table's array
+        memory. NOT_FOUND indexes get the entry of range 0;
+        callers mask them.
+        '''
+        import numpy
+        column = self.columns[fieldName]
+        return numpy.frombuffer(column, dtype=column.typecode).take(rangeIdxs, mode='clip')
+
+    #--------------------------
+    # locationIndex 
+    #----------------
+
+    def locationIndex(self, keyFields):
+        '''
+        Return the IpLocationIndex of this table for the
+        given location fields. It is built on the first
+        call for each keyFields.
+        '''
+        keyFields = tuple(keyFields)
+        try:
+            return self.locationIndexes[keyFields]
+        except KeyError:
+            index = self.locationIndexes[keyFields] = IpLocationIndex(self, keyFields)
+            return index
+
+    #--------------------------
+    # writeLookups 
+    #----------------
+
+    def writeLookups(self, ipStrs, outPath):
+        '''
+        Look up each IP string, and write one row per IP to 
+        outPath: the IP string, followed by one column per field.
+        Files ending in PARQUET_EXTENSIONS are written as Parquet,
+        others as Arrow IPC files. 
+        
+        String fields are written as dictionary encoded columns
+        whose dictionary is the field's pool, converted once, and
+        whose indices are gathered from the table's columns by 
+        numpy (see gather()); Arrow wraps the gathered buffers 
+        without copying them again. Float fields are
+        float64 columns. IPs that are invalid, or in no range, 
+        have null fields. 
+        
+        A final, dictionary encoded 'reserved' column holds the 
+        category of reserved addresses, such as 'private' (see 
+        ipReservedRanges), and null for others. Reserved addresses
+        are not searched, and have null fields. The IPs are processed ARROW_BATCH_SIZE
+        at a time, each batch becoming one record batch.
+        
+        @param ipStrs: IP strings like '171.64.65.66'
+        @type ipStrs: iterable
+        @param outPath: file to write
+        @type outPath: str
+        @raise ImportError: if pyarrow is not installed.
+        '''
+        try:
+            import numpy
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("Writing %s requires the pyarrow package." % outPath)
+        
+        dictionaries = dict((fieldName, pyarrow.array(pool, pyarrow.string()))
+                            for (fieldName, pool) in self.pools.items())
+        schema = pyarrow.schema([pyarrow.field('ip', pyarrow.string())] +\
+                                [pyarrow.field(fieldName, 
+                                               pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+                                               if fieldName in self.pools else pyarrow.float64())
+                                 for fieldName in self.fieldNames] +\
+                                [pyarrow.field('reserved', pyarrow.dictionary(pyarrow.int8(), pyarrow.string()))])
+        categoryDictionary = pyarrow.array(CATEGORIES, pyarrow.string())
+        isParquet = os.path.splitext(outPath)[1].lower() in IpRangeTable.PARQUET_EXTENSIONS
+        if isParquet:
+            writer = pyarrow.parquet.ParquetWriter(outPath, schema)
+        else:
+            writer = pyarrow.RecordBatchFileWriter(outPath, schema)
+        try:
+            ipStrs = iter(ipStrs)
+            batchIpStrs = list(itertools.islice(ipStrs, IpRangeTable.ARROW_BATCH_SIZE))
+            while batchIpStrs:
+                ipNums = [self.ipStrToInt(ipStr) for ipStr in batchIpStrs]
+                categories = reservedMask(ipNums)
+                rangeIdxs = self.findRanges(None if category != PUBLIC else ipNum
+                                            for (ipNum, category) in zip(ipNums, categories))
+                rangeIdxs = numpy.frombuffer(rangeIdxs, dtype=rangeIdxs.typecode)
+                notFound  = rangeIdxs < 0
+                notReserved = numpy.frombuffer(categories, dtype=numpy.uint8) == PUBLIC
+                arrowColumns = [pyarrow.array(batchIpStrs, pyarrow.string())]
+                for fieldName in self.fieldNames:
+                    # Arrow takes over the gathered numpy buffer:
+                    gathered = self.gather(fieldName, rangeIdxs)
+                    if fieldName in self.pools:
+                        values = pyarrow.DictionaryArray.from_arrays(gathered, dictionaries[fieldName], 
+                                                                     mask=notFound)
+                    else:
+                        values = pyarrow.array(gathered, mask=notFound)
+                    arrowColumns.append(values)
+                reservedIds = pyarrow.array(numpy.frombuffer(categories, dtype=numpy.int8), mask=notReserved)
+                arrowColumns.append(pyarrow.DictionaryArray.from_arrays(reservedIds, categoryDictionary))
+                batch = pyarrow.RecordBatch.from_arrays(arrowColumns, schema=schema)
+                if isParquet:
+                    writer.write_table(pyarrow.Table.from_batches([batch], schema))
+                else:
+                    writer.write_batch(batch)
+                batchIpStrs = list(itertools.islice(ipStrs, IpRangeTable.ARROW_BATCH_SIZE))
+        finally:
+            writer.close()
+
+    #--------------------------
+    # ipStrToInt 
+    #----------------
+
+    @staticmethod
+    def ipStrToInt(ipStr):
+        '''
+        Return the int of an IP string like '171.64.65.66',
+        or None if ipStr is not a valid IPv4 address.
+        '''
+        try:
+            (oct0,oct1,oct2,oct3) = [int(octet) for octet in ipStr.split('.')]
+        except (ValueError, AttributeError):
+            return None
+        if not (0 <= oct0 <= 255 and 0 <= oct1 <= 255 and 0 <= oct2 <= 255 and 0 <= oct3 <= 255):
+            return None
+        return (oct0 << 24) + (oct1 << 16) + (oct2 << 8) + oct3
+
+    #--------------------------
+    # __len__ 
+    #----------------
+
+    def __len__(self):
+        return len(self.starts)
@@ -0,0 +1,208 @@
+# Copyright (c) 2014, Stanford University
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+Created on Oct 18, 2026
+
+Classification of reserved IPv4 addresses (RFC 6890):
+private networks, CGNAT space, loopback, multicast, and
+the other special-purpose blocks that are assigned to 
+no country. The lookup classes answer such addresses 
+before they search their tables.
+
+@author: paepcke
+'''
+from array import array
+
+
+# Special-purpose blocks, and their category. No block
+# is longer than /24:
+RESERVED_BLOCKS = [('0.0.0.0/8',       'this-network'),
+                   ('10.0.0.0/8',      'private'),
+                   ('100.64.0.0/10',   'shared'),         # CGNAT, RFC 6598
+                   ('127.0.0.0/8',     'loopback'),
+                   ('169.254.0.0/16',  'link-local'),
+                   ('172.16.0.0/12',   'private'),
+                   ('192.0.0.0/24',    'ietf-protocol'),
+                   ('192.0.2.0/24',    'documentation'),
+                   ('192.88.99.0/24',  '6to4-relay'),
+                   ('192.168.0.0/16',  'private'),
+                   ('198.18.0.0/15',   'benchmarking'),
+                   ('198.51.100.0/24', 'documentation'),
+                   ('203.0.113.0/24',  'documentation'),
+                   ('224.0.0.0/4',     'multicast'),
+                   ('240.0.0.0/4',     'reserved')        # Includes 255.255.255.255
+                   ]
+
+# Category ids are positions in this list; 0 is 
+# any address that is not reserved:
+CATEGORIES = ['public', 'this-network', 'private', 'shared', 'loopback', 'link-local',
+              'ietf-protocol', 'documentation', '6to4-relay', 'benchmarking', 
+              'multicast', 'reserved']
+PUBLIC = 0
+
+MAX_IP = 0xffffffff
+
+# Categories of internal traffic:
+PRIVATE_CATEGORIES = ('private', 'shared')
+
+# Marks /16 blocks that are only partly reserved:
+MIXED = 255
+
+class ReservedAddress(tuple):
+    '''
+    Lookup result for a reserved address. Unpacks and 
+    compares like the lookup class's own result tuples,
+    and holds the address's category. Given the field 
+    names, fields can also be read by name, as from an
+    IpLookupRecord: reserved.country.
+    '''
+    
+    def __new__(cls, fields, category, fieldNames=()):
+        result = tuple.__new__(cls, fields)
+        result.category = category
+        result.fieldNames = tuple(fieldNames)
+        return result
+    
+    def __getnewargs__(self):
+        # Pickling and copying rebuild the tuple through __new__:
+        return (tuple(self), self.category, self.fieldNames)
+    
+    def __getattr__(self, name):
+        try:
+            return self[self.__dict__.get('fieldNames', ()).index(name)]
+        except ValueError:
+            raise AttributeError(name)
+    
+    @property
+    def isPrivate(self):
+        return self.category in PRIVATE_CATEGORIES
+
+    def __repr__(self):
+        return 'ReservedAddress(%s, %s)' % (tuple.__repr__(self), self.category)
+
+#--------------------------
+# buildTables 
+#----------------
+
+def buildTables():
+    '''
+    Return the category id of each /16 block as a 
+    bytearray, with MIXED for partly reserved blocks, and
+    {/24 block number : category id} for the reserved
+    /24 blocks of the MIXED /16 blocks.
+    '''
+    block16Categories = bytearray(1 << 16)
+    block24Categories = {}
+    blocks = []
+    for (cidr, category) in RESERVED_BLOCKS:
+        (address, prefixLength) = cidr.split('/')
+        octets = [int(octet) for octet in address.split('.')]
+        start = (octets[0] << 24) + (octets[1] << 16) + (octets[2] << 8) + octets[3]
+        blocks.append((int(prefixLength), start, CATEGORIES.index(category)))
+    # Longer prefixes override the blocks they lie in:
+    for (prefixLength, start, categoryId) in sorted(blocks):
+        if prefixLength <= 16:
+            for block16 in range(start >> 16, (start >> 16) + (1 << (16 - prefixLength))):
+                block16Categories[block16] = categoryId
+            continue
+        block16 = start >> 16
+        if block16Categories[block16] != MIXED:
+            if block16Categories[block16] != PUBLIC:
+                for block24 in range(block16 << 8, (block16 + 1) << 8):
+                    block24Categories[block24] = block16Categories[block16]
+            block16Categories[block16] = MIXED
+        for block24 in range(start >> 8, (start >> 8) + (1 << (24 - prefixLength))):
+            block24Categories[block24] = categoryId
+    return (block16Categories, block24Categories)
+
+(BLOCK16_CATEGORIES, BLOCK24_CATEGORIES) = buildTables()
+
+# BLOCK24_CATEGORIES as sorted numpy arrays of the /24 
+# block numbers and their category ids; built on the 
+# first reservedMask() call with a numpy array:
+block24Arrays = None
+
+#--------------------------
+# categoryId 
+#----------------
+
+def categoryId(ipNum):
+    '''
+    Return the category id of an IP int, PUBLIC for 
+    addresses that are not reserved. Takes two table
+    lookups at most.
+    '''
+    category = BLOCK16_CATEGORIES[ipNum >> 16]
+    if category == MIXED:
+        return BLOCK24_CATEGORIES.get(ipNum >> 8, PUBLIC)
+    return category
+
+#--------------------------
+# reservedCategory 
+#----------------
+
+def reservedCategory(ipNum):
+    '''
+    Return the category of a reserved IP int, such as
+    'private' or 'loopback', or None for other addresses.
+    '''
+    category = categoryId(ipNum)
+    return None if category == PUBLIC else CATEGORIES[category]
+
+#--------------------------
+# reservedMask 
+#----------------
+
+def reservedMask(ipNums):
+    '''
+    Return the category id of each IP int in ipNums; 
+    PUBLIC for other addresses, and for None. ipNums
+    may be a numpy array of ints, of any int dtype, which
+    is classified with array operations, and gives a numpy
+    array of uint8. The /24 blocks of partly reserved /16 
+    blocks are then found by one binary search over all
+    of them. Otherwise the result is an array('B').
+    '''
+    if hasattr(ipNums, 'dtype'):
+        global block24Arrays
+        import numpy
+        # Signed arrays hold addresses from 128.0.0.0 up 
+        # as negative numbers:
+        ipNums = ipNums.astype(numpy.uint32, copy=False)
+        categories = numpy.frombuffer(BLOCK16_CATEGORIES, dtype=numpy.uint8)[ipNums >> 16]
+        mixed = numpy.flatnonzero(categories == MIXED)
+        if len(mixed) == 0:
+            return categories
+        if block24Arrays is None:
+            block24s = sorted(BLOCK24_CATEGORIES)
+            block24Arrays = (numpy.array(block24s, dtype=numpy.uint32),
+                             numpy.array([BLOCK24_CATEGORIES[block24] for block24 in block24s], dtype=numpy.uint8))
+        (block24s, block24Categories) = block24Arrays
+        mixedBlocks = ipNums[mixed] >> 8
+        positions = numpy.searchsorted(block24s, mixedBlocks).clip(0, len(block24s) - 1)
+        categories[mixed] = numpy.where(block24s[positions] == mixedBlocks, 
+                                        block24Categories[positions], 
+                                        PUBLIC)
+        return categories
+    return array('B', (PUBLIC if ipNum is None else categoryId(ipNum) for ipNum in ipNums))
+
+#--------------------------
+# reservedResults 
+#----------------
+
+def reservedResults(fields, fieldNames=()):
+    '''
+    Return the lookup results of a lookup class for the
+    reserved categories, by category id: a ReservedAddress
+    with the given fields for each reserved category, and
+    None for PUBLIC. 
+    '''
+    return [None] + [ReservedAddress(fields, category, fieldNames) for category in CATEGORIES[1:]]
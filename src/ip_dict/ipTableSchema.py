@@ -0,0 +1,163 @@
+# Copyright (c) 2014, Stanford University
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+Created on Oct 18, 2026
+
+Declarative column layouts of the IP tables that the
+ip_dict lookup classes load: software77's IP-to-country
+table, and the IP2Location DB3 and DB15 tables. A new
+table variant only needs a new IpTableSchema.
+
+@author: paepcke
+'''
+import csv
+
+from compressed_files import open_file
+
+# Source of the line parsers that IpTableSchema compiles:
+PARSER_TEMPLATE = '''
+def parseLine(line):
+    line = line.rstrip('\\r\\n')
+    if len(line) > 1 and line[0] == '"' and line[-1] == '"' and '""' not in line:
+        # Columns after the last kept one stay in one piece:
+        fields = line[1:-1].split('","', numSplit)
+        numFields = len(fields)%(countTail)s
+    else:
+        fields = csvRows([line]).next()
+        numFields = len(fields)
+    if numFields != numColumns:
+        raise ValueError("Line has %%d column(s); needs %%d." %% (numFields, numColumns))
+    return (%(keptValues)s,)
+'''
+
+class IpTableSchema(object):
+    '''
+    Names, types, and keep flags of the columns of an IP table 
+    CSV file. readRows() generates one tuple of the kept values
+    per line.
+    
+    Lines are parsed by a routine that is compiled from the
+    schema once: lines whose fields are all quoted, as in the
+    software77 and IP2Location tables, are split at '","', 
+    but only up to the last kept column; the columns after 
+    it are counted, not split off. Only the kept pieces are
+    picked, and only int and float columns are converted. 
+    Lines with empty fields or escaped quotes (""), and lines
+    that are not quoted throughout, go through the csv module
+    instead. Lines with more or fewer 
+    columns than the schema are rejected.
+    '''
+
+    def __init__(self, columns):
+        '''
+        @param columns: (name, type, keep) of each column in 
+            file order. Type is one of int, float, str.
+        @type columns: [(str, type, bool)]
+        @raise ValueError: if fewer than two columns are kept.
+        '''
+        self.columns = list(columns)
+        keptPositions = [pos for (pos, (_, _, keep)) in enumerate(self.columns) if keep]
+        if len(keptPositions) < 2:
+            raise ValueError("IP table schema must keep at least two columns.")
+        self.fieldNames = [self.columns[pos][0] for pos in keptPositions]
+        self.parseLine  = self.compileParser(len(self.columns), 
+                                             keptPositions, 
+                                             [self.columns[pos][1] for pos in keptPositions])
+
+    #--------------------------
+    # readRows 
+    #----------------
+
+    def readRows(self, ipTablePath):
+        '''
+        Generate the tuple of kept values of each line of an 
+        IP table, which may be gzip- or zstd-compressed (see
+        compressed_files). Empty lines and lines starting with
+        '#' are skipped; lines with the wrong number of columns,
+        or with values of the wrong type, are reported and skipped.
+        
+        @param ipTablePath: IP table CSV file
+        @type ipTablePath: str
+        '''
+        parseLine = self.parseLine
+        with open_file(ipTablePath, 'r') as fd:
+            for line in fd:
+                if line[0] == '#' or line.isspace():
+                    continue
+                try:
+                    row = parseLine(line)
+                except ValueError as e:
+                    print("Irregularity in IP db line '%s': %s" % (line.rstrip(), `e`))
+                    continue
+                yield row
+
+    #--------------------------
+    # compileParser 
+    #----------------
+
+    @staticmethod
+    def compileParser(numColumns, keptPositions, keptTypes):
+        '''
+        Return a function that turns one line into the
+        tuple of kept values. Like namedtuple, the function
+        is generated as source code, so that it builds the
+        tuple in one expression, and calls converters only
+        for int and float columns.
+        '''
+        namespace = {'csvRows'     : csv.reader, 
+                     'numColumns'  : numColumns,
+                     'numSplit'    : keptPositions[-1] + 1}
+        keptExprs = []
+        for (pos, colType) in zip(keptPositions, keptTypes):
+            if colType is str:
+                keptExprs.append('fields[%d]' % pos)
+            else:
+                namespace['convert%d' % pos] = colType
+                keptExprs.append('convert%d(fields[%d])' % (pos, pos))
+        # Count the columns in the unsplit piece, if any:
+        if keptPositions[-1] < numColumns - 1:
+            countTail = ''' + fields[-1].count('","')'''
+        else:
+            countTail = ''
+        source = PARSER_TEMPLATE % {'keptValues' : ', '.join(keptExprs), 
+                                    'countTail'  : countTail}
+        exec source in namespace
+        return namespace['parseLine']
+
+# software77.net IP-to-country table:
+SOFTWARE77_SCHEMA = IpTableSchema([('startIP', int, True),
+                                   ('endIP', int, True),
+                                   ('registry', str, False),
+                                   ('assigned', str, False),
+                                   ('twoLetterCountry', str, True),
+                                   ('threeLetterCountry', str, True),
+                                   ('country', str, True)
+                                   ])
+
+DB3_COLUMNS = [('startIP', int, True),
+               ('endIP', int, True),
+               ('twoLetterCountry', str, True),
+               ('country', str, True),
+               ('region', str, True),
+               ('city', str, True)
+               ]
+
+# IP2Location DB3 table, IP-COUNTRY-REGION-CITY:
+DB3_SCHEMA = IpTableSchema(DB3_COLUMNS)
+
+# IP2Location DB15 table, IP-COUNTRY-REGION-CITY-LATITUDE-LONGITUDE-ZIPCODE-TIMEZONE-AREACODE:
+DB15_SCHEMA = IpTableSchema(DB3_COLUMNS + [('latitude', float, True),
+                                           ('longitude', float, True),
+                                           ('zipcode', str, True),
+                                           ('timezone', str, True),
+                                           ('countryPhoneCode', str, True),
+                                           ('areaCode', str, True)
+                                           ])
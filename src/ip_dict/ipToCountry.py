@@ -27,10 +27,13 @@ The underlying IP->Country information comes from http://software77.net/geo-ip/
 @author: paepcke
 '''
 import os
-import unittest
 
+from ipCountryFilter import IpCountryFilter
+from ipRangeTable import IpRangeTable
+from ipReservedRanges import MAX_IP, categoryId, reservedResults
+from ipTableSchema import SOFTWARE77_SCHEMA
 
-class IpCountryDict(unittest.TestCase):
+class IpCountryDict(object):
     '''
     Implements lookup mapping IP to country.
     '''
@@ -39,12 +42,25 @@ class IpCountryDict(unittest.TestCase):
     TWO_LETTER_POS = 2
     THREE_LETTER_POS = 3
     COUNTRY_POS = 4
+    
+    # Names of the fields after the start and end IP,
+    # as columns of the range table:
+    FIELD_NAMES = ['twoLetterCountry', 'threeLetterCountry', 'country']
+    
+    # lookupIP() result for IPs in no range:
+    UNKNOWN_COUNTRY = ('ZZ','ZZZ','unknown')
+    
+    # lookupIP() result for reserved addresses, as a
+    # ReservedAddress per category (see ipReservedRanges):
+    RESERVED_FIELDS = ('ZZ','ZZZ','Reserved')
+    RESERVED_RESULTS = reservedResults(RESERVED_FIELDS, FIELD_NAMES)
 
-    def __init__(self, ipTablePath=None):
+    def __init__(self, ipTablePath=None, schema=SOFTWARE77_SCHEMA):
         '''
         Create an in-memory dict for quickly looking up IP addresses.
         The underlying IP->Country information comes from http://software77.net/geo-ip/
-        If an unzipped table from their Web site is not passed in, then 
+        The table may be gzip- or zstd-compressed (see compressed_files).
+        If a table from their Web site is not passed in, then 
         the table is expected to reside in subdirectory 'data' of this script's directory
         under the name ipToCountrySoftware77DotNet.csv. Their table contains
         columns for (decimal)startRange, endRange, assigning agency, assignment
@@ -60,30 +76,32 @@ class IpCountryDict(unittest.TestCase):
         
         We also construct a simpler dict that maps a country's three-letter
         code to a tuple: (two-letter code, three-letter code, full country name).
+        
+        Tables of other layouts can be read by passing a schema 
+        (see ipTableSchema) that keeps the start IP, the end IP, and
+        the columns of FIELD_NAMES, in this order.
         '''
+        if schema.fieldNames[2:] != IpCountryDict.FIELD_NAMES:
+            raise ValueError("Schema must keep columns %s after the IPs." % IpCountryDict.FIELD_NAMES)
         currKey = 0
         self.ipDict = {currKey : []}
         self.threeLetterKeyedDict = {}
+        # Built on first use by rangeTable():
+        self.ipRangeTable = None
+        # Built on first use by countryFilter(): 
+        # {frozenset of two-letter codes : IpCountryFilter}
+        self.countryFilters = {}
         if ipTablePath is None:
             tableSubPath = os.path.join('data/', 'ipToCountrySoftware77DotNet.csv')
             ipTablePath = os.path.join(os.path.dirname(__file__), tableSubPath)
-        with open(ipTablePath, 'r') as fd:
-            for line in fd:
-                if line[0] == '#':
-                    continue
-                (startIPStr,endIPStr,auth,assigned,twoLetterCountry,threeLetterCountry,country) = line.strip().split(',')  # @UnusedVariable
-                # Use first four digits of start ip as hash key:
-                hashKey = startIPStr.strip('"').zfill(10)[0:4]
-                if hashKey != currKey:
-                    self.ipDict[hashKey] = []
-                    currKey = hashKey
-                self.ipDict[hashKey].append((int(startIPStr.strip('"')), 
-                                                       int(endIPStr.strip('"')), 
-                                                       twoLetterCountry.strip('"'), 
-                                                       threeLetterCountry.strip('"'), 
-                                                       country.strip('"'))
-                                                    )
-                self.threeLetterKeyedDict[threeLetterCountry.strip('"')] = (twoLetterCountry.strip('"'), threeLetterCountry.strip('"'), country.strip('"'))
+        for (startIP,endIP,twoLetterCountry,threeLetterCountry,country) in schema.readRows(ipTablePath):
+            # Use first four digits of start ip as hash key:
+            hashKey = str(startIP).zfill(10)[0:4]
+            if hashKey != currKey:
+                self.ipDict[hashKey] = []
+                currKey = hashKey
+            self.ipDict[hashKey].append((startIP, endIP, twoLetterCountry, threeLetterCountry, country))
+            self.threeLetterKeyedDict[threeLetterCountry] = (twoLetterCountry, threeLetterCountry, country)
 
     def get(self, ipStr, default=None):
         '''
@@ -106,11 +124,137 @@ class IpCountryDict(unittest.TestCase):
     def getBy3LetterCode(self, threeLetterCode):
         return self.threeLetterKeyedDict[threeLetterCode]
 
+    def lookupSortedIPs(self, ipStrs):
+        '''
+        Generate the lookupIP() result of each IP string. Meant 
+        for IPs in ascending order, which are merged with the 
+        sorted ranges rather than searched one by one. Unsorted
+        input is handled correctly, but more slowly. See
+        IpRangeTable.findRangesSorted(). Invalid IPs, and IPs 
+        in no range, yield UNKNOWN_COUNTRY.
+        :param ipStrs: IP strings, preferably in ascending order
+        :type ipStrs: iterable
+        :return: generator of (2-letter code, 3-letter code, country)
+        '''
+        for result in self.rangeTable().lookupSorted(ipStrs):
+            yield IpCountryDict.UNKNOWN_COUNTRY if result is None else result
+
+    def rangeTable(self):
+        '''
+        Return the column-wise copy of all ranges, which 
+        is built on the first call.
+        :rtype: IpRangeTable
+        '''
+        if self.ipRangeTable is None:
+            self.ipRangeTable = IpRangeTable.fromIpDict(self.ipDict, IpCountryDict.FIELD_NAMES, 
+                                                        reservedFields=IpCountryDict.RESERVED_FIELDS)
+        return self.ipRangeTable
+
+    def rangesIn(self, twoLetterCountry):
+        '''
+        Return the (startIP, endIP) tuples of all ranges of a
+        country in ascending order; empty for unknown countries.
+        Uses a precomputed index, so takes time proportional
+        to the number of ranges returned.
+        :param twoLetterCountry: two-letter country code
+        :type twoLetterCountry: str
+        :rtype: [(int,int)]
+        '''
+        return self.rangeTable().locationIndex(('twoLetterCountry',)).rangesOf((twoLetterCountry,))
+
+    def addressCountIn(self, twoLetterCountry):
+        '''
+        Return the number of IP addresses of a country; 
+        0 for unknown countries. Takes constant time.
+        '''
+        return self.rangeTable().locationIndex(('twoLetterCountry',)).addressCountOf((twoLetterCountry,))
+
+    def coverageIn(self, twoLetterCountry):
+        '''
+        Return the fraction of all addresses in the table 
+        that belong to a country.
+        '''
+        return self.rangeTable().locationIndex(('twoLetterCountry',)).coverageOf((twoLetterCountry,))
+
+    def countryFilter(self, twoLetterCountries):
+        '''
+        Return a filter that tells whether IPs are in any of 
+        the given countries, without lookups. Filters are
+        built once per set of countries, and then reused.
+        
+            euFilter = lookup.countryFilter(['DE', 'FR', 'IT'])
+            euFilter.contains(ipNum)
+            euFilter.membershipMask(ipNums)
+        
+        :param twoLetterCountries: two-letter country codes
+        :type twoLetterCountries: iterable
+        :rtype: IpCountryFilter
+        '''
+        countrySet = frozenset(twoLetterCountries)
+        try:
+            return self.countryFilters[countrySet]
+        except KeyError:
+            pass
+        index = self.rangeTable().locationIndex(('twoLetterCountry',))
+        countryFilter = IpCountryFilter(ipRange for twoLetterCountry in countrySet
+                                        for ipRange in index.rangesOf((twoLetterCountry,)))
+        self.countryFilters[countrySet] = countryFilter
+        return countryFilter
+
+    def isInCountries(self, ipStr, twoLetterCountries):
+        '''
+        Return True if the IP is in one of the given countries.
+        See countryFilter().
+        :param ipStr: string of an IP address
+        :type ipStr: string
+        :param twoLetterCountries: two-letter country codes
+        :type twoLetterCountries: iterable
+        :rtype: bool
+        :raise ValueError: when given IP address is not valid
+        '''
+        ipNum = IpRangeTable.ipStrToInt(ipStr)
+        if ipNum is None:
+            raise ValueError("IP string is not a valid IP address: '%s'" % str(ipStr))
+        return self.countryFilter(twoLetterCountries).contains(ipNum)
+
+    def countByCountry(self, ips, processes=1):
+        '''
+        Count IPs by country, without building a lookup 
+        result per IP. Return {twoLetterCountry : count}.
+        Invalid IPs and IPs in no range are counted under
+        None, reserved addresses under their category, such
+        as 'private'. See IpLocationIndex.countIPs().
+        :param ips: IP strings, or IPs as ints
+        :type ips: iterable
+        :param processes: number of worker processes
+        :type processes: int
+        :rtype: {str : int}
+        '''
+        index = self.rangeTable().locationIndex(('twoLetterCountry',))
+        return dict((location[0] if isinstance(location, tuple) else location, count)
+                    for (location, count) in index.decodeCounts(index.countIPs(ips, processes)).items())
+
+    def lookupRecord(self, ipStr):
+        '''
+        Same as lookupIP(), but returns a compact IpLookupRecord
+        that decodes the fields of FIELD_NAMES only when they
+        are read, like record.threeLetterCountry. Records unpack like 
+        the tuples of lookupIP(). See IpRangeTable.lookupRecord().
+        :param ipStr: string of an IP address
+        :type ipStr: string
+        :rtype: IpLookupRecord
+        :raise ValueError: when given IP address is not valid
+        :raise KeyError: when the IP is in no range. 
+        '''
+        return self.rangeTable().lookupRecord(ipStr)
+
     def lookupIP(self,ipStr):
         '''
         Top level lookup: pass an IP string, get a
         triplet: two-letter country code, three-letter country code,
-        and full country.
+        and full country. Reserved addresses, such as private 
+        networks, give a ReservedAddress of RESERVED_FIELDS 
+        without a table search.
         :param ipStr: string of an IP address
         :type ipStr: string
         :return: 2-letter country code, 3-letter country code, and country string
@@ -119,8 +263,13 @@ class IpCountryDict(unittest.TestCase):
         :raise KeyError: when the country for the given IP is not found. 
         '''
         (ipNum, lookupKey) = self.ipStrToIntAndKey(ipStr)
-        if ipNum is None or lookupKey is None:
+        if ipNum is None or lookupKey is None or not 0 <= ipNum <= MAX_IP:
             raise ValueError("IP string is not a valid IP address: '%s'" % str(ipStr))
+        # Private, loopback, and other reserved addresses
+        # are in no country, and need no search:
+        reserved = IpCountryDict.RESERVED_RESULTS[categoryId(ipNum)]
+        if reserved is not None:
+            return reserved
         while lookupKey > 0:
             try:
                 ipRangeChain = self.ipDict[lookupKey]
@@ -145,7 +294,7 @@ class IpCountryDict(unittest.TestCase):
                    ipInfo[IpCountryDict.COUNTRY_POS])
         # If we get here, the IP is in a range in which
         # the IP-->Country table has a hole:
-        return('ZZ','ZZZ','unknown')
+        return IpCountryDict.UNKNOWN_COUNTRY
         
         
             
@@ -18,7 +18,10 @@ Creates table EdxPrivate.UserDetailedLocation  with each anon_screen_name's thre
 '''
 import argparse
 import getpass
+import json
+import multiprocessing
 import os
+import Queue
 import sys
 import datetime
 
@@ -41,15 +44,95 @@ class UserDetailedLocationTableCreator(object):
     INSERT_BULK_SIZE = 15000
     
     IP_LOOKUP_TABLE = os.path.join(os.path.dirname(__file__), 'data/DB15-IP-COUNTRY-REGION-CITY-LATITUDE-LONGITUDE-ZIPCODE-TIMEZONE-AREACODE_CommercialLicense.CSV')
-    
-    def __init__(self, user, pwd):
-        self.ipCountryXlater = IpCountryDict()
+
+    # Local file in which fillTable() records the last
+    # anon_screen_name whose rows are committed to DEST_TABLE:
+    CHECKPOINT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                   'userDetailedLocation.checkpoint')
+
+    def __init__(self, user, pwd, 
+                 resume=False, 
+                 checkpointFile=None, 
+                 numShards=1, 
+                 shardNum=None,
+                 ipCountryXlater=None,
+                 progressQueue=None):
+        '''
+        Connect to MySQL, and prepare the destination table.
+
+        If resume is True, and a checkpoint from an earlier,
+        interrupted run exists, the destination table is left
+        in place, and fillTable() continues after the last
+        committed batch. Otherwise the table is recreated.
+
+        For a sharded build, the instance that is created with
+        numShards > 1, and shardNum None prepares the table, and
+        fillTableSharded() then starts one worker process per 
+        shard. Each worker constructs its own instance with its
+        shardNum, and thus has its own connection and checkpoint.
+        Workers never create or drop the table.
+
+        @param user: MySQL user
+        @type user: str
+        @param pwd: MySQL password
+        @type pwd: str
+        @param resume: whether to continue an interrupted run
+        @type resume: bool
+        @param checkpointFile: path to checkpoint state file. Default: CHECKPOINT_FILE
+        @type checkpointFile: {str | None}
+        @param numShards: number of partitions of the anon_screen_name space
+        @type numShards: int
+        @param shardNum: the partition this instance fills, or None
+        @type shardNum: {int | None}
+        @param ipCountryXlater: already loaded lookup table to use. Default: load a new one
+        @type ipCountryXlater: {IpCountryDict | None}
+        @param progressQueue: queue to which a shard worker reports its progress
+        @type progressQueue: {multiprocessing.Queue | None}
+        '''
+        if ipCountryXlater is None:
+            ipCountryXlater = IpCountryDict()
+        self.ipCountryXlater = ipCountryXlater
         self.user = user
         self.pwd  = pwd
+        self.numShards = numShards
+        self.shardNum  = shardNum
+        self.progressQueue = progressQueue
+        if checkpointFile is None:
+            checkpointFile = UserDetailedLocationTableCreator.CHECKPOINT_FILE
+        self.baseCheckpointFile = checkpointFile
+        if shardNum is not None:
+            checkpointFile = self.shardCheckpointFile(shardNum)
+        self.checkpointFile = checkpointFile
         self.db = MySQLDB(user=self.user, passwd=self.pwd, db='Edx')
-        # Make sure table exists. It should, and it should be filled
-        # with all anon_screen_name and countries up the previous
-        # load:
+
+        if shardNum is not None:
+            # The table was prepared by the process that 
+            # started this shard:
+            self.checkpoint = self.readCheckpoint() if resume else None
+            if resume:
+                self.deleteUncommittedRows()
+            return
+
+        if numShards > 1:
+            self.checkpoint = None
+            self.resumeShards = resume and\
+                any(os.path.exists(self.shardCheckpointFile(shard)) for shard in range(numShards))
+            if self.resumeShards:
+                print("Resuming sharded build from shard checkpoints.")
+                return
+        else:
+            self.checkpoint = self.readCheckpoint() if resume else None
+            if self.checkpoint is not None:
+                print("Resuming after anon_screen_name '%s' (%s rows committed earlier)." %\
+                      (self.checkpoint['last_anon_screen_name'], self.checkpoint['rows_committed']))
+                self.deleteUncommittedRows()
+                return
+
+        # No earlier run to resume; start from an empty table.
+        # Any stale checkpoint would refer to the old table:
+        self.removeCheckpoint()
+        for shard in range(numShards):
+            self.removeCheckpoint(self.shardCheckpointFile(shard))
         createCmd = '''CREATE TABLE %s (
                          anon_screen_name varchar(40) NOT NULL DEFAULT "",
                          two_letter_country varchar(2) NOT NULL DEFAULT "",
@@ -60,28 +143,70 @@ class UserDetailedLocationTableCreator(object):
                          lat_long point NOT NULL
                          ) ENGINE=MyISAM;
                          ''' % UserDetailedLocationTableCreator.DEST_TABLE
-        self.db.dropTable('UserCountry')
-        print("Creating table %..." % UserDetailedLocationTableCreator.DEST_TABLE)
+        self.db.dropTable(UserDetailedLocationTableCreator.DEST_TABLE)
+        print("Creating table %s..." % UserDetailedLocationTableCreator.DEST_TABLE)
         self.db.execute(createCmd)
         print("Done creating table %s." % UserDetailedLocationTableCreator.DEST_TABLE)
         
     def fillTable(self):
-        query = "SELECT DISTINCT anon_screen_name FROM EventXtract"
+        '''
+        Look up the country of every learner, and insert the
+        results in batches of INSERT_BULK_SIZE rows. Learners are
+        processed in anon_screen_name order, and a batch never
+        splits one learner's rows. After each batch is inserted,
+        the batch's last anon_screen_name is written to the checkpoint
+        file, so an interrupted run can be continued via the
+        resume option. The checkpoint is removed when the table
+        is complete. A shard worker instead marks its checkpoint
+        as done, and leaves removal to fillTableSharded().
+        '''
+        conditions = []
+        if self.shardNum is not None:
+            conditions.append(self.shardCondition())
+        if self.checkpoint is None:
+            lastKey = None
+            rowsCommitted = 0
+        else:
+            if self.checkpoint.get('done', False):
+                # This shard was completed by the earlier run:
+                self.reportProgress('done', 0, self.checkpoint['rows_committed'])
+                return
+            lastKey = self.checkpoint['last_anon_screen_name']
+            rowsCommitted = self.checkpoint['rows_committed']
+            conditions.append("anon_screen_name > '%s'" % self.escape(lastKey))
+        query = "SELECT DISTINCT anon_screen_name, ip_country FROM EventXtract "
+        if len(conditions) > 0:
+            query += "WHERE %s " % ' AND '.join(conditions)
+        query += "ORDER BY anon_screen_name"
         query_res_it = self.db.query(query)
         done = False
         # Order of columns for insert:
-        colNameTuple = ('anon_screen_name','three_letter_country', 'country', )
+        colNameTuple = ('anon_screen_name', 'two_letter_country', 'three_letter_country', 'country')
+        # Row read ahead while looking for the end
+        # of the previous batch's last learner:
+        pendingRow = None
 
         while not done: 
             values = []
-            print("%s: Starting one set of %s lookups..." %\
-                  (str(datetime.datetime.today()), 
-                   UserCountryTableCreator.INSERT_BULK_SIZE))
-            for _ in range(UserCountryTableCreator.INSERT_BULK_SIZE):
-                try:
-                    (anon_screen_name, ip3LetterCountry) = query_res_it.next();
-                except StopIteration:
-                    done = True
+            if self.progressQueue is None:
+                print("%s: Starting one set of %s lookups..." %\
+                      (str(datetime.datetime.today()), 
+                       UserDetailedLocationTableCreator.INSERT_BULK_SIZE))
+            while True:
+                if pendingRow is not None:
+                    (anon_screen_name, ip3LetterCountry) = pendingRow
+                    pendingRow = None
+                else:
+                    try:
+                        (anon_screen_name, ip3LetterCountry) = query_res_it.next();
+                    except StopIteration:
+                        done = True
+                        break
+                if len(values) >= UserDetailedLocationTableCreator.INSERT_BULK_SIZE and\
+                   anon_screen_name != values[-1][0]:
+                    # Batch is full, and holds all rows of its last
+                    # learner; this row starts the next batch:
+                    pendingRow = (anon_screen_name, ip3LetterCountry)
                     break
                 # Try translating:
                 try:
@@ -93,18 +218,214 @@ class UserDetailedLocationTableCreator(object):
                     #sys.stderr.write("Could not look up one country from (%s/%s): %s\n" % (user, ip3LetterCountry,`e`))
                 values.append(tuple(['%s'%anon_screen_name,'%s'%twoLetterCode,'%s'%threeLetterCode,'%s'%country]))
 
-            # Insert this chunk into the UserCountry table
-            print("%s: Inserting %s rows into UserCountry table..." % (str(datetime.datetime.today()), len(values)))        
-            (errors, warnings) = self.db.bulkInsert(UserCountryTableCreator.DEST_TABLE, colNameTuple, values)
+            if len(values) == 0:
+                break
+
+            # Insert this chunk into the UserDetailedLocation table
+            if self.progressQueue is None:
+                print("%s: Inserting %s rows into %s table..." %\
+                      (str(datetime.datetime.today()), len(values), UserDetailedLocationTableCreator.DEST_TABLE))
+            (errors, warnings) = self.db.bulkInsert(UserDetailedLocationTableCreator.DEST_TABLE, colNameTuple, values)
             if errors is not None:
-                print('Error(s) during UserCountry insert: %s' % errors)
+                print('Error(s) during %s insert: %s' % (UserDetailedLocationTableCreator.DEST_TABLE, errors))
                 sys.exit(1)
             if warnings is not None:
-                print('Warning(s) during UserCountry insert: %s' % warnings)
-                
-            print("%s: Done inserting %s rows into UserCountry table..." % (str(datetime.datetime.today()), len(values)))                    
+                print('Warning(s) during %s insert: %s' % (UserDetailedLocationTableCreator.DEST_TABLE, warnings))
+
+            # The batch is in the table; remember how far we got:
+            lastKey = values[-1][0]
+            rowsCommitted += len(values)
+            self.writeCheckpoint(lastKey, rowsCommitted)
+            self.reportProgress('batch', len(values), rowsCommitted)
             # ... and loop to process the next INSERT_BULK_SIZE batch
 
+        if self.shardNum is None:
+            # Table is complete; a later run starts from scratch:
+            self.removeCheckpoint()
+        else:
+            self.writeCheckpoint(lastKey, rowsCommitted, done=True)
+            self.reportProgress('done', 0, rowsCommitted)
+
+    #--------------------------
+    # fillTableSharded 
+    #----------------
+
+    def fillTableSharded(self):
+        '''
+        Fill the table with numShards worker processes. Worker i
+        handles the learners for which MOD(CRC32(anon_screen_name), numShards)
+        is i, using its own MySQL connection and its own checkpoint
+        file. The workers are forked after the IP lookup table is
+        loaded, so they all share this process' copy of the table
+        rather than each loading one.
+
+        Workers report each committed batch through a queue; the
+        reports are merged here into one progress line. If any
+        worker fails, the shard checkpoints are left in place for
+        a later run with the resume option, and we exit with status 1.
+        '''
+        progressQueue = multiprocessing.Queue()
+        workers = []
+        for shard in range(self.numShards):
+            worker = multiprocessing.Process(target=fillShard,
+                                             args=(self.user,
+                                                   self.pwd,
+                                                   self.resumeShards,
+                                                   self.baseCheckpointFile,
+                                                   self.numShards,
+                                                   shard,
+                                                   self.ipCountryXlater,
+                                                   progressQueue))
+            worker.start()
+            workers.append(worker)
+
+        shardRows = [0] * self.numShards
+        shardsDone = set()
+        failedShards = set()
+        while len(shardsDone) + len(failedShards) < self.numShards:
+            try:
+                (event, shard, numRows, rowsCommitted) = progressQueue.get(timeout=10)
+            except Queue.Empty:
+                # Catch workers that died without reporting:
+                for shard, worker in enumerate(workers):
+                    if not worker.is_alive() and worker.exitcode != 0 and shard not in shardsDone:
+                        failedShards.add(shard)
+                continue
+            if event == 'error':
+                print("%s: Shard %s failed: %s" % (str(datetime.datetime.today()), shard, rowsCommitted))
+                failedShards.add(shard)
+                continue
+            shardRows[shard] = rowsCommitted
+            if event == 'done':
+                shardsDone.add(shard)
+                shardStatus = 'finished'
+            else:
+                shardStatus = 'inserted %s rows' % numRows
+            print("%s: Shard %s %s; %s rows in %s table; %s of %s shards done." %\
+                  (str(datetime.datetime.today()), shard, shardStatus, sum(shardRows),
+                   UserDetailedLocationTableCreator.DEST_TABLE, len(shardsDone), self.numShards))
+
+        for worker in workers:
+            worker.join()
+        if len(failedShards) > 0:
+            print("Shard(s) %s failed; rerun with the resume option to continue." % sorted(failedShards))
+            sys.exit(1)
+        for shard in range(self.numShards):
+            self.removeCheckpoint(self.shardCheckpointFile(shard))
+
+    #--------------------------
+    # shardCondition 
+    #----------------
+
+    def shardCondition(self):
+        return "MOD(CRC32(anon_screen_name), %s) = %s" % (self.numShards, self.shardNum)
+
+    #--------------------------
+    # shardCheckpointFile 
+    #----------------
+
+    def shardCheckpointFile(self, shardNum):
+        return '%s.shard%s' % (self.baseCheckpointFile, shardNum)
+
+    #--------------------------
+    # deleteUncommittedRows 
+    #----------------
+
+    def deleteUncommittedRows(self):
+        '''
+        Rows of a batch that was in flight when an earlier
+        run died sort after the checkpoint. Remove them so
+        they are not inserted twice. A shard without checkpoint
+        had not committed any batch, so all its rows are removed.
+        '''
+        if self.checkpoint is None:
+            lastKey = ''
+        elif self.checkpoint.get('done', False):
+            return
+        else:
+            lastKey = self.checkpoint['last_anon_screen_name']
+        deleteCmd = "DELETE FROM %s WHERE anon_screen_name > '%s'" %\
+                    (UserDetailedLocationTableCreator.DEST_TABLE, self.escape(lastKey))
+        if self.shardNum is not None:
+            deleteCmd += " AND %s" % self.shardCondition()
+        self.db.execute(deleteCmd + ';')
+
+    #--------------------------
+    # reportProgress 
+    #----------------
+
+    def reportProgress(self, event, numRows, rowsCommitted):
+        if self.progressQueue is not None:
+            self.progressQueue.put((event, self.shardNum, numRows, rowsCommitted))
+        elif event == 'batch':
+            print("%s: Done inserting %s rows into %s table (%s total)..." %\
+                  (str(datetime.datetime.today()), numRows, UserDetailedLocationTableCreator.DEST_TABLE, rowsCommitted))
+
+    #--------------------------
+    # readCheckpoint 
+    #----------------
+
+    def readCheckpoint(self):
+        '''
+        Return the checkpoint left by an earlier run as a dict
+        with keys 'last_anon_screen_name' and 'rows_committed',
+        or None if there is no checkpoint.
+        '''
+        try:
+            with open(self.checkpointFile, 'r') as fd:
+                return json.load(fd)
+        except IOError:
+            return None
+
+    #--------------------------
+    # writeCheckpoint 
+    #----------------
+
+    def writeCheckpoint(self, lastKey, rowsCommitted, done=False):
+        '''
+        Durably record that all rows up to and including
+        anon_screen_name lastKey are in the table. The state
+        is written to a temp file, flushed to disk, and then
+        renamed over the checkpoint file, so a crash leaves 
+        either the old or the new checkpoint, never a partial one.
+        Called once per INSERT_BULK_SIZE batch.
+
+        @param lastKey: anon_screen_name of last committed row
+        @type lastKey: str
+        @param rowsCommitted: number of rows inserted so far
+        @type rowsCommitted: int
+        @param done: whether all rows of this shard are in the table
+        @type done: bool
+        '''
+        tmpFile = self.checkpointFile + '.tmp'
+        with open(tmpFile, 'w') as fd:
+            json.dump({'last_anon_screen_name' : lastKey,
+                       'rows_committed' : rowsCommitted,
+                       'done' : done
+                       }, fd)
+            fd.flush()
+            os.fsync(fd.fileno())
+        os.rename(tmpFile, self.checkpointFile)
+
+    #--------------------------
+    # removeCheckpoint 
+    #----------------
+
+    def removeCheckpoint(self, checkpointFile=None):
+        if checkpointFile is None:
+            checkpointFile = self.checkpointFile
+        try:
+            os.remove(checkpointFile)
+        except OSError:
+            pass
+
+    #--------------------------
+    # escape 
+    #----------------
+
+    def escape(self, sqlStr):
+        return sqlStr.replace('\\', '\\\\').replace("'", "\\'")
+
     def makeIndex(self):
         self.db.execute("CALL createIndexIfNotExists('UserCountryAnonIdx', 'UserCountry', 'anon_screen_name', 40);")
         self.db.execute("CALL createIndexIfNotExists('UserCountryThreeLetIdx', 'UserCountry', 'three_letter_country', 3);")
@@ -112,6 +433,27 @@ class UserDetailedLocationTableCreator(object):
     def close(self):
         self.db.close()
 
+#--------------------------
+# fillShard 
+#----------------
+
+def fillShard(user, pwd, resume, checkpointFile, numShards, shardNum, ipCountryXlater, progressQueue):
+    '''
+    Body of one worker process of a sharded build.
+    '''
+    try:
+        shardCreator = UserDetailedLocationTableCreator(user, pwd,
+                                                        resume=resume,
+                                                        checkpointFile=checkpointFile,
+                                                        numShards=numShards,
+                                                        shardNum=shardNum,
+                                                        ipCountryXlater=ipCountryXlater,
+                                                        progressQueue=progressQueue)
+        shardCreator.fillTable()
+        shardCreator.close()
+    except (Exception, SystemExit) as e:
+        progressQueue.put(('error', shardNum, 0, `e`))
+
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(prog=os.path.basename(sys.argv[0]), 
                                      formatter_class=argparse.RawTextHelpFormatter,
@@ -125,6 +467,20 @@ if __name__ == '__main__':
                              '    default: content of scriptInvokingUser$Home/.ssh/mysql if --user is unspecified,\n' +\
                              '    or, if specified user is root, then the content of scriptInvokingUser$Home/.ssh/mysql_root.'
                         )
+    parser.add_argument('-r', '--resume',
+                        action='store_true',
+                        help='Continue an interrupted run from its last checkpoint, rather than\n' +\
+                             '    recreating the table. Without a checkpoint, a full run is done.'
+                        )
+    parser.add_argument('-c', '--checkpoint',
+                        action='store',
+                        help='Checkpoint state file. Default: %s' % UserDetailedLocationTableCreator.CHECKPOINT_FILE,
+                        default=None)
+    parser.add_argument('-s', '--shards',
+                        type=int,
+                        help='Number of worker processes, each filling the table for one\n' +\
+                             '    partition of the anon_screen_name space. Default: 1',
+                        default=1)
     
     args = parser.parse_args();
     if args.user is None:
@@ -153,9 +509,15 @@ if __name__ == '__main__':
             except IOError:
                 # No .ssh subdir of user's home, or no mysql inside .ssh:
                 pwd = ''
-    tblCreator = UserCountryTableCreator(user, pwd)
+    tblCreator = UserDetailedLocationTableCreator(user, pwd, 
+                                                  resume=args.resume, 
+                                                  checkpointFile=args.checkpoint,
+                                                  numShards=args.shards)
     print("%s: Filling UserCountry table..." % str(datetime.datetime.today()))
-    tblCreator.fillTable()
+    if args.shards > 1:
+        tblCreator.fillTableSharded()
+    else:
+        tblCreator.fillTable()
     print("%s: Done filling UserCountry table..." % str(datetime.datetime.today()))
     print("%s: Indexing table..." % str(datetime.datetime.today()))
     tblCreator.makeIndex()
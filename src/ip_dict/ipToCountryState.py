@@ -26,11 +26,14 @@ The underlying IP->Country information comes from http://software77.net/geo-ip/
 @author: paepcke
 '''
 
-import csv
 import os
-import unittest
 
-class IpCountryStateDict(unittest.TestCase):
+from ipLocationQueries import IpLocationQueries
+from ipRangeTable import IpRangeTable
+from ipReservedRanges import MAX_IP, categoryId, reservedResults
+from ipTableSchema import DB3_SCHEMA
+
+class IpCountryStateDict(IpLocationQueries):
     '''
     Implements lookup mapping IP to country.
     '''
@@ -40,12 +43,22 @@ class IpCountryStateDict(unittest.TestCase):
     COUNTRY_POS = 3
     STATE_POS = 4
     CITY_POS = 5
+    
+    # Names of the fields after the start and end IP,
+    # as columns of the range table:
+    FIELD_NAMES = ['twoLetterCountry', 'country', 'region', 'city']
+
+    # lookupIP() result for reserved addresses, as a
+    # ReservedAddress per category (see ipReservedRanges):
+    RESERVED_FIELDS = ('-', '-', '-', '-')
+    RESERVED_RESULTS = reservedResults(RESERVED_FIELDS, FIELD_NAMES)
 
-    def __init__(self, ipTablePath=None):
+    def __init__(self, ipTablePath=None, schema=DB3_SCHEMA):
         '''
         Create an in-memory dict for quickly looking up IP addresses.
         The underlying IP->Country information comes from http://software77.net/geo-ip/
-        If an unzipped table from their Web site is not passed in, then 
+        The table may be gzip- or zstd-compressed (see compressed_files).
+        If a table from their Web site is not passed in, then 
         the table is expected to reside in subdirectory 'data' of this script's directory
         under the name ipToCountrySoftware77DotNet.csv. Their table contains
         columns for (decimal)startRange, endRange, assigning agency, assignment
@@ -61,40 +74,29 @@ class IpCountryStateDict(unittest.TestCase):
         
         We also construct a simpler dict that maps a country's three-letter
         code to a tuple: (two-letter code, three-letter code, full country name).
+        
+        Tables of other layouts can be read by passing a schema 
+        (see ipTableSchema) that keeps the start IP, the end IP, and
+        the columns of FIELD_NAMES, in this order.
         '''
+        if schema.fieldNames[2:] != IpCountryStateDict.FIELD_NAMES:
+            raise ValueError("Schema must keep columns %s after the IPs." % IpCountryStateDict.FIELD_NAMES)
         currKey = 0
         self.ipDict = {currKey : []}
         self.twoLetterKeyedDict = {}
+        # Built on first use by rangeTable():
+        self.ipRangeTable = None
         if ipTablePath is None:
             tableSubPath = os.path.join('data/', 'IP2LOCATION-LITE-DB3.CSV')
             ipTablePath = os.path.join(os.path.dirname(__file__), tableSubPath)
-        with open(ipTablePath, 'r') as fd:
-            for line in csv.reader(fd):
-                if len(line) == 0 or line[0] == '#' or line == '\n':
-                    continue
-                try: 
-                    (startIPStr,endIPStr,twoLetterCountry,country, state, city) = line
-                except ValueError as e:
-                    print("Irregularity in IP db line '%s': %s" % (line, `e`))
-                    continue
-                # Use first four digits of start ip as hash key:
-                hashKey = startIPStr.strip('"').zfill(10)[0:4]
-                if hashKey != currKey:
-                    self.ipDict[hashKey] = []
-                    currKey = hashKey
-                self.ipDict[hashKey].append((int(startIPStr.strip('"')), 
-                                                       int(endIPStr.strip('"')), 
-                                                       twoLetterCountry.strip('"'), 
-                                                       country.strip('"'), 
-                                                       state.strip('"'),
-                                                       city.strip('"')
-                                                       )
-                                                    )
-                self.twoLetterKeyedDict[twoLetterCountry.strip('"')] = (twoLetterCountry.strip('"'), 
-                                                                        country.strip('"'),
-                                                                        state.strip('"'),
-                                                                        city.strip('"')
-                                                                        )
+        for (startIP,endIP,twoLetterCountry,country,state,city) in schema.readRows(ipTablePath):
+            # Use first four digits of start ip as hash key:
+            hashKey = str(startIP).zfill(10)[0:4]
+            if hashKey != currKey:
+                self.ipDict[hashKey] = []
+                currKey = hashKey
+            self.ipDict[hashKey].append((startIP, endIP, twoLetterCountry, country, state, city))
+            self.twoLetterKeyedDict[twoLetterCountry] = (twoLetterCountry, country, state, city)
 
     def get(self, ipStr, default=None):
         '''
@@ -117,10 +119,37 @@ class IpCountryStateDict(unittest.TestCase):
     def getBy3LetterCode(self, threeLetterCode):
         return self.twoLetterKeyedDict[threeLetterCode]
 
+    def rangeTable(self):
+        '''
+        Return the column-wise copy of all ranges, which 
+        is built on the first call.
+        :rtype: IpRangeTable
+        '''
+        if self.ipRangeTable is None:
+            self.ipRangeTable = IpRangeTable.fromIpDict(self.ipDict, IpCountryStateDict.FIELD_NAMES, 
+                                                        reservedFields=IpCountryStateDict.RESERVED_FIELDS)
+        return self.ipRangeTable
+
+    def lookupRecord(self, ipStr):
+        '''
+        Same as lookupIP(), but returns a compact IpLookupRecord
+        that decodes the fields of FIELD_NAMES only when they
+        are read, like record.region. Records unpack like 
+        the tuples of lookupIP(). See IpRangeTable.lookupRecord().
+        :param ipStr: string of an IP address
+        :type ipStr: string
+        :rtype: IpLookupRecord
+        :raise ValueError: when given IP address is not valid
+        :raise KeyError: when the IP is in no range. 
+        '''
+        return self.rangeTable().lookupRecord(ipStr)
+
     def lookupIP(self,ipStr):
         '''
         Top level lookup: pass an IP string, get a
-        four-tuple: two-letter country code, full country name, region, and city:
+        four-tuple: two-letter country code, full country name, region, and city.
+        Reserved addresses, such as private networks, give a 
+        ReservedAddress of RESERVED_FIELDS without a table search.
         :param ipStr: string of an IP address
         :type ipStr: string
         :return: 2-letter country code, country, region, city
@@ -129,8 +158,13 @@ class IpCountryStateDict(unittest.TestCase):
         :raise KeyError: when the country for the given IP is not found. 
         '''
         (ipNum, lookupKey) = self.ipStrToIntAndKey(ipStr)
-        if ipNum is None or lookupKey is None:
+        if ipNum is None or lookupKey is None or not 0 <= ipNum <= MAX_IP:
             raise ValueError("IP string is not a valid IP address: '%s'" % str(ipStr))
+        # Private, loopback, and other reserved addresses
+        # are in no country, and need no search:
+        reserved = IpCountryStateDict.RESERVED_RESULTS[categoryId(ipNum)]
+        if reserved is not None:
+            return reserved
         while lookupKey > 0:
             try:
                 ipRangeChain = self.ipDict[lookupKey]
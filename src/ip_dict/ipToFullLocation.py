@@ -22,7 +22,8 @@ It is therefore recommended that only one instance is made,
 and then used for many lookups. But creating multiple instances
 does no harm.
 
-The out-facing method is lookupIP(ipString)
+The out-facing method is lookupIP(ipString). Many IPs at 
+once can be written to Arrow or Parquet files via writeLookups().
 
 The underlying IP->FullLOcation information comes from http://software77.net/geo-ip/,
 and is expected to be in data/IP-COUNTRY-REGION-CITY-LATITUDE-LONGITUDE-ZIPCODE-TIMEZONE-AREACODE.CSV
@@ -31,13 +32,16 @@ and is expected to be in data/IP-COUNTRY-REGION-CITY-LATITUDE-LONGITUDE-ZIPCODE-
 '''
 
 import argparse
-import csv
 import os
 import sys
-import unittest
 
+from compressed_files import open_file
+from ipLocationQueries import IpLocationQueries
+from ipRangeTable import IpRangeTable
+from ipReservedRanges import MAX_IP, categoryId, reservedResults
+from ipTableSchema import DB15_SCHEMA
 
-class IpFullLocation(unittest.TestCase):
+class IpFullLocation(IpLocationQueries):
     '''
     Implements lookup mapping IP to country.
     '''
@@ -55,17 +59,30 @@ class IpFullLocation(unittest.TestCase):
     AREA_PHONE_POS = 11
     
     XLATION_CSV = 'IP-COUNTRY-REGION-CITY-LATITUDE-LONGITUDE-ZIPCODE-TIMEZONE-AREACODE.CSV'
+    
+    # Names of the fields after the start and end IP,
+    # as columns of the range table:
+    FIELD_NAMES = ['twoLetterCountry', 'country', 'region', 'city', 
+                   'latitude', 'longitude', 'zipcode', 'timezone', 
+                   'countryPhoneCode', 'areaCode']
+    FLOAT_FIELDS = ['latitude', 'longitude']
+
+    # lookupIP() result for reserved addresses, as a
+    # ReservedAddress per category (see ipReservedRanges):
+    RESERVED_FIELDS = ('-', '-', '-', '-', 0.0, 0.0, '-', '-', '-', '-')
+    RESERVED_RESULTS = reservedResults(RESERVED_FIELDS, FIELD_NAMES)
 
 
     #--------------------------
     # Constructor 
     #----------------
 
-    def __init__(self, ipTablePath=None):
+    def __init__(self, ipTablePath=None, schema=DB15_SCHEMA):
         '''
         Create an in-memory dict for quickly looking up IP addresses.
         The underlying IP->Country information comes from http://software77.net/geo-ip/
-        If an unzipped table from their Web site is not passed in, then 
+        The table may be gzip- or zstd-compressed (see compressed_files).
+        If a table from their Web site is not passed in, then 
         the table is expected to reside in subdirectory 'data' of this script's directory
         under the name IpFullLocation.XLATION_CSV. Their table contains
         columns for (decimal)startRange, endRange, and the other values.
@@ -80,47 +97,31 @@ class IpFullLocation(unittest.TestCase):
         
         We also construct a simpler dict that maps a country's three-letter
         code to a tuple: (two-letter code, three-letter code, full country name).
+        
+        Tables of other layouts can be read by passing a schema 
+        (see ipTableSchema) that keeps the start IP, the end IP, and
+        the columns of FIELD_NAMES, in this order.
         '''
+        if schema.fieldNames[2:] != IpFullLocation.FIELD_NAMES:
+            raise ValueError("Schema must keep columns %s after the IPs." % IpFullLocation.FIELD_NAMES)
         currKey = 0
         self.ipDict = {currKey : []}
         self.twoLetterKeyedDict = {}
+        # Built on first use by rangeTable():
+        self.ipRangeTable = None
         if ipTablePath is None:
             tableSubPath = os.path.join('data/', IpFullLocation.XLATION_CSV)
             ipTablePath = os.path.join(os.path.dirname(__file__), tableSubPath)
-        with open(ipTablePath, 'r') as fd:
-            for line in csv.reader(fd):
-                if len(line) == 0 or line[0] == '#' or line == '\n' or line[0] == '0':
-                    continue
-                try: 
-                    (startIPStr,endIPStr,twoLetterCountry,country, state, city,
-                     latitude, longitude, zipcode, timezone, country_phone_code, area_code) = line
-                except ValueError as e:
-                    print("Irregularity in IP db line '%s': %s" % (line, `e`))
-                    continue
-                # Use first four digits of start ip as hash key:
-                hashKey = startIPStr.strip('"').zfill(10)[0:4]
-                if hashKey != currKey:
-                    self.ipDict[hashKey] = []
-                    currKey = hashKey
-                self.ipDict[hashKey].append((int(startIPStr.strip('"')), 
-                                                       int(endIPStr.strip('"')), 
-                                                       twoLetterCountry.strip('"'), 
-                                                       country.strip('"'), 
-                                                       state.strip('"'),
-                                                       city.strip('"'),
-                                                       float(latitude),
-                                                       float(longitude),
-                                                       zipcode.strip('"'),
-                                                       timezone.strip('"'),
-                                                       country_phone_code.strip('"'),
-                                                       area_code.strip('"')
-                                                       )
-                                                    )
-                self.twoLetterKeyedDict[twoLetterCountry.strip('"')] = (twoLetterCountry.strip('"'), 
-                                                                        country.strip('"'),
-                                                                        state.strip('"'),
-                                                                        city.strip('"')
-                                                                        )
+        for row in schema.readRows(ipTablePath):
+            startIP = row[0]
+            # Use first four digits of start ip as hash key:
+            hashKey = str(startIP).zfill(10)[0:4]
+            if hashKey != currKey:
+                self.ipDict[hashKey] = []
+                currKey = hashKey
+            self.ipDict[hashKey].append(row)
+            (twoLetterCountry, country, state, city) = row[2:6]
+            self.twoLetterKeyedDict[twoLetterCountry] = (twoLetterCountry, country, state, city)
 
     #--------------------------
     #  get
@@ -159,7 +160,10 @@ class IpFullLocation(unittest.TestCase):
     def lookupIP(self,ipStr):
         '''
         Top level lookup: pass an IP string, get a
-        four-tuple: two-letter country code, full country name, region, and city:
+        ten-tuple: two-letter country code, full country name, region, city,
+        and the other fields of FIELD_NAMES. Reserved addresses, such as
+        private networks, give a ReservedAddress of RESERVED_FIELDS 
+        without a table search.
         :param ipStr: string of an IP address
         :type ipStr: string
         :return: 2-letter country code, country, region, city, 
@@ -169,8 +173,13 @@ class IpFullLocation(unittest.TestCase):
         :raise KeyError: when the country for the given IP is not found. 
         '''
         (ipNum, lookupKey) = self.ipStrToIntAndKey(ipStr)
-        if ipNum is None or lookupKey is None:
+        if ipNum is None or lookupKey is None or not 0 <= ipNum <= MAX_IP:
             raise ValueError("IP string is not a valid IP address: '%s'" % str(ipStr))
+        # Private, loopback, and other reserved addresses
+        # are in no country, and need no search:
+        reserved = IpFullLocation.RESERVED_RESULTS[categoryId(ipNum)]
+        if reserved is not None:
+            return reserved
         while lookupKey > 0:
             try:
                 ipRangeChain = self.ipDict[lookupKey]
@@ -205,6 +214,82 @@ class IpFullLocation(unittest.TestCase):
         # the IP-->Country table has a hole:
         raise KeyError("Ip %s not found in location translator." % ipStr)
         
+    #--------------------------
+    # lookupRecord 
+    #----------------
+    
+    def lookupRecord(self, ipStr):
+        '''
+        Same as lookupIP(), but returns a compact IpLookupRecord
+        that decodes the fields of FIELD_NAMES only when they
+        are read, like record.city. Records unpack like 
+        the tuples of lookupIP(). See IpRangeTable.lookupRecord().
+        
+        :param ipStr: string of an IP address
+        :type ipStr: string
+        :rtype: IpLookupRecord
+        :raise ValueError: when given IP address is not valid
+        :raise KeyError: when the IP is in no range. 
+        '''
+        return self.rangeTable().lookupRecord(ipStr)
+
+    #--------------------------
+    # lookupSortedIPs 
+    #----------------
+    
+    def lookupSortedIPs(self, ipStrs):
+        '''
+        Generate the lookupIP() result of each IP string, or None 
+        where get() would return None. Meant for IPs in ascending
+        order, which are merged with the sorted ranges rather than
+        searched one by one. Unsorted input is handled correctly, 
+        but more slowly. See IpRangeTable.findRangesSorted().
+        
+        :param ipStrs: IP strings, preferably in ascending order
+        :type ipStrs: iterable
+        :return: generator of lookupIP() results or None
+        '''
+        return self.rangeTable().lookupSorted(ipStrs)
+
+    #--------------------------
+    # writeLookups 
+    #----------------
+    
+    def writeLookups(self, ipStrs, outPath):
+        '''
+        Look up many IPs, and write the results to an Apache Arrow
+        (outPath ending in .arrow) or Parquet (.parquet) file. One 
+        row per IP holds the IP string and the fields of FIELD_NAMES.
+        Country, region, and the other string fields are dictionary 
+        encoded, latitude and longitude are float64. See 
+        IpRangeTable.writeLookups().
+        
+        :param ipStrs: IP strings
+        :type ipStrs: iterable
+        :param outPath: file to write
+        :type outPath: str
+        :raise ImportError: if pyarrow is not installed.
+        '''
+        self.rangeTable().writeLookups(ipStrs, outPath)
+
+    #--------------------------
+    # rangeTable 
+    #----------------
+    
+    def rangeTable(self):
+        '''
+        Return the column-wise copy of all ranges, which 
+        is built on the first call.
+        
+        :rtype: IpRangeTable
+        '''
+        if self.ipRangeTable is None:
+            self.ipRangeTable = IpRangeTable.fromIpDict(self.ipDict, 
+                                                        IpFullLocation.FIELD_NAMES, 
+                                                        IpFullLocation.FLOAT_FIELDS,
+                                                        IpFullLocation.RESERVED_FIELDS)
+        return self.ipRangeTable
+
     # ------------------------------------- Utility Methods ---------------
         
     #--------------------------
@@ -230,44 +315,47 @@ class IpFullLocation(unittest.TestCase):
         ipNum = int(oct3) + (int(oct2) * 256) + (int(oct1) * 256 * 256) + (int(oct0) * 256 * 256 * 256)
         return (ipNum, str(ipNum).zfill(10)[0:4])
 
-    #---------------------------- Self Test ---------------------------
-
-    #--------------------------
-    # testAll 
-    #----------------
-    
-    def testAll(self):
-        #(ip,lookupKey) = lookup.ipStrToIntAndKey('171.64.64.64')
-        res = self.lookupIP('171.64.75.96')
-        self.assertEqual(res, ('US', 'United States', 'California', 
-                               'Stanford', 37.421262, -122.163949, 
-                               '94305', '-07:00', 1, 650)
-                         )
-        
-        
     #---------------------------- Main ---------------------------
 
 if __name__ == '__main__':
     
-    DEFAULT_DB_FILE = os.path.join(os.path.dirname(__file__), 'data/%s' % IpFullLocation.XLATION_CSV),
+    DEFAULT_DB_FILE = os.path.join(os.path.dirname(__file__), 'data/%s' % IpFullLocation.XLATION_CSV)
     parser = argparse.ArgumentParser(prog=os.path.basename(sys.argv[0]), formatter_class=argparse.RawTextHelpFormatter)
     parser.add_argument('-d', '--dbfile',
-                        help='fully qualified name of IP decoding CSV file. Default: %s' % DEFAULT_DB_FILE,
+                        help='fully qualified name of IP decoding CSV file, optionally .gz or .zst. Default: %s' % DEFAULT_DB_FILE,
                         default=DEFAULT_DB_FILE);
     parser.add_argument('-t', '--test',
                         help='run a self test',
                         action='store_true');
+    parser.add_argument('-i', '--ipfile',
+                        help='file with one IP address per line, optionally .gz or .zst; requires --outfile',
+                        default=None);
+    parser.add_argument('-o', '--outfile',
+                        help='Arrow (.arrow) or Parquet (.parquet) file for the lookups of --ipfile',
+                        default=None);
     parser.add_argument('ipaddr',
+                        nargs='?',
                         help='IP address to look up.'
                         )
 
     args = parser.parse_args();
 
     if args.test:
-        IpFullLocation().testAll()
+        # Test modules are imported only when asked for:
+        import unittest
+        import test_ipToFullLocation
+        unittest.TextTestRunner().run(unittest.defaultTestLoader.loadTestsFromModule(test_ipToFullLocation))
         sys.exit()
             
-    lookup_dict = IpFullLocation()
+    lookup_dict = IpFullLocation(args.dbfile)
+    if args.ipfile is not None:
+        if args.outfile is None:
+            parser.error('--ipfile requires --outfile')
+        with open_file(args.ipfile) as fd:
+            lookup_dict.writeLookups((line.strip() for line in fd), args.outfile)
+        sys.exit()
+    if args.ipaddr is None:
+        parser.error('either an IP address or --ipfile is required')
     (twoLetter,country,region,city,latitude,longitude,zipcode,timezone,phone_country_code,phone_area_code) = lookup_dict.get(args.ipaddr)
     print('%s; %s; %s; %s; %s; %s; %s; %s; %s; %s' %\
           (twoLetter,country,region,city,latitude,longitude,zipcode,timezone,phone_country_code,phone_area_code)
@@ -0,0 +1,397 @@
+# Copyright (c) 2014, Stanford University
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without modification, are permitted provided that the following conditions are met:
+# 1. Redistributions of source code must retain the above copyright notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright notice, this list of conditions and the following disclaimer in the documentation and/or other materials provided with the distribution.
+# 3. Neither the name of the copyright holder nor the names of its contributors may be used to endorse or promote products derived from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+'''
+Created on Oct 18, 2026
+
+Several releases of an IP table in one store, for looking
+up IPs as of a date:
+
+    versions = IpVersionedTable()
+    versions.addTable(datetime.date(2014, 1, 1), 'IP2LOCATION-DB15-2014.CSV')
+    versions.addTable(datetime.date(2018, 1, 1), 'IP2LOCATION-DB15-2018.CSV')
+    versions.lookup('171.64.75.96', asOf=datetime.date(2015, 6, 30))
+
+@author: paepcke
+'''
+from array import array
+import bisect
+import datetime
+
+from ipLookupRecord import recordType
+from ipRangeTable import IpRangeTable
+from ipReservedRanges import categoryId, reservedResults
+from ipTableSchema import DB15_SCHEMA
+from ipToFullLocation import IpFullLocation
+
+
+class IpVersionedTable(object):
+    '''
+    Releases of an IP table, each valid from its date until 
+    the date of the next release. 
+    
+    The ranges of each release are cut into blocks of 
+    consecutive ranges. A block ends before every range whose 
+    start IP hashes to a multiple of BLOCK_SPAN, so block 
+    boundaries depend on the ranges themselves, not on their 
+    positions: a range that is added, removed, or changed in
+    a release only changes its own block. Blocks that are 
+    equal to a block of an earlier release are stored once.
+    All blocks live in shared, flat arrays:
+    
+        self.starts  : array of range start IPs
+        self.ends    : array of range end IPs
+        self.columns : {fieldName : array}, one entry per range
+        self.pools   : {fieldName : [distinct values]}, shared
+                       by all releases
+        self.blockOffsets : ranges of block b are at positions
+                            blockOffsets[b] to blockOffsets[b+1]
+                        
+    A release is an array of block numbers, and an array of
+    the start IPs of those blocks. Memory thus grows with the 
+    number of changed blocks, plus one entry per block and 
+    release. A lookup searches the release's block starts, and
+    then the block; its cost is that of an IpRangeTable lookup.
+    
+    Ranges are referred to by their position in the shared
+    arrays, the range index. lookupRecord() results therefore 
+    work as for IpRangeTable. Reserved addresses give their
+    ReservedAddress in every release, as in IpRangeTable.
+    '''
+    
+    # Expected number of ranges per block; a power of 2:
+    BLOCK_SPAN = 16
+
+    def __init__(self, 
+                 fieldNames=IpFullLocation.FIELD_NAMES, 
+                 floatFields=IpFullLocation.FLOAT_FIELDS,
+                 reservedFields=IpFullLocation.RESERVED_FIELDS):
+        '''
+        @param fieldNames: names of the fields after startIP and endIP
+        @type fieldNames: [str]
+        @param floatFields: names of fields that hold floats
+        @type floatFields: [str]
+        @param reservedFields: field values of reserved addresses
+        @type reservedFields: tuple
+        '''
+        self.fieldNames = list(fieldNames)
+        self.recordType = recordType(self.fieldNames)
+        self.reservedResults = reservedResults(reservedFields, self.fieldNames)
+        self.starts = array('I')
+        self.ends   = array('I')
+        self.columns = {}
+        self.pools = {}
+        self.poolIndexes = {}
+        for fieldName in self.fieldNames:
+            if fieldName in floatFields:
+                self.columns[fieldName] = array('d')
+            else:
+                self.columns[fieldName] = array('i')
+                self.pools[fieldName] = []
+                self.poolIndexes[fieldName] = {}
+        self.blockOffsets = array('L', [0])
+        # Blocks by hash of their encoded ranges: {hash : [blockNum]}
+        self.blocksByHash = {}
+        # Releases in date order:
+        self.releaseDates = []
+        self.releaseBlocks = []
+        self.releaseBlockStarts = []
+
+    #--------------------------
+    # addTable 
+    #----------------
+
+    def addTable(self, releaseDate, ipTablePath, schema=DB15_SCHEMA):
+        '''
+        Add the release of the given date from an IP table file. 
+        See addRelease().
+        
+        @param schema: layout of the table; must keep the start IP, 
+            the end IP, and the columns of fieldNames
+        @type schema: IpTableSchema
+        '''
+        if schema.fieldNames[2:] != self.fieldNames:
+            raise ValueError("Schema must keep columns %s after the IPs." % self.fieldNames)
+        self.addRelease(releaseDate, schema.readRows(ipTablePath))
+
+    #--------------------------
+    # addRelease 
+    #----------------
+
+    def addRelease(self, releaseDate, rows):
+        '''
+        Add the release of the given date. Releases may be
+        added in any order.
+        
+        @param releaseDate: first day on which the release is valid
+        @type releaseDate: {datetime.date | str}
+        @param rows: (startIP, endIP, field1, field2, ...) tuples,
+            with one field per fieldName
+        @type rows: iterable
+        @raise ValueError: if there is a release of that date already.
+        '''
+        releaseDate = self.toDate(releaseDate)
+        releasePos = bisect.bisect_left(self.releaseDates, releaseDate)
+        if releasePos < len(self.releaseDates) and self.releaseDates[releasePos] == releaseDate:
+            raise ValueError("Release of %s already loaded." % releaseDate)
+        blocks = array('i')
+        blockStarts = array('I')
+        block = []
+        for row in sorted(rows):
+            encodedRow = self.encodeRow(row)
+            if block and self.startsBlock(encodedRow[0]):
+                blocks.append(self.storeBlock(block))
+                blockStarts.append(block[0][0])
+                block = []
+            block.append(encodedRow)
+        if block:
+            blocks.append(self.storeBlock(block))
+            blockStarts.append(block[0][0])
+        self.releaseDates.insert(releasePos, releaseDate)
+        self.releaseBlocks.insert(releasePos, blocks)
+        self.releaseBlockStarts.insert(releasePos, blockStarts)
+
+    #--------------------------
+    # lookup 
+    #----------------
+
+    def lookup(self, ipStr, asOf=None):
+        '''
+        Return the tuple of field values of the range that held
+        the IP in the release valid on date asOf, like the lookupIP() 
+        of IpFullLocation. Reserved addresses give a ReservedAddress
+        without a search.
+        
+        @param ipStr: string of an IP address
+        @type ipStr: str
+        @param asOf: date of the lookup. Default: latest release
+        @type asOf: {None | datetime.date | str}
+        @raise ValueError: if ipStr is not a valid IP address, or 
+            if no release is valid on asOf.
+        @raise KeyError: if the IP is in no range of the release.
+        '''
+        return self.findResult(ipStr, asOf, self.values)
+
+    #--------------------------
+    # get 
+    #----------------
+
+    def get(self, ipStr, asOf=None, default=None):
+        '''
+        Same as lookup, but returns default if the IP 
+        is in no range, rather than throwing a KeyError.
+        '''
+        try:
+            return self.lookup(ipStr, asOf)
+        except KeyError:
+            return default
+
+    #--------------------------
+    # lookupRecord 
+    #----------------
+
+    def lookupRecord(self, ipStr, asOf=None):
+        '''
+        Same as lookup(), but returns a compact IpLookupRecord,
+        as IpRangeTable.lookupRecord() does.
+        '''
+        return self.findResult(ipStr, asOf, lambda rangeIdx: self.recordType(self, rangeIdx))
+
+    #--------------------------
+    # findResult 
+    #----------------
+
+    def findResult(self, ipStr, asOf, resultOf):
+        '''
+        Return resultOf(rangeIdx) for the range of the IP in 
+        the release valid on asOf, or the ReservedAddress of
+        a reserved IP. Raises the errors of lookup().
+        '''
+        ipNum = IpRangeTable.ipStrToInt(ipStr)
+        if ipNum is None:
+            raise ValueError("IP string is not a valid IP address: '%s'" % str(ipStr))
+        releasePos = self.releaseAsOf(asOf)
+        reserved = self.reservedResults[categoryId(ipNum)]
+        if reserved is not None:
+            return reserved
+        rangeIdx = self.findRange(ipNum, releasePos)
+        if rangeIdx == IpRangeTable.NOT_FOUND:
+            raise KeyError("Ip %s not found in release of %s." % (ipStr, asOf))
+        return resultOf(rangeIdx)
+
+    #--------------------------
+    # findRange 
+    #----------------
+
+    def findRange(self, ipNum, releasePos):
+        '''
+        Return the index of the range that holds ipNum in
+        the release at position releasePos, or NOT_FOUND.
+        '''
+        blockStarts = self.releaseBlockStarts[releasePos]
+        blockPos = bisect.bisect_right(blockStarts, ipNum) - 1
+        if blockPos < 0:
+            return IpRangeTable.NOT_FOUND
+        blockNum = self.releaseBlocks[releasePos][blockPos]
+        rangeIdx = bisect.bisect_right(self.starts, ipNum, 
+                                       self.blockOffsets[blockNum], 
+                                       self.blockOffsets[blockNum + 1]) - 1
+        if ipNum > self.ends[rangeIdx]:
+            return IpRangeTable.NOT_FOUND
+        return rangeIdx
+
+    #--------------------------
+    # releaseAsOf 
+    #----------------
+
+    def releaseAsOf(self, asOf=None):
+        '''
+        Return the position of the release valid on date asOf,
+        i.e. of the latest release of that date or earlier.
+        Default: latest release.
+        
+        @raise ValueError: if all releases are later than asOf.
+        '''
+        if asOf is None:
+            releasePos = len(self.releaseDates) - 1
+        else:
+            releasePos = bisect.bisect_right(self.releaseDates, self.toDate(asOf)) - 1
+        if releasePos < 0:
+            raise ValueError("No IP table release as of %s." % asOf)
+        return releasePos
+
+    #--------------------------
+    # value 
+    #----------------
+
+    def value(self, rangeIdx, fieldName):
+        '''
+        Return the value of the given field of the
+        range with index rangeIdx.
+        '''
+        fieldValue = self.columns[fieldName][rangeIdx]
+        try:
+            return self.pools[fieldName][fieldValue]
+        except KeyError:
+            return fieldValue
+
+    #--------------------------
+    # values 
+    #----------------
+
+    def values(self, rangeIdx):
+        '''
+        Return the tuple of all field values of the 
+        range with index rangeIdx.
+        '''
+        return tuple(self.value(rangeIdx, fieldName) for fieldName in self.fieldNames)
+
+    #--------------------------
+    # numBlocks 
+    #----------------
+
+    def numBlocks(self):
+        '''
+        Number of distinct blocks of all releases.
+        '''
+        return len(self.blockOffsets) - 1
+
+    #--------------------------
+    # __len__ 
+    #----------------
+
+    def __len__(self):
+        '''
+        Number of releases.
+        '''
+        return len(self.releaseDates)
+
+    # ------------------------- Block Storage --------------
+
+    #--------------------------
+    # encodeRow 
+    #----------------
+
+    def encodeRow(self, row):
+        '''
+        Return the row with string fields replaced by
+        their position in the field's pool.
+        '''
+        encodedRow = [row[0], row[1]]
+        for (fieldName, value) in zip(self.fieldNames, row[2:]):
+            try:
+                poolIndex = self.poolIndexes[fieldName]
+            except KeyError:
+                # Float field:
+                encodedRow.append(value)
+                continue
+            try:
+                encodedRow.append(poolIndex[value])
+            except KeyError:
+                pool = self.pools[fieldName]
+                poolIndex[value] = len(pool)
+                encodedRow.append(len(pool))
+                pool.append(value)
+        return tuple(encodedRow)
+
+    #--------------------------
+    # storeBlock 
+    #----------------
+
+    def storeBlock(self, block):
+        '''
+        Return the number of the stored block that equals 
+        the given list of encoded rows. The block is stored
+        if there is none.
+        '''
+        block = tuple(block)
+        blockHash = hash(block)
+        sameHashBlocks = self.blocksByHash.setdefault(blockHash, [])
+        for blockNum in sameHashBlocks:
+            if self.storedBlock(blockNum) == block:
+                return blockNum
+        for encodedRow in block:
+            self.starts.append(encodedRow[0])
+            self.ends.append(encodedRow[1])
+            for (fieldName, value) in zip(self.fieldNames, encodedRow[2:]):
+                self.columns[fieldName].append(value)
+        self.blockOffsets.append(len(self.starts))
+        sameHashBlocks.append(self.numBlocks() - 1)
+        return self.numBlocks() - 1
+
+    #--------------------------
+    # storedBlock 
+    #----------------
+
+    def storedBlock(self, blockNum):
+        '''
+        Return the encoded rows of a stored block.
+        '''
+        columns = [self.starts, self.ends] + [self.columns[fieldName] for fieldName in self.fieldNames]
+        return tuple(tuple(column[rangeIdx] for column in columns)
+                     for rangeIdx in xrange(self.blockOffsets[blockNum], self.blockOffsets[blockNum + 1]))
+
+    @staticmethod
+    def startsBlock(startIP):
+        # Knuth's multiplicative hash, which spreads
+        # nearby start IPs:
+        return ((startIP * 2654435761) & 0xffffffff) >> 16 & (IpVersionedTable.BLOCK_SPAN - 1) == 0
+
+    @staticmethod
+    def toDate(date):
+        '''
+        Return a date, a datetime's date, or a YYYY-MM-DD 
+        string as a date.
+        '''
+        if isinstance(date, datetime.datetime):
+            return date.date()
+        if isinstance(date, datetime.date):
+            return date
+        return datetime.datetime.strptime(date, '%Y-%m-%d').date()
@@ -0,0 +1,487 @@
+'''
+Created on Oct 18, 2026
+
+@author: paepcke
+'''
+import copy
+import cPickle
+import csv
+import datetime
+import os
+import random
+import tempfile
+import unittest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from ipLocationEngine import IpLocationEngine
+from ipLocationIndex import IpLocationIndex
+from ipRadixTrie import IpRadixTrie, rangeToCidrs
+from ipRangeTable import IpRangeTable
+from ipReservedRanges import ReservedAddress, reservedMask
+from ipTableSchema import DB3_SCHEMA, DB15_SCHEMA, IpTableSchema, SOFTWARE77_SCHEMA
+from ipToCountry import IpCountryDict
+from ipToCountryState import IpCountryStateDict
+from ipToFullLocation import IpFullLocation
+from ipVersionedTable import IpVersionedTable
+
+
+class TestIpFullLocation(unittest.TestCase):
+
+    DEFAULT_TABLE = os.path.join(os.path.dirname(__file__), 'data', IpFullLocation.XLATION_CSV)
+    
+    # DB15 lines of a small test table, with a hole
+    # between 16777472 and 16778239:
+    TEST_TABLE_LINES = [
+        '"0","16777215","-","-","-","-","0.000000","0.000000","-","-","-","-"',
+        '"16777216","16777471","US","United States","California","Stanford","37.421262","-122.163949","94305","-07:00","1","650"',
+        '"16778240","16779263","KR","Korea, Republic of","Seoul","Seoul","37.566000","126.978000","04524","+09:00","82","02"',
+        ]
+    
+    # The DB3 columns of the DB15 test table:
+    DB3_COLUMNS = IpTableSchema((name, colType, pos < 6) 
+                                for (pos, (name, colType, _)) in enumerate(DB15_SCHEMA.columns))
+    
+    # Software77 lines of a small country table; the 
+    # KR range ends within a /24 block:
+    COUNTRY_TABLE_LINES = [
+        '"16777216","16777471","apnic","1","US","USA","United States"',
+        '"16778240","16779000","apnic","1","KR","KOR","Korea, Republic of"',
+        '"16779001","16779263","apnic","1","JP","JPN","Japan"',
+        ]
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestIpFullLocation, cls).setUpClass()
+        (fd, cls.testTable) = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w') as tableFd:
+            tableFd.write('\n'.join(cls.TEST_TABLE_LINES) + '\n')
+        cls.lookup = IpFullLocation(cls.testTable)
+        
+    @classmethod
+    def tearDownClass(cls):
+        super(TestIpFullLocation, cls).tearDownClass()
+        os.remove(cls.testTable)
+
+    # ----------------------- Full IP2Location Table ---------------
+
+    @unittest.skipUnless(os.path.exists(DEFAULT_TABLE), "IP2Location table not in data/")
+    def testAll(self):
+        #(ip,lookupKey) = lookup.ipStrToIntAndKey('171.64.64.64')
+        res = IpFullLocation().lookupIP('171.64.75.96')
+        self.assertEqual(res, ('US', 'United States', 'California', 
+                               'Stanford', 37.421262, -122.163949, 
+                               '94305', '-07:00', '1', '650')
+                         )
+
+    # ----------------------- Table Schemas ---------------
+
+    def test_schema_parsing(self):
+        self.assertEqual(SOFTWARE77_SCHEMA.parseLine(self.COUNTRY_TABLE_LINES[0] + '\n'),
+                         (16777216, 16777471, 'US', 'USA', 'United States'))
+        self.assertEqual(DB3_SCHEMA.parseLine('"16777216","16777471","US","United States","California","Stanford"\r\n'),
+                         (16777216, 16777471, 'US', 'United States', 'California', 'Stanford'))
+        self.assertEqual(DB15_SCHEMA.parseLine(self.TEST_TABLE_LINES[1]),
+                         (16777216, 16777471, 'US', 'United States', 'California', 'Stanford',
+                          37.421262, -122.163949, '94305', '-07:00', '1', '650'))
+        self.assertEqual(self.DB3_COLUMNS.parseLine(self.TEST_TABLE_LINES[2]),
+                         (16778240, 16779263, 'KR', 'Korea, Republic of', 'Seoul', 'Seoul'))
+
+        # Escaped quotes, empty fields, and unquoted lines:
+        self.assertEqual(SOFTWARE77_SCHEMA.parseLine('"1","2","apnic","1","CI","CIV","C""ote d\'Ivoire"'),
+                         (1, 2, 'CI', 'CIV', 'C"ote d\'Ivoire'))
+        self.assertEqual(SOFTWARE77_SCHEMA.parseLine('"1","2","apnic","1","","","Unknown, ""quoted"""'),
+                         (1, 2, '', '', 'Unknown, "quoted"'))
+        self.assertEqual(SOFTWARE77_SCHEMA.parseLine('1,2,apnic,1,US,USA,United States'),
+                         (1, 2, 'US', 'USA', 'United States'))
+
+        # Wrong numbers of columns, and values of the wrong type:
+        with self.assertRaises(ValueError):
+            SOFTWARE77_SCHEMA.parseLine('"1","2","apnic","1","US","USA"')
+        with self.assertRaises(ValueError):
+            DB3_SCHEMA.parseLine(self.TEST_TABLE_LINES[1])
+        # Unsplit columns after the last kept one are counted, too:
+        with self.assertRaises(ValueError):
+            self.DB3_COLUMNS.parseLine(self.TEST_TABLE_LINES[1] + ',"extra"')
+        with self.assertRaises(ValueError):
+            self.DB3_COLUMNS.parseLine(self.TEST_TABLE_LINES[1].rsplit(',', 1)[0])
+        with self.assertRaises(ValueError):
+            DB15_SCHEMA.parseLine(self.TEST_TABLE_LINES[1].replace('37.421262', 'north'))
+        with self.assertRaises(ValueError):
+            IpTableSchema([('startIP', int, True), ('endIP', int, False)])
+
+    def test_schema_read_rows(self):
+        (fd, tablePath) = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w') as tableFd:
+            tableFd.write('# Comment\n\n' +
+                          self.COUNTRY_TABLE_LINES[0] + '\n' +
+                          '"16777472","16778239","apnic","1","US"\n' +
+                          self.COUNTRY_TABLE_LINES[1] + '\n')
+        try:
+            rows = list(SOFTWARE77_SCHEMA.readRows(tablePath))
+        finally:
+            os.remove(tablePath)
+        # The short line is skipped:
+        self.assertEqual(rows, [SOFTWARE77_SCHEMA.parseLine(line) for line in self.COUNTRY_TABLE_LINES[:2]])
+
+    # ----------------------- Lookup Records ---------------
+
+    def test_lookup_record(self):
+        record = self.lookup.lookupRecord('1.0.0.5')
+        self.assertEqual(record.city, 'Stanford')
+        self.assertEqual(record.latitude, 37.421262)
+        self.assertEqual(record, self.lookup.lookupIP('1.0.0.5'))
+        (twoLetter,country,region,city,latitude,longitude,zipcode,timezone,phone_country_code,phone_area_code) = record
+        self.assertEqual((twoLetter, zipcode, phone_area_code), ('US', '94305', '650'))
+        self.assertEqual(record[3], 'Stanford')
+        self.assertEqual(len(record), len(IpFullLocation.FIELD_NAMES))
+        self.assertEqual(self.lookup.lookupRecord('1.0.4.1').country, 'Korea, Republic of')
+
+        # Records hold no per-instance dict:
+        self.assertFalse(hasattr(record, '__dict__'))
+        with self.assertRaises(AttributeError):
+            record.city = 'Palo Alto'
+
+    def test_lookup_record_not_found(self):
+        # IP in the hole:
+        with self.assertRaises(KeyError):
+            self.lookup.lookupRecord('1.0.2.1')
+        with self.assertRaises(ValueError):
+            self.lookup.lookupRecord('1.0.2')
+
+    def test_record_types_shared(self):
+        # Tables with other fields get other record types:
+        stateLookup = IpCountryStateDict(self.testTable, schema=self.DB3_COLUMNS)
+        stateRecord = stateLookup.lookupRecord('1.0.0.5')
+        self.assertEqual(stateRecord, ('US', 'United States', 'California', 'Stanford'))
+        self.assertFalse(hasattr(stateRecord, 'latitude'))
+        self.assertIs(type(self.lookup.lookupRecord('1.0.4.1')), type(self.lookup.lookupRecord('1.0.0.5')))
+
+    # ----------------------- Shared Engine ---------------
+
+    def test_engine_views(self):
+        engine = IpLocationEngine(self.testTable)
+        fullView  = engine.fullLocationView()
+        stateView = engine.countryStateView()
+        countryView = engine.countryView()
+        # Views share the engine's table:
+        self.assertIs(fullView.rangeTable(), countryView.rangeTable())
+        
+        stateLookup = IpCountryStateDict(self.testTable, schema=self.DB3_COLUMNS)
+        countryLookup = self.countryLookup()
+        for ipStr in ('1.0.0.5', '1.0.4.1', '10.0.0.1', '127.0.0.1'):
+            self.assertEqual(fullView.lookupIP(ipStr), self.lookup.lookupIP(ipStr))
+            self.assertEqual(stateView.lookupIP(ipStr), stateLookup.lookupIP(ipStr))
+            # Records have the fields of the class the view mirrors:
+            for (view, lookup) in [(fullView, self.lookup), (stateView, stateLookup), (countryView, countryLookup)]:
+                (viewRecord, record) = (view.lookupRecord(ipStr), lookup.lookupRecord(ipStr))
+                self.assertEqual(type(viewRecord), type(record))
+                self.assertEqual(len(viewRecord), len(type(lookup).FIELD_NAMES))
+                self.assertEqual(viewRecord.twoLetterCountry, record.twoLetterCountry)
+                self.assertEqual(getattr(viewRecord, 'category', None), getattr(record, 'category', None))
+            self.assertEqual(stateView.lookupRecord(ipStr), stateLookup.lookupRecord(ipStr))
+            self.assertEqual(countryView.lookupRecord(ipStr), countryView.lookupIP(ipStr))
+        self.assertEqual(countryView.lookupRecord('1.0.0.5'), countryLookup.lookupRecord('1.0.0.5'))
+        self.assertEqual(countryView.lookupRecord('1.0.4.1').threeLetterCountry, 'KOR')
+        self.assertFalse(hasattr(stateView.lookupRecord('1.0.0.5'), 'latitude'))
+        self.assertEqual(countryView.lookupIP('1.0.0.5'), ('US', 'USA', 'United States'))
+        self.assertEqual(countryView.lookupIP('1.0.4.1'), ('KR', 'KOR', 'Korea, Republic of'))
+        self.assertEqual(countryView.lookupIP('10.0.0.1'), IpCountryDict.RESERVED_FIELDS)
+        self.assertEqual(countryView.lookupIP('10.0.0.1').category, 'private')
+        
+        # IPs in the hole:
+        self.assertEqual(countryView.lookupIP('1.0.2.1'), ('ZZ','ZZZ','unknown'))
+        self.assertEqual(stateView.lookupIP('1.0.2.1'), ('ZZ','ZZZ','unknown'))
+        self.assertIsNone(fullView.get('1.0.2.1'))
+        with self.assertRaises(KeyError):
+            fullView.lookupIP('1.0.2.1')
+        with self.assertRaises(KeyError):
+            countryView.lookupRecord('1.0.2.1')
+        with self.assertRaises(ValueError):
+            countryView.lookupIP('1.0.2')
+        # Tables without the full location columns are refused:
+        with self.assertRaises(ValueError):
+            IpLocationEngine(self.testTable, schema=self.DB3_COLUMNS)
+
+    # ----------------------- Arrow and Parquet Output ---------------
+
+    @unittest.skipIf(pyarrow is None, "pyarrow not installed")
+    def test_write_lookups(self):
+        ipStrs = ['1.0.0.5', '1.0.2.1', '10.0.0.1', 'bad', '1.0.4.1']
+        for suffix in ('.arrow', '.parquet'):
+            (fd, outPath) = tempfile.mkstemp(suffix=suffix)
+            os.close(fd)
+            try:
+                self.lookup.writeLookups(ipStrs, outPath)
+                if suffix == '.parquet':
+                    table = pyarrow.parquet.read_table(outPath)
+                else:
+                    table = pyarrow.RecordBatchFileReader(outPath).read_all()
+            finally:
+                os.remove(outPath)
+            columns = table.to_pydict()
+            self.assertEqual(columns['ip'], ipStrs)
+            # Hole, reserved, and invalid IPs have null fields:
+            self.assertEqual(columns['city'], ['Stanford', None, None, None, 'Seoul'])
+            self.assertEqual(columns['latitude'], [37.421262, None, None, None, 37.566])
+            self.assertEqual(columns['reserved'], [None, None, 'private', None, None])
+            self.assertTrue(pyarrow.types.is_dictionary(table.schema.field('country').type))
+            self.assertEqual(table.schema.field('longitude').type, pyarrow.float64())
+
+    # ----------------------- Range Search ---------------
+
+    def test_find_ranges_sorted(self):
+        table = self.randomRangeTable(41)
+        rnd = random.Random(41)
+        # Random IPs, range ends, and IPs in the holes after them:
+        ipNums = [rnd.randrange(2**32) for _ in range(5000)] +\
+                 list(table.starts) + list(table.ends) +\
+                 [ipNum + 1 for ipNum in table.ends if ipNum < 2**32 - 1]
+        ipNums.sort()
+        ipNums[::97] = [None] * len(ipNums[::97])
+        expected = [IpRangeTable.NOT_FOUND if ipNum is None else table.findRange(ipNum) 
+                    for ipNum in ipNums]
+        # Holes are hit:
+        self.assertIn(IpRangeTable.NOT_FOUND, [rangeIdx for (ipNum, rangeIdx) in zip(ipNums, expected) 
+                                               if ipNum is not None])
+        self.assertEqual(list(table.findRangesSorted(ipNums)), expected)
+        # Any order gives the same ranges:
+        shuffled = list(zip(ipNums, expected))
+        rnd.shuffle(shuffled)
+        self.assertEqual(list(table.findRangesSorted(ipNum for (ipNum, _) in shuffled)),
+                         [rangeIdx for (_, rangeIdx) in shuffled])
+        self.assertEqual(list(table.findRanges(ipNums)), expected)
+        
+        # Lookups in sorted order: hole, reserved, and invalid IPs
+        self.assertEqual(list(self.lookup.lookupSortedIPs(['1.0.0.5', '1.0.2.1', '1.0.4.1', '1.0.4.2'])),
+                         [self.lookup.lookupIP('1.0.0.5'), None, 
+                          self.lookup.lookupIP('1.0.4.1'), self.lookup.lookupIP('1.0.4.2')])
+
+    def test_radix_trie(self):
+        table = self.randomRangeTable(42)
+        trie = IpRadixTrie(table)
+        rnd = random.Random(42)
+        ipNums = [rnd.randrange(2**32) for _ in range(20000)] +\
+                 list(table.starts) + list(table.ends) +\
+                 [ipNum - 1 for ipNum in table.starts if ipNum > 0] +\
+                 [0, 2**32 - 1]
+        self.assertEqual(list(trie.findRanges(ipNums)), list(table.findRanges(ipNums)))
+        self.assertLess(len(trie), 2 * trie.numCidrs)
+        
+        trie = IpRadixTrie(self.lookup.rangeTable())
+        self.assertEqual(trie.lookupIP('1.0.4.1'), self.lookup.lookupIP('1.0.4.1'))
+        with self.assertRaises(KeyError):
+            trie.lookupIP('1.0.2.1')
+
+    def test_range_to_cidrs(self):
+        self.assertEqual(rangeToCidrs(0, 2**32 - 1), [(0, 0)])
+        self.assertEqual(rangeToCidrs(0, 0), [(0, 32)])
+        self.assertEqual(rangeToCidrs(2**32 - 1, 2**32 - 1), [(2**32 - 1, 32)])
+        self.assertEqual(rangeToCidrs(2**31, 2**32 - 1), [(2**31, 1)])
+        # Unaligned ends: 10.0.0.1 - 10.0.0.6
+        self.assertEqual(rangeToCidrs(0x0A000001, 0x0A000006),
+                         [(0x0A000001, 32), (0x0A000002, 31), (0x0A000004, 31), (0x0A000006, 32)])
+        self.assertEqual(rangeToCidrs(1, 2**32 - 2), 
+                         [(2**exponent, 32 - exponent) for exponent in range(31)] +
+                         [(2**32 - 2**(33 - prefixLength), prefixLength) for prefixLength in range(2, 33)])
+        
+        # Blocks are aligned, and cover the range without gaps:
+        rnd = random.Random(42)
+        for _ in range(1000):
+            (startIp, endIp) = sorted((rnd.randrange(2**32), rnd.randrange(2**32)))
+            nextIp = startIp
+            for (network, prefixLength) in rangeToCidrs(startIp, endIp):
+                self.assertEqual(network, nextIp)
+                self.assertEqual(network % 2**(32 - prefixLength), 0)
+                nextIp = network + 2**(32 - prefixLength)
+            self.assertEqual(nextIp, endIp + 1)
+
+    def test_write_cidrs(self):
+        trie = IpRadixTrie(self.lookup.rangeTable())
+        (fd, outPath) = tempfile.mkstemp(suffix='.csv')
+        os.close(fd)
+        try:
+            trie.writeCidrs(outPath)
+            with open(outPath) as fd:
+                rows = list(csv.reader(fd))
+        finally:
+            os.remove(outPath)
+        self.assertEqual(rows[0], ['cidr'] + IpFullLocation.FIELD_NAMES)
+        self.assertEqual(len(rows), trie.numCidrs + 1)
+        self.assertEqual(rows[1][:2], ['0.0.0.0/8', '-'])
+        self.assertEqual(rows[-1][:2], ['1.0.4.0/22', 'KR'])
+
+    # ----------------------- Counting by Location ---------------
+
+    def test_count_ips(self):
+        table = self.randomRangeTable(44)
+        index = table.locationIndex(('location',))
+        rnd = random.Random(44)
+        ipNums = sorted(rnd.randrange(2**32) for _ in range(5000))
+        # IP ints, then IP strings with invalid and reserved ones:
+        ips = ipNums + ['10.0.0.1', 'bad', '1.2.3.4', '192.168.0.1', None]
+        
+        expected = index.newCounts()
+        for ip in ips:
+            ipNum = ip if isinstance(ip, (int, long)) else table.ipStrToInt(ip)
+            category = reservedMask([ipNum])[0]
+            rangeIdx = IpRangeTable.NOT_FOUND if ipNum is None else table.findRange(ipNum)
+            if category:
+                expected[len(index) + category] += 1
+            elif rangeIdx == IpRangeTable.NOT_FOUND:
+                expected[len(index)] += 1
+            else:
+                expected[index.locationIds[(table.value(rangeIdx, 'location'),)]] += 1
+        
+        counts = index.countIPs(ips)
+        self.assertEqual(counts, expected)
+        # Several chunks per worker, more than are in flight:
+        chunkSize = IpLocationIndex.COUNT_CHUNK_SIZE
+        IpLocationIndex.COUNT_CHUNK_SIZE = 300
+        try:
+            self.assertEqual(index.countIPs(iter(ips), processes=2), counts)
+        finally:
+            IpLocationIndex.COUNT_CHUNK_SIZE = chunkSize
+        decoded = index.decodeCounts(counts)
+        self.assertGreaterEqual(decoded['private'], 2)
+        self.assertEqual(sum(decoded.values()), len(ips))
+
+    # ----------------------- Reserved Addresses ---------------
+
+    def test_reserved_addresses(self):
+        res = self.lookup.lookupIP('192.168.1.20')
+        self.assertIsInstance(res, ReservedAddress)
+        self.assertEqual(res, IpFullLocation.RESERVED_FIELDS)
+        self.assertEqual(res.category, 'private')
+        self.assertTrue(res.isPrivate)
+        # 0/8 is in the table, but is answered without search:
+        self.assertEqual(self.lookup.lookupIP('0.1.2.3').category, 'this-network')
+        self.assertEqual(self.lookup.get('100.64.0.1').category, 'shared')
+        # Partly reserved /16 block:
+        self.assertEqual(self.lookup.lookupIP('192.0.2.1').category, 'documentation')
+        self.assertNotIsInstance(self.lookup.get('192.0.3.1'), ReservedAddress)
+        self.assertNotIsInstance(self.lookup.lookupIP('1.0.0.5'), ReservedAddress)
+        
+        self.assertEqual(list(reservedMask([0x0A000001, 0x01000005, None, 0xFFFFFFFF])), [2, 0, 0, 11])
+        
+        # Results survive pickling and copying:
+        record = self.lookup.lookupRecord('10.0.0.1')
+        for copied in (cPickle.loads(cPickle.dumps(record, 2)), copy.deepcopy(record)):
+            self.assertIsInstance(copied, ReservedAddress)
+            self.assertEqual(copied, record)
+            self.assertEqual(copied.category, 'private')
+            self.assertEqual(copied.city, '-')
+
+    @unittest.skipIf(numpy is None, "numpy not installed")
+    def test_reserved_mask_numpy(self):
+        # Addresses from 128.0.0.0 up are negative as int32;
+        # 192.0.2.1 and 192.0.3.1 are in a partly reserved /16:
+        ipNums = [0x0A000001, 0x01000005, 0xC0000201, 0xC0000301, 0xC0A80001, 0xFFFFFFFF]
+        for dtype in (numpy.uint32, numpy.int64, numpy.int32):
+            mask = reservedMask(numpy.array(ipNums, dtype=numpy.uint32).astype(dtype))
+            self.assertEqual(mask.tolist(), list(reservedMask(ipNums)))
+        self.assertEqual(list(reservedMask(ipNums)), [2, 0, 7, 0, 2, 11])
+
+    def test_reserved_entry_points(self):
+        # Every entry point answers reserved addresses alike:
+        lookup = self.countryLookup()
+        reserved = lookup.lookupIP('10.0.0.1')
+        self.assertEqual(reserved, IpCountryDict.RESERVED_FIELDS)
+        record = lookup.lookupRecord('10.0.0.1')
+        self.assertEqual(record, reserved)
+        self.assertEqual(record.category, 'private')
+        self.assertEqual(record.threeLetterCountry, 'ZZZ')
+        
+        results = list(lookup.lookupSortedIPs(['1.0.0.5', '10.0.0.1', '127.0.0.1', '1.0.2.1']))
+        self.assertEqual(results[0], ('US', 'USA', 'United States'))
+        self.assertEqual(results[1], reserved)
+        self.assertEqual(results[1].category, 'private')
+        self.assertEqual(results[2].category, 'loopback')
+        self.assertEqual(results[3], IpCountryDict.UNKNOWN_COUNTRY)
+        
+        self.assertEqual(lookup.countByCountry(['1.0.0.5', '10.0.0.1', '10.9.9.9', '1.0.2.1']),
+                         {'US' : 1, 'private' : 2, None : 1})
+        self.assertEqual(self.lookup.countByLocation(['192.168.1.1', '1.0.0.5'], 'region'),
+                         {('US', 'California') : 1, 'private' : 1})
+        self.assertEqual(self.lookup.lookupRecord('172.16.0.1').category, 'private')
+        self.assertEqual(list(self.lookup.lookupSortedIPs(['172.16.0.1']))[0], IpFullLocation.RESERVED_FIELDS)
+
+    # ----------------------- Country Filters ---------------
+
+    def test_country_filter(self):
+        lookup = self.countryLookup()
+        self.assertTrue(lookup.isInCountries('1.0.0.5', ['US', 'KR']))
+        self.assertTrue(lookup.isInCountries('1.0.6.248', ['US', 'KR']))
+        self.assertFalse(lookup.isInCountries('1.0.6.249', ['US', 'KR']))
+        self.assertFalse(lookup.isInCountries('1.0.2.1', ['US', 'KR']))
+        # Filters are cached per set of countries:
+        self.assertIs(lookup.countryFilter(['KR', 'US']), lookup.countryFilter(('US', 'KR')))
+        self.assertEqual(list(lookup.countryFilter(['JP']).membershipMask([16779000, 16779001, None])), [0, 1, 0])
+
+    # ----------------------- Table Releases ---------------
+
+    def test_versioned_lookup(self):
+        rows = [DB15_SCHEMA.parseLine(line) for line in self.TEST_TABLE_LINES]
+        # Later release: the hole is filled, and Seoul moved to Busan:
+        laterRows = rows[:2] +\
+                    [(16777472, 16778239) + rows[1][2:]] +\
+                    [rows[2][:4] + ('Busan', 'Busan') + rows[2][6:]]
+        versions = IpVersionedTable()
+        versions.addRelease('2018-01-01', laterRows)
+        versions.addRelease(datetime.date(2014, 1, 1), rows)
+        self.assertEqual(len(versions), 2)
+        
+        self.assertEqual(versions.lookup('1.0.4.1', asOf='2017-12-31'), self.lookup.lookupIP('1.0.4.1'))
+        self.assertEqual(versions.lookupRecord('1.0.4.1', asOf=datetime.date(2019, 5, 1)).city, 'Busan')
+        # Latest release by default:
+        self.assertEqual(versions.lookup('1.0.2.1')[3], 'Stanford')
+        self.assertIsNone(versions.get('1.0.2.1', asOf='2015-01-01'))
+        with self.assertRaises(ValueError):
+            versions.lookup('1.0.0.5', asOf='2013-12-31')
+        # Unchanged ranges are stored once:
+        self.assertLess(len(versions.starts), len(rows) + len(laterRows))
+        self.assertEqual(versions.lookupRecord('10.0.0.1', asOf='2015-01-01').category, 'private')
+
+    # ----------------------- Utilities ---------------
+
+    def randomRangeTable(self, seed, numRanges=2000):
+        '''
+        Return an IpRangeTable of about numRanges random ranges,
+        with holes between some of them, and one 'location'
+        field of few values.
+        '''
+        rnd = random.Random(seed)
+        bounds = sorted(set(rnd.randrange(2**32) for _ in range(2 * numRanges)))
+        rows = []
+        for rangeNum in range(len(bounds) // 2):
+            start = bounds[2 * rangeNum]
+            # Half the ranges reach up to the next one:
+            if rnd.random() < 0.5 and 2 * rangeNum + 2 < len(bounds):
+                end = bounds[2 * rangeNum + 2] - 1
+            else:
+                end = bounds[2 * rangeNum + 1]
+            rows.append((start, end, 'L%d' % rnd.randrange(20)))
+        return IpRangeTable(rows, ['location'])
+
+    def countryLookup(self):
+        '''
+        Return an IpCountryDict of COUNTRY_TABLE_LINES.
+        '''
+        (fd, countryTable) = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(fd, 'w') as tableFd:
+            tableFd.write('\n'.join(self.COUNTRY_TABLE_LINES) + '\n')
+        try:
+            return IpCountryDict(countryTable)
+        finally:
+            os.remove(countryTable)
+
+if __name__ == "__main__":
+    unittest.main()
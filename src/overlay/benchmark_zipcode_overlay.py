@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+'''
+Created on Oct 18, 2026
+
+Timing of zip code draws for increasing numbers
+of nodes, up to the number of civilian US zip codes.
+Per-draw time must stay flat for the overlay to
+scale linearly with the number of nodes.
+
+The overlay benchmark runs ZipOverlayer on synthetic
+node files of increasing size, with 1 to N node columns,
+and reports time and peak memory growth of each phase:
+internalize_zipcodes(), assign_codes(), and
+export_converted_input(). Each node file size runs in 
+a fresh process, so that peak memory readings of one 
+run do not mask those of the next.
+
+Exits with status 1 if time or memory per node 
+grows super-linearly.
+
+@author: paepcke
+'''
+import argparse
+import multiprocessing
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+from build_zipcode_overlay import ZipOverlayer
+from zip_database import ZipCodeDatabase
+from zip_sampler import ZipSampler
+
+
+# Roughly the number of non-military zip codes:
+ZIP_CAPACITY = 41000
+NUM_STATES   = 50
+DRAW_COUNTS  = [1000, 2000, 5000, 10000, 20000, ZIP_CAPACITY]
+
+# Largest tolerated ratio between per-draw times
+# at the largest and at the smallest draw count:
+MAX_PER_DRAW_GROWTH = 2.0
+
+# Node counts of the synthetic node files; counts
+# beyond the zip code database's size are dropped,
+# and the size itself is added:
+NODE_COUNTS = [1000, 2000, 5000, 10000, 20000]
+MAX_NODE_COLUMNS = 3
+PHASES = ['internalize', 'assign', 'export']
+
+# Largest tolerated ratio between per-node time or
+# memory at the largest node count and at the smallest
+# node count of at least SCALING_BASE_COUNT. Smaller
+# runs are too short, and use too little memory, for
+# stable readings. Memory growth below MEMORY_FLOOR_KB 
+# counts as MEMORY_FLOOR_KB. Internalizing does not 
+# depend on the nodes, and is reported only:
+MAX_PER_NODE_GROWTH = 2.0
+SCALING_BASE_COUNT  = 5000
+MEMORY_FLOOR_KB     = 1024
+SCALING_PHASES      = ['assign', 'export']
+
+#-----------------------------
+# synthetic_state_zips
+#-----------------------
+
+def synthetic_state_zips(num_zips=ZIP_CAPACITY, num_states=NUM_STATES):
+    '''
+    Return {state : [zip1,zip2,...]} with num_zips
+    five-digit zip codes dealt round robin to num_states
+    states.
+    '''
+    state_zips = {}
+    for zip_num in range(num_zips):
+        state = 'S%02d' % (zip_num % num_states)
+        try:
+            state_zips[state].append('%05d' % zip_num)
+        except KeyError:
+            state_zips[state] = ['%05d' % zip_num]
+    return state_zips
+
+#-----------------------------
+# time_draws
+#-----------------------
+
+def time_draws(num_draws):
+    '''
+    Return seconds needed to draw num_draws zip codes
+    from a fresh sampler over ZIP_CAPACITY zip codes.
+    '''
+    sampler = ZipSampler(synthetic_state_zips())
+    start = time.time()
+    for _ in range(num_draws):
+        sampler.draw()
+    return time.time() - start
+
+#-----------------------------
+# run_draw_benchmark
+#-----------------------
+
+def run_draw_benchmark(draw_counts=DRAW_COUNTS):
+    '''
+    Time draws for each count in draw_counts, and print
+    total and per-draw times.
+
+    @return: ratio of per-draw time at the largest
+        count to per-draw time at the smallest count.
+    @rtype: float
+    '''
+    per_draw = []
+    print('%10s %12s %14s' % ('draws', 'seconds', 'usec/draw'))
+    for num_draws in draw_counts:
+        secs = time_draws(num_draws)
+        per_draw.append(secs / num_draws)
+        print('%10d %12.4f %14.3f' % (num_draws, secs, 1e6 * secs / num_draws))
+    return per_draw[-1] / per_draw[0]
+
+# ------------------------- Overlay Phases --------------
+
+class PhaseMeasuringOverlayer(ZipOverlayer):
+    '''
+    ZipOverlayer that records (seconds, peak memory growth in KB)
+    of its constructor's phases in self.phase_stats.
+    '''
+    
+    def __init__(self, *args, **kwargs):
+        self.phase_stats = {}
+        super(PhaseMeasuringOverlayer, self).__init__(*args, **kwargs)
+
+    def internalize_zipcodes(self):
+        self.phase_stats['internalize'] = measure(super(PhaseMeasuringOverlayer, self).internalize_zipcodes)
+
+    def assign_codes(self):
+        self.phase_stats['assign'] = measure(super(PhaseMeasuringOverlayer, self).assign_codes)
+
+#-----------------------------
+# measure
+#-----------------------
+
+def measure(func, *args):
+    '''
+    Call func(*args). Return seconds taken, and growth
+    of the process' peak resident memory in KB.
+    '''
+    peak_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.time()
+    func(*args)
+    secs = time.time() - start
+    return (secs, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - peak_before)
+
+#-----------------------------
+# write_node_file
+#-----------------------
+
+def write_node_file(path, num_nodes, num_columns):
+    '''
+    Write num_nodes lines of num_columns node columns,
+    followed by one extra column. Column 0 of line i
+    holds node i, so there are num_nodes distinct nodes; 
+    the other columns repeat nodes of earlier lines.
+    '''
+    with open(path, 'w') as fd:
+        for line_num in range(num_nodes):
+            nodes = ['node%s' % ((line_num * (col + 1)) % num_nodes) for col in range(num_columns)]
+            fd.write('%s,extra\n' % ','.join(nodes))
+
+#-----------------------------
+# measure_overlay
+#-----------------------
+
+def measure_overlay(args):
+    '''
+    Run the overlay phases on one synthetic node file.
+    Runs as a pool task.
+    
+    @param args: (zipcode_source, work_dir, num_nodes, num_columns)
+    @type args: tuple
+    @return: {phase : (seconds, peak memory growth in KB)}
+    @rtype: dict
+    '''
+    (zipcode_source, work_dir, num_nodes, num_columns) = args
+    ZipOverlayer.ZIPCODE_SOURCE = zipcode_source
+    node_file = os.path.join(work_dir, 'nodes_%s_%s.csv' % (num_nodes, num_columns))
+    outfile   = os.path.join(work_dir, 'zips_%s_%s.csv' % (num_nodes, num_columns))
+    write_node_file(node_file, num_nodes, num_columns)
+    overlayer = PhaseMeasuringOverlayer(node_file, columns=range(num_columns), seed=1)
+    overlayer.phase_stats['export'] = measure(overlayer.export_converted_input, outfile)
+    os.remove(node_file)
+    os.remove(outfile)
+    return overlayer.phase_stats
+
+#-----------------------------
+# run_overlay_benchmark
+#-----------------------
+
+def run_overlay_benchmark(zipcode_source=None, max_columns=MAX_NODE_COLUMNS):
+    '''
+    Measure the overlay phases for each node count
+    and each number of node columns up to max_columns,
+    and print times and memory per phase.
+
+    @return: {(num_columns, phase, 'secs'|'kb') : growth}, where 
+        growth is the ratio of per-node cost at the largest
+        node count to per-node cost at the base count.
+    @rtype: dict
+    '''
+    if zipcode_source is None:
+        zipcode_source = ZipOverlayer.ZIPCODE_SOURCE
+    capacity = len(ZipCodeDatabase.get(zipcode_source))
+    node_counts = [count for count in NODE_COUNTS if count < capacity] + [capacity]
+    base_pos = min(pos for (pos, count) in enumerate(node_counts) 
+                   if count >= min(SCALING_BASE_COUNT, capacity))
+    work_dir = tempfile.mkdtemp(prefix='overlay_benchmark_')
+    growths = {}
+    try:
+        for num_columns in range(1, max_columns + 1):
+            # Fresh process for each node count:
+            pool = multiprocessing.Pool(1, maxtasksperchild=1)
+            try:
+                stats = pool.map(measure_overlay, [(zipcode_source, work_dir, num_nodes, num_columns) 
+                                                   for num_nodes in node_counts], 1)
+            finally:
+                pool.close()
+                pool.join()
+            print('\n%d node column(s):' % num_columns)
+            print('%10s' % 'nodes' + ''.join(' %16s %10s' % (phase + ' sec', 'KB') for phase in PHASES))
+            for (num_nodes, phase_stats) in zip(node_counts, stats):
+                print('%10d' % num_nodes + ''.join(' %16.4f %10d' % phase_stats[phase] for phase in PHASES))
+            for phase in SCALING_PHASES:
+                (base_secs, base_kb) = stats[base_pos][phase]
+                (last_secs, last_kb) = stats[-1][phase]
+                per_node_ratio = float(node_counts[base_pos]) / node_counts[-1]
+                growths[(num_columns, phase, 'secs')] = per_node_ratio * last_secs / max(base_secs, 1e-6)
+                growths[(num_columns, phase, 'kb')] = per_node_ratio * max(last_kb, MEMORY_FLOOR_KB) /\
+                                                      max(base_kb, MEMORY_FLOOR_KB)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return growths
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog=os.path.basename(sys.argv[0]), formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('-c', '--columns',
+                        help='Largest number of node columns in synthetic node files. Default: %s' % MAX_NODE_COLUMNS,
+                        type=int,
+                        default=MAX_NODE_COLUMNS)
+    parser.add_argument('-z', '--zipdb',
+                        help='Zip code database CSV file. Default: %s' % ZipOverlayer.ZIPCODE_SOURCE,
+                        default=None)
+    parser.add_argument('--drawsOnly',
+                        help='Only time zip code draws.',
+                        action='store_true')
+    args = parser.parse_args();
+    super_linear = False
+    growth = run_draw_benchmark()
+    print('Per-draw time growth from %d to %d draws: %.2fx' % (DRAW_COUNTS[0], DRAW_COUNTS[-1], growth))
+    if growth > MAX_PER_DRAW_GROWTH:
+        print('Zip code draws scale super-linearly.')
+        super_linear = True
+    if not args.drawsOnly:
+        growths = run_overlay_benchmark(args.zipdb, args.columns)
+        print('')
+        for (num_columns, phase, unit) in sorted(growths.keys()):
+            growth = growths[(num_columns, phase, unit)]
+            print('Per-node %s growth of %s with %d column(s): %.2fx' % (unit, phase, num_columns, growth))
+            if growth > MAX_PER_NODE_GROWTH:
+                print('    %s scales super-linearly.' % phase)
+                super_linear = True
+    if super_linear:
+        sys.exit(1)
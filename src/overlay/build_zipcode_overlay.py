@@ -7,9 +7,18 @@ Created on Nov 18, 2017
 import argparse
 import collections
 import csv
+import glob
+import itertools
+import math
+import multiprocessing
 import os
-import random
 import sys
+import tempfile
+
+from node_zip_map import NodeZipMap
+from zip_database import ZipCodeDatabase, open_file
+from zip_sampler import ZipPermutation, ZipSampler
+from zip_spatial_index import ZipGridIndex
 
 class ZipOverlayer(collections.MutableMapping):
     '''
@@ -18,54 +27,153 @@ class ZipOverlayer(collections.MutableMapping):
     ZIPCODE_SOURCE = os.path.join('%s' % os.path.dirname(__file__), 
                                   'Data/zip_code_database.csv')
             
-    ZIP_INDEX = 0
-    ZIP_TYPE = 1       # 'STANDARD', 'PO BOX', 'UNIQUE', 'MILITARY'
-    STATE_INDEX = 5
-    COUNTY_INDEX = 6
-    LAT_INDEX = 9
-    LONG_INDEX = 10
+    # Columns of the zip code database:
+    ZIP_INDEX = ZipCodeDatabase.ZIP_INDEX
+    ZIP_TYPE = ZipCodeDatabase.ZIP_TYPE       # 'STANDARD', 'PO BOX', 'UNIQUE', 'MILITARY'
+    STATE_INDEX = ZipCodeDatabase.STATE_INDEX
+    COUNTY_INDEX = ZipCodeDatabase.COUNTY_INDEX
+    LAT_INDEX = ZipCodeDatabase.LAT_INDEX
+    LONG_INDEX = ZipCodeDatabase.LONG_INDEX
+    
+    # Write buffer of converted output files:
+    OUTPUT_BUFFER_SIZE = 1024 * 1024
+    
+    # Rows per batch when converting overlaid files back to nodes:
+    REVERSE_BATCH_SIZE = 10000
+    
+    # Node ordinals per pool task of assign_seeded_codes():
+    SEEDED_CHUNK_SIZE = 100000
+    
+    # Overlay codes are kept as ints: zip * CODE_SUFFIX_RANGE + suffix,
+    # where suffix 0 stands for the plain five-digit zip code, and
+    # suffixes 1..MAX_CODE_SUFFIX for ZIP+4 style codes 'zzzzz-ssss':
+    CODE_SUFFIX_RANGE = 10000
+    MAX_CODE_SUFFIX   = CODE_SUFFIX_RANGE - 1
     
     def __init__(self, node_file, 
                        columns=[0], 
                        delimiter=',',
-                       firstLineIsColHeader=False):
+                       firstLineIsColHeader=False,
+                       seed=None,
+                       outfile=None,
+                       geoPlacement=False,
+                       zip4=False,
+                       processes=None):
         '''
         Constructor
         
-        @param node_file:
-        @type node_file:
+        node_file may be a single file, a glob pattern, or a
+        list of files and patterns, such as the partitions of
+        one edge list. All files share one node-to-zip mapping.
+        With several files, the distinct nodes of each file are
+        collected by a pool of processes, and zip codes are then
+        assigned once, in order of first appearance across the 
+        files, so the result is the same as for the concatenated
+        files. In geo placement mode the files are read in order
+        by this process instead, since placement follows lines.
+        
+        If outfile is provided, zip codes are assigned while 
+        the converted copy of node_file is written to outfile,
+        so node_file is read only once. The result is the same 
+        as constructing without outfile, and then calling
+        export_converted_input(outfile).
+        
+        Without a seed, zip codes are drawn at random from
+        a random state. With a seed, the distinct nodes of all
+        node files are sorted, and the node with ordinal i in
+        that list receives the zip code at position perm(i) of
+        the sorted zip codes, where perm is determined by the
+        seed (see ZipPermutation). Runs with the same seed and 
+        the same set of nodes thus produce identical overlays,
+        whatever the order of the input. Chunks of ordinals are
+        mapped independently, by a pool of processes for large
+        node sets (see assign_seeded_codes()). In geo placement 
+        mode, seeded zip codes are handed out in input order.
+        
+        With geoPlacement, nodes that share a line of node_file
+        are placed close together: a node that does not yet
+        have a zip code receives the unused zip code nearest to
+        the first already placed node on its line (see ZipGridIndex).
+        Only the first node of a connected group gets a random
+        zip code.
+        
+        There are only about 41k usable zip codes. With zip4,
+        larger node sets are covered by ZIP+4 style codes: once 
+        all zip codes are used, assignment starts over on all 
+        zip codes with suffix '-0001', then '-0002', etc. Without
+        zip4, running out of zip codes is a ValueError.
+        
+        Node files and output files whose names end in .gz or
+        .zst are read and written compressed (see compressed_files).
+        
+        With several node files, outfile is a directory, which
+        receives a converted copy of each node file under the 
+        same base name (see export_converted_files()).
+        
+        @param node_file: node file, glob pattern, or list of them
+        @type node_file: {str | [str]}
         @param columns:
         @type columns:
         @param delimiter:
         @type delimiter:
         @param firstLineIsColHeader:
         @type firstLineIsColHeader:
+        @param seed: key for reproducible zip assignment
+        @type seed: {None | int | str}
+        @param outfile: full path to converted output file, or output
+            directory for several node files, if desired
+        @type outfile: {None | str}
+        @param geoPlacement: whether to place nodes near the nodes they share lines with
+        @type geoPlacement: bool
+        @param zip4: whether to extend capacity with ZIP+4 style codes
+        @type zip4: bool
+        @param processes: number of worker processes for several
+            node files. Default: number of CPUs
+        @type processes: {None | int}
         '''
         
         super(ZipOverlayer, self).__init__()
         
-        # Ensure input file is there and
+        self.node_files = ZipOverlayer.expand_node_files(node_file)
+        # Ensure input files are there and
         # readable right away:
-        with open(node_file, 'r') as fd:  #@UnusedVariable
-            pass
+        for one_node_file in self.node_files:
+            with open_file(one_node_file, 'r') as fd:  #@UnusedVariable
+                pass
     
-        self.node_file = node_file
+        self.node_file = self.node_files[0]
         self.columns = columns
         self.delimiter = delimiter
         self.first_line_is_col_header = firstLineIsColHeader
+        self.seed = seed
+        self.zip4 = zip4
+        self.processes = processes
         
-        self.zipcode_to_node = {}
-        self.node_to_zipcode = {}
+        # Nodes and their int codes (see CODE_SUFFIX_RANGE), 
+        # in both directions:
+        self.node_map = NodeZipMap()
         
-        self.zipcodes        = {}
-        self.county_zips     = {}
-        self.state_zips      = {}
+        # Suffix of the codes currently handed out:
+        self.code_suffix = 0
         
-        self.used_zipcodes   = []
+        self.zip_db          = None
+        self.state_zips      = {}
         
+        self.geo_placement = geoPlacement
         self.internalize_zipcodes()
+        self.init_zip_pools()
         
-        self.assign_codes()
+        if outfile is None:
+            self.assign_codes()
+        elif len(self.node_files) > 1:
+            self.assign_codes()
+            self.export_converted_files(outfile)
+        elif self.seed is not None and not self.geo_placement:
+            # Seeded codes depend on the set of all nodes:
+            self.assign_codes()
+            self.export_converted_input(outfile)
+        else:
+            self.convert_file(outfile, self.get_zipcodes_for_nodes)
         
     # ------------------------- Output in Various Forms --------------
             
@@ -87,76 +195,158 @@ class ZipOverlayer(collections.MutableMapping):
         
         @param outfile: full path to output file
         @type outfile: str
+        @raise ValueError: if there are several node files.
         '''
+        if len(self.node_files) > 1:
+            raise ValueError("Several node files; use export_converted_files().")
+        self.convert_file(outfile, self.lookup_zipcodes)
+
+    #-----------------------------
+    # export_converted_files 
+    #-----------------------    
+            
+    def export_converted_files(self, outdir):
+        '''
+        Like export_converted_input(), but for each node file,
+        writing outdir/<base name of node file>. Files are
+        converted in parallel by a pool of processes, which
+        share the mapping through a memory-mapped mapping file
+        (see save_mapping()).
+        
+        @param outdir: directory for the converted files
+        @type outdir: str
+        @raise ValueError: if two node files have the same base name.
+        '''
+        outfiles = [os.path.join(outdir, os.path.basename(one_node_file)) 
+                    for one_node_file in self.node_files]
+        if len(set(outfiles)) != len(outfiles):
+            raise ValueError("Node files %s do not have distinct base names." % self.node_files)
+        if not os.path.isdir(outdir):
+            os.makedirs(outdir)
+        (map_fd, mapfile) = tempfile.mkstemp(suffix='.map')
+        os.close(map_fd)
+        try:
+            self.save_mapping(mapfile)
+            self.run_in_pool(convert_node_file,
+                             [(mapfile, one_node_file, one_outfile, self.columns, 
+                               self.delimiter, self.first_line_is_col_header)
+                              for (one_node_file, one_outfile) in zip(self.node_files, outfiles)])
+        finally:
+            os.remove(mapfile)
+
+    #-----------------------------
+    # convert_file 
+    #-----------------------    
 
-        coded_source = []
-        with open(self.node_file) as source_fd:
+    def convert_file(self, outfile, nodes_to_zips):
+        '''
+        Stream node_file to outfile one row at a time,
+        replacing the node columns by nodes_to_zips(nodes).
+        Memory use does not grow with the file size.
+        
+        @param outfile: full path to output file
+        @type outfile: str
+        @param nodes_to_zips: function from the list of nodes
+            in one line to the list of their zip codes
+        @type nodes_to_zips: callable
+        '''
+        with open_file(self.node_file) as source_fd, \
+             open_file(outfile, 'w', ZipOverlayer.OUTPUT_BUFFER_SIZE) as out_fd:
             nodes_file_reader = csv.reader(source_fd,
                                            delimiter=self.delimiter,
                                            quotechar='"')
+            nodes_file_writer = csv.writer(out_fd,
+                                           delimiter=self.delimiter,
+                                           quotechar='"')
             # Copy header unchanged, if present:
             if self.first_line_is_col_header:
-                coded_source.append(nodes_file_reader.next())
+                nodes_file_writer.writerow(nodes_file_reader.next())
                 
             for source_line in nodes_file_reader: 
-                for col in self.columns:
-                    source_line[col] = self.node_to_zipcode[source_line[col]]
-                coded_source.append(source_line)
-                
-        with open(outfile, 'w') as out_fd:
-            nodes_file_writer = csv.writer(out_fd,
-                                           delimiter=self.delimiter,
-                                           quotechar='"')
-            nodes_file_writer.writerows(coded_source)
+                zipcodes = nodes_to_zips(self.get_line_nodes(source_line))
+                for (col, zipcode) in zip(self.columns, zipcodes):
+                    source_line[col] = zipcode
+                nodes_file_writer.writerow(source_line)
 
     #-----------------------------
     # get_overlay_reverser
     #-----------------------    
     
     def get_overlay_reverser(self):
-        return ZipOverlayer.OverlayReverser(self.zipcode_to_node)
-
-#     #-----------------------------
-#     # get_zipode_to_nodes 
-#     #-----------------------
-#     
-#     def get_zipcode_to_nodes(self, asMultilineString=False):
-#         arr_of_2tuple_strings = ['%s,%s' % (zipcode, node) for 
-#                                  zipcode,node in self.zipcode_to_node.values()]
-#         if asMultilineString:
-#             return '\n'.join(arr_of_2tuple_strings)
-#         else:
-#             return arr_of_2tuple_strings
-#         
-#     #-----------------------------
-#     # get_nodes_to_zipcodes
-#     #-----------------------
-#     
-#     def get_nodes_to_zipcodes(self, asMultilineString=False):
-#         arr_of_2tuple_strings = ['%s,%s' % (node, zipcode) for 
-#                                  node,zipcode in self.node_to_zipcode.values()]
-#         if asMultilineString:
-#             return '\n'.join(arr_of_2tuple_strings)
-#         else:
-#             return arr_of_2tuple_strings
-#         
-#     #-----------------------------
-#     # export_zipcodes_to_nodes 
-#     #-----------------------    
-# 
-#     def export_zipcodes_to_nodes(self, outfile):
-#         writer = csv.writer(outfile)
-#         for line in self.get_zipcode_to_nodes():
-#             writer.writerow(line) 
-# 
-#     #-----------------------------
-#     # export_nodes_to_zipcodes 
-#     #-----------------------    
-# 
-#     def export_nodes_to_zipcodes(self, outfile):
-#         writer = csv.writer(outfile)
-#         for line in self.get_nodes_to_zipcodes():
-#             writer.writerow(line) 
+        return ZipOverlayer.OverlayReverser(self.node_map)
+
+    #-----------------------------
+    # export_zipcodes_to_nodes 
+    #-----------------------    
+
+    def export_zipcodes_to_nodes(self, outfile):
+        '''
+        Write one 'zipcode,node' row per node to outfile.
+        
+        @param outfile: full path to output file
+        @type outfile: str
+        '''
+        with open_file(outfile, 'w', ZipOverlayer.OUTPUT_BUFFER_SIZE) as out_fd:
+            writer = csv.writer(out_fd)
+            for ordinal in range(len(self.node_map)):
+                writer.writerow((ZipOverlayer.format_code(self.node_map.codes[ordinal]),
+                                 self.node_map.node_at(ordinal)))
+
+    #-----------------------------
+    # export_nodes_to_zipcodes 
+    #-----------------------    
+
+    def export_nodes_to_zipcodes(self, outfile):
+        '''
+        Write one 'node,zipcode' row per node to outfile.
+        
+        @param outfile: full path to output file
+        @type outfile: str
+        '''
+        with open_file(outfile, 'w', ZipOverlayer.OUTPUT_BUFFER_SIZE) as out_fd:
+            writer = csv.writer(out_fd)
+            for ordinal in range(len(self.node_map)):
+                writer.writerow((self.node_map.node_at(ordinal),
+                                 ZipOverlayer.format_code(self.node_map.codes[ordinal])))
+
+    #-----------------------------
+    # save_mapping 
+    #-----------------------    
+
+    def save_mapping(self, mapfile):
+        '''
+        Save the node/zip code mapping to a binary file
+        that open_mapping() can reopen later without rereading
+        node_file or the zip code database.
+        
+        @param mapfile: full path to mapping file
+        @type mapfile: str
+        '''
+        self.node_map.save(mapfile)
+
+    #-----------------------------
+    # open_mapping 
+    #-----------------------    
+
+    @classmethod
+    def open_mapping(cls, mapfile):
+        '''
+        Return a read-only ZipOverlayer over a mapping saved 
+        with save_mapping(). The file is memory-mapped, so
+        opening is immediate, and lookups only touch the pages
+        they need. The instance supports node-to-zipcode
+        lookups, get_overlay_reverser(), and the export_*_to_*
+        methods. It cannot assign zip codes to new nodes.
+        
+        @param mapfile: full path to mapping file
+        @type mapfile: str
+        @raise ValueError: if mapfile is not a saved mapping.
+        '''
+        overlayer = cls.__new__(cls)
+        overlayer.node_file  = None
+        overlayer.node_files = []
+        overlayer.node_map  = NodeZipMap.open(mapfile)
+        return overlayer
 
     # ------------------------- Computations --------------
     
@@ -165,67 +355,336 @@ class ZipOverlayer(collections.MutableMapping):
     #-----------------------    
         
     def assign_codes(self):
-        with open(self.node_file, 'r') as node_fd:
-            nodes_file_reader = csv.reader(node_fd, delimiter=self.delimiter)
-            # Pull in all node input lines:
-            # Every line in the input may have 
-            # multiple node columns; but get_next_node()
-            # takes care of that:
-            for node in self.get_next_node(nodes_file_reader):
-                try:
-                    self.node_to_zipcode[node]
-                    # This node already has an 
-                    # associated zipcode:
-                    continue
-                except KeyError:
-                    # The node still needs an assignment:
-                    zipcode = self.get_next_zipcode()
-                    self.node_to_zipcode[node]    = zipcode
-                    self.zipcode_to_node[zipcode] = node
+        if self.seed is not None and not self.geo_placement:
+            self.assign_seeded_codes(itertools.chain.from_iterable(self.discover_nodes()))
+            return
+        if len(self.node_files) > 1 and not self.geo_placement:
+            # Nodes already seen in an earlier
+            # file keep their zip code:
+            for file_nodes in self.discover_nodes():
+                for node in file_nodes:
+                    self.get_zipcodes_for_nodes([node])
+            return
+        for one_node_file in self.node_files:
+            with open_file(one_node_file, 'r') as node_fd:
+                nodes_file_reader = csv.reader(node_fd, delimiter=self.delimiter)
+                if self.first_line_is_col_header:
+                    # Nodes file's first line are the column
+                    # headers. Discard them:
+                    nodes_file_reader.next()
+                # Pull in all node input lines:
+                # Every line in the input may have 
+                # multiple node columns:
+                for source_line in nodes_file_reader:
+                    self.get_zipcodes_for_nodes(self.get_line_nodes(source_line))
+
+    #-----------------------------
+    # discover_nodes 
+    #-----------------------    
+
+    def discover_nodes(self):
+        '''
+        Scan all node files in parallel. Return one list
+        per node file, in node file order, of the file's
+        distinct nodes in order of first appearance.
+        A single node file is scanned by this process.
+        '''
+        arg_tuples = [(one_node_file, self.columns, 
+                       self.delimiter, self.first_line_is_col_header)
+                      for one_node_file in self.node_files]
+        if len(arg_tuples) == 1:
+            return [scan_node_file(arg_tuples[0])]
+        return self.run_in_pool(scan_node_file, arg_tuples)
+
+    #-----------------------------
+    # assign_seeded_codes 
+    #-----------------------    
+
+    def assign_seeded_codes(self, nodes):
+        '''
+        Give each distinct node of nodes the code of its
+        ordinal in their sorted list (see seeded_codes()).
+        The codes of SEEDED_CHUNK_SIZE ordinals at a time 
+        are computed independently of each other, by a pool
+        of processes if there are several chunks.
+        
+        @param nodes: nodes, in any order and with repeats
+        @type nodes: iterable
+        @raise ValueError: if there are more nodes than codes.
+        '''
+        nodes = sorted(set(nodes))
+        num_codes = len(self.zip_db.zips)
+        if self.zip4:
+            num_codes *= ZipOverlayer.MAX_CODE_SUFFIX + 1
+        if len(nodes) > num_codes:
+            raise ValueError("Not enough zipcodes in the US to cover this dataset.")
+        chunk_size = ZipOverlayer.SEEDED_CHUNK_SIZE
+        arg_tuples = [(self.zip_db.zips, self.seed, start, min(start + chunk_size, len(nodes)))
+                      for start in range(0, len(nodes), chunk_size)]
+        if len(arg_tuples) > 1:
+            chunk_codes = self.run_in_pool(seeded_codes, arg_tuples)
+        else:
+            chunk_codes = [seeded_codes(args) for args in arg_tuples]
+        for (node, code) in itertools.izip(nodes, itertools.chain.from_iterable(chunk_codes)):
+            self.node_map.add(node, code)
+
+    #-----------------------------
+    # run_in_pool 
+    #-----------------------    
+
+    def run_in_pool(self, func, arg_tuples):
+        pool = multiprocessing.Pool(self.processes)
+        try:
+            return pool.map(func, arg_tuples)
+        finally:
+            pool.close()
+            pool.join()
+
+    #-----------------------------
+    # get_zipcode_for_node
+    #-----------------------    
+
+    def get_zipcode_for_node(self, node):
+        '''
+        Return the zip code of the given node, assigning
+        the next zip code if the node does not have one yet.
+        '''
+        return self.get_zipcodes_for_nodes([node])[0]
+
+    #-----------------------------
+    # get_zipcodes_for_nodes
+    #-----------------------    
+
+    def get_zipcodes_for_nodes(self, nodes):
+        '''
+        Return the zip codes of the nodes of one line of 
+        node_file, assigning zip codes to those that do not
+        have one yet. In geo placement mode, new nodes are
+        placed near the line's first already placed node.
+        '''
+        anchor_code = None
+        if self.spatial_index is not None:
+            for node in nodes:
+                if node in self.node_map:
+                    anchor_code = self.node_map.code_of(node)
+                    break
+        zipcodes = []
+        for node in nodes:
+            try:
+                # This node may already have an 
+                # associated zipcode:
+                code = self.node_map.code_of(node)
+            except KeyError:
+                # The node still needs an assignment:
+                code = self.get_next_code(node, near=anchor_code)
+                self.node_map.add(node, code)
+            if anchor_code is None:
+                anchor_code = code
+            zipcodes.append(ZipOverlayer.format_code(code))
+        return zipcodes
+
+    #-----------------------------
+    # lookup_zipcodes
+    #-----------------------    
+
+    def lookup_zipcodes(self, nodes):
+        return [ZipOverlayer.format_code(self.node_map.code_of(node)) for node in nodes]
         
     #-----------------------------
-    # get_next_nodes
+    # get_line_nodes
     #-----------------------    
         
-    def get_next_node(self, nodes_file_reader):
-        if self.first_line_is_col_header:
-            # Nodes file's first line are the column
-            # headers. Discard them:
-            nodes_file_reader.next()
-        for source_line in nodes_file_reader: 
-            for col in self.columns:
-                try:
-                    yield source_line[col]
-                except IndexError:
-                    raise ValueError("At least one column number in %s is beyond width of source file %s" %\
-                                      (self.columns, self.node_file))
+    def get_line_nodes(self, source_line):
+        try:
+            return [source_line[col] for col in self.columns]
+        except IndexError:
+            raise ValueError("At least one column number in %s is beyond width of source file %s" %\
+                              (self.columns, self.node_file))
     
+    #-----------------------------
+    # get_next_code
+    #-----------------------    
+
+    def get_next_code(self, node, near=None):
+        '''
+        Return the int code of the next zip code, with the 
+        current code suffix. See get_next_zipcode().
+        
+        @param node: the node that receives the code
+        @type node: str
+        @param near: int code near which to place, or None
+        @type near: {None | int}
+        '''
+        if near is not None:
+            near = ZipCodeDatabase.format_zip(near // ZipOverlayer.CODE_SUFFIX_RANGE)
+        zip_num = int(self.get_next_zipcode(node, near))
+        return zip_num * ZipOverlayer.CODE_SUFFIX_RANGE + self.code_suffix
+
     #-----------------------------
     # get_next_zipcode 
     #-----------------------    
         
-    def get_next_zipcode(self):
+    def get_next_zipcode(self, node, near=None):
         '''
         Return a random zip code from
         a randomly chosen US state. Ensure
         that successive calls never return
-        the same zip code.
-        '''
-        # Pick a random US state:
-        rand_us_state       = random.choice(self.state_zips.keys())
-        # Pick a random zip code within that state:
-        rand_zip_from_state = random.choice(self.state_zips[rand_us_state])
-        # Ensure that each zip code is only used once:
-        self.state_zips[rand_us_state].remove(rand_zip_from_state)
-        # If we used all of this state's zipcodes, remove
-        # the state from consideration:
-        if len(self.state_zips[rand_us_state]) == 0:
-            del self.state_zips[rand_us_state]
-            # If this was the last state at our disposal,
-            # complain:
-            if len(self.state_zips.keys()) == 0:
-                raise ValueError("Not enough zipcodes in the US to cover this dataset.")
-        return rand_zip_from_state
+        the same zip code. Unseeded draws empty 
+        the arrays in self.state_zips.
+        
+        In geo placement mode, if near is a zip code,
+        return the unused zip code closest to it instead.
+        
+        @param node: the node that receives the zip code
+        @type node: str
+        @param near: zip code near which to place, or None
+        @type near: {None | str}
+        @raise ValueError: if all zip codes are used up, and
+            ZIP+4 codes are not enabled or used up as well.
+        '''
+        if self.spatial_index is None:
+            return ZipCodeDatabase.format_zip(self.draw_zip(node))
+        
+        row = None
+        if near is not None:
+            near_row = self.zip_db.row_of(int(near))
+            (lat, longitude) = (self.zip_db.lats[near_row], self.zip_db.longs[near_row])
+            if not (math.isnan(lat) or math.isnan(longitude)):
+                row = self.spatial_index.nearest_unused(lat, longitude)
+        if row is None:
+            # Random placement; the sampler does not know
+            # about zip codes taken by nearest-neighbor
+            # placement, so skip those:
+            row = self.zip_db.row_of(self.draw_zip(node))
+            while self.used_rows[row]:
+                row = self.zip_db.row_of(self.draw_zip(node))
+        self.used_rows[row] = 1
+        self.spatial_index.remove(row)
+        return ZipCodeDatabase.format_zip(self.zip_db.zips[row])
+
+    #-----------------------------
+    # draw_zip 
+    #-----------------------    
+
+    def draw_zip(self, node):
+        '''
+        Return the next int zip code for node from the sampler. 
+        If the sampler is exhausted, and zip4 is enabled,
+        move to the next code suffix, and draw from the 
+        refilled pools.
+        '''
+        try:
+            return self.zip_sampler.draw(node)
+        except ValueError:
+            if not self.zip4 or self.code_suffix >= ZipOverlayer.MAX_CODE_SUFFIX:
+                raise
+        self.code_suffix += 1
+        self.state_zips = self.zip_db.zips_by_state()
+        self.init_zip_pools()
+        return self.zip_sampler.draw(node)
+
+    #-----------------------------
+    # init_zip_pools 
+    #-----------------------    
+
+    def init_zip_pools(self):
+        '''
+        Set up the sampler, and in geo placement mode the
+        spatial index, over all zip codes. Seeded permutations 
+        are keyed by seed and code suffix, so each suffix
+        spreads nodes over the zip codes differently.
+        '''
+        if self.seed is None:
+            self.zip_sampler = ZipSampler(self.state_zips)
+        else:
+            self.zip_sampler = ZipPermutation(self.zip_db.zips, 
+                                              ZipOverlayer.permutation_seed(self.seed, self.code_suffix))
+        
+        if self.geo_placement:
+            self.spatial_index = ZipGridIndex(self.zip_db)
+            # Rows of the zip code database taken by
+            # random or by nearest-neighbor placement:
+            self.used_rows = bytearray(len(self.zip_db))
+        else:
+            self.spatial_index = None
+
+    #-----------------------------
+    # permutation_seed 
+    #-----------------------    
+
+    @staticmethod
+    def permutation_seed(seed, code_suffix):
+        '''
+        Return the key of the zip permutation of the
+        given code suffix.
+        '''
+        if code_suffix == 0:
+            return seed
+        return '%s-%04d' % (seed, code_suffix)
+
+    #-----------------------------
+    # expand_node_files 
+    #-----------------------    
+
+    @staticmethod
+    def expand_node_files(node_file):
+        '''
+        Return the list of files named by a file name, 
+        a glob pattern, or a list of them. Each pattern 
+        contributes its matches in sorted order.
+        
+        @raise IOError: if a pattern matches no file, or
+            if there are no files at all.
+        '''
+        if isinstance(node_file, basestring):
+            node_file = [node_file]
+        node_files = []
+        for pattern in node_file:
+            if glob.has_magic(pattern):
+                matches = sorted(glob.glob(pattern))
+                if len(matches) == 0:
+                    raise IOError("No node files match %s" % pattern)
+                node_files.extend(matches)
+            else:
+                node_files.append(pattern)
+        if len(node_files) == 0:
+            raise IOError("No node files given.")
+        return node_files
+
+    #-----------------------------
+    # format_code 
+    #-----------------------    
+
+    @staticmethod
+    def format_code(code):
+        '''
+        Return the string form of an int code: the five-digit
+        zip code, followed by '-' and the four-digit suffix 
+        if the suffix is not 0.
+        '''
+        (zip_num, suffix) = divmod(code, ZipOverlayer.CODE_SUFFIX_RANGE)
+        if suffix == 0:
+            return ZipCodeDatabase.format_zip(zip_num)
+        return '%05d-%04d' % (zip_num, suffix)
+
+    #-----------------------------
+    # parse_code 
+    #-----------------------    
+
+    @staticmethod
+    def parse_code(code_str):
+        '''
+        Inverse of format_code().
+        
+        @raise KeyError: if code_str is not a zip or ZIP+4 code.
+        '''
+        try:
+            (zip_str, _, suffix_str) = code_str.partition('-')
+            if len(zip_str) != 5 or (suffix_str and len(suffix_str) != 4):
+                raise ValueError()
+            return int(zip_str) * ZipOverlayer.CODE_SUFFIX_RANGE + int(suffix_str or 0)
+        except (ValueError, AttributeError):
+            raise KeyError(code_str)
 
     #-----------------------------
     # internalize_zipcodes
@@ -233,54 +692,19 @@ class ZipOverlayer(collections.MutableMapping):
 
     def internalize_zipcodes(self):
         '''
-        Read all zip codes from file into memory.
-        Build three dicts: 
-            self.zipcodes: {'state'  : ...,
-                            'county' : ...,
-                            'lat'    : ...,
-                            'long'   : ...
-                            }
-            self.county_zips: {county : [zip1,zip2,...]}
-            self.state_zips:  {state  : [zip1,zip2,...]}
-        '''
-        with open(ZipOverlayer.ZIPCODE_SOURCE) as source_fd:
-            reader = csv.reader(source_fd,
-                                delimiter=self.delimiter,
-                                quotechar='"')
-            # Discard header of zip codes dataset:
-            reader.next()
-            for line in reader:
-                the_zip   = line[ZipOverlayer.ZIP_INDEX]
-                zip_type  = line[ZipOverlayer.ZIP_TYPE]
-                if zip_type == 'MILITARY':
-                    # No lat/long for military zip codes:
-                    continue
-                state     = line[ZipOverlayer.STATE_INDEX]
-                county    = line[ZipOverlayer.COUNTY_INDEX]
-                lat       = line[ZipOverlayer.LAT_INDEX]
-                longitute = line[ZipOverlayer.LONG_INDEX]
-                
-                self.zipcodes[the_zip] = {'state' : state,
-                                          'county' : county,
-                                          'lat' : lat,
-                                          'long' : longitute
-                                          }  
-                try:
-                    self.county_zips[county].append(the_zip)
-                except KeyError:
-                    self.county_zips[county] = [the_zip]
-                    
-                try:
-                    self.state_zips[state].append(the_zip)
-                except KeyError:
-                    self.state_zips[state] = [the_zip]
-                
-        self.all_zipcodes = self.zipcodes.keys()
+        Obtain the zip code database, which is loaded
+        from its binary cache unless the CSV file changed
+        (see ZipCodeDatabase). Build
+            self.state_zips:  {state : array of int zip codes}
+        as the pools from which zip codes are drawn.
+        '''
+        self.zip_db = ZipCodeDatabase.get(ZipOverlayer.ZIPCODE_SOURCE)
+        self.state_zips = self.zip_db.zips_by_state()
 
     # --------- Dict Capabilities -----------
         
     def __getitem__(self, key):
-        return self.node_to_zipcode[key]
+        return ZipOverlayer.format_code(self.node_map.code_of(key))
 
     def __setitem__(self, key, value):
         raise NotImplemented("Zip overlays are read-only")
@@ -289,10 +713,10 @@ class ZipOverlayer(collections.MutableMapping):
         raise NotImplemented("Zip overlays are read-only")            
 
     def __iter__(self, zipOrNode='node'):
-        return iter(self.node_to_zipcode)
+        return self.node_map.nodes()
 
     def __len__(self, zipOrNode='node'):
-        return len(self.node_to_zipcode)
+        return len(self.node_map)
 
     def __keytransform__(self, key):
         return key
@@ -309,13 +733,68 @@ class ZipOverlayer(collections.MutableMapping):
         Instantiated via ZipOverlayer.get_reverse_dict()
         '''
         
-        def __init__(self, zipToNodeDict):
+        def __init__(self, nodeZipMap):
     
             super(ZipOverlayer.OverlayReverser, self).__init__()
-            self.zip_to_node = zipToNodeDict
+            self.node_map = nodeZipMap
                 
         def __getitem__(self, key):
-            return self.zip_to_node[key]
+            return self.node_map.node_of(ZipOverlayer.parse_code(key))
+        
+        #-----------------------------
+        # export_reversed_input
+        #-----------------------    
+        
+        def export_reversed_input(self, 
+                                  infile, 
+                                  outfile, 
+                                  columns=[0], 
+                                  delimiter=',', 
+                                  firstLineIsColHeader=False):
+            '''
+            Inverse of ZipOverlayer.export_converted_input():
+            copy infile to outfile, replacing the zip codes in
+            the given columns by their nodes. 
+            
+            Rows are processed in batches of REVERSE_BATCH_SIZE.
+            Each distinct zip code of a batch is looked up once,
+            and the batch is written in one call. Memory use
+            is bounded by the batch size, not the file size.
+            
+            @param infile: full path to file with zip codes
+            @type infile: str
+            @param outfile: full path to output file
+            @type outfile: str
+            @param columns: zero-based columns that hold zip codes
+            @type columns: [int]
+            @param delimiter: column delimiter of infile and outfile
+            @type delimiter: str
+            @param firstLineIsColHeader: whether to copy the first
+                line unchanged
+            @type firstLineIsColHeader: bool
+            @raise KeyError: if a zip code is not in the overlay.
+            @raise ValueError: if a column is beyond the width of infile.
+            '''
+            with open_file(infile) as source_fd, \
+                 open_file(outfile, 'w', ZipOverlayer.OUTPUT_BUFFER_SIZE) as out_fd:
+                reader = csv.reader(source_fd, delimiter=delimiter, quotechar='"')
+                writer = csv.writer(out_fd, delimiter=delimiter, quotechar='"')
+                if firstLineIsColHeader:
+                    writer.writerow(reader.next())
+                
+                batch = list(itertools.islice(reader, ZipOverlayer.REVERSE_BATCH_SIZE))
+                while batch:
+                    try:
+                        zipcodes = set(line[col] for line in batch for col in columns)
+                    except IndexError:
+                        raise ValueError("At least one column number in %s is beyond width of source file %s" %\
+                                         (columns, infile))
+                    nodes = {zipcode : self[zipcode] for zipcode in zipcodes}
+                    for line in batch:
+                        for col in columns:
+                            line[col] = nodes[line[col]]
+                    writer.writerows(batch)
+                    batch = list(itertools.islice(reader, ZipOverlayer.REVERSE_BATCH_SIZE))
     
         def __setitem__(self, key, value):
             raise NotImplemented("Zip overlays are read-only")
@@ -324,15 +803,86 @@ class ZipOverlayer(collections.MutableMapping):
             raise NotImplemented("Zip overlays are read-only")            
     
         def __iter__(self):
-            return iter(self.zip_to_node)
+            return (ZipOverlayer.format_code(code) for code in self.node_map.codes)
     
         def __len__(self):
-            return len(self.zip_to_node)            
+            return len(self.node_map)            
     
         def __keytransform__(self, key):
             return key
 
 
+# ---------------------------- Pool Workers -----------    
+
+# Module level, so that multiprocessing can pickle them.
+
+def scan_node_file(args):
+    '''
+    Return the distinct nodes of one node file in 
+    order of first appearance.
+    
+    @param args: (node_file, columns, delimiter, firstLineIsColHeader)
+    @type args: tuple
+    '''
+    (node_file, columns, delimiter, first_line_is_col_header) = args
+    nodes = []
+    seen = set()
+    with open_file(node_file, 'r') as node_fd:
+        nodes_file_reader = csv.reader(node_fd, delimiter=delimiter)
+        if first_line_is_col_header:
+            nodes_file_reader.next()
+        for source_line in nodes_file_reader:
+            try:
+                line_nodes = [source_line[col] for col in columns]
+            except IndexError:
+                raise ValueError("At least one column number in %s is beyond width of source file %s" %\
+                                  (columns, node_file))
+            for node in line_nodes:
+                if node not in seen:
+                    seen.add(node)
+                    nodes.append(node)
+    return nodes
+
+def seeded_codes(args):
+    '''
+    Return the int codes of node ordinals start to stop - 1
+    of a seeded assignment. Ordinal i gets the zip code
+    at position i % N of the permutation of the N zip codes
+    for code suffix i // N, so the codes of any range of
+    ordinals are computed without knowing the others.
+    
+    @param args: (zip_pool, seed, start, stop)
+    @type args: tuple
+    @raise ValueError: if ordinals go beyond the last code suffix.
+    '''
+    (zip_pool, seed, start, stop) = args
+    codes = []
+    permutation = None
+    for ordinal in xrange(start, stop):
+        (code_suffix, position) = divmod(ordinal, len(zip_pool))
+        if permutation is None or code_suffix != permutation_suffix:
+            if code_suffix > ZipOverlayer.MAX_CODE_SUFFIX:
+                raise ValueError("Not enough zipcodes in the US to cover this dataset.")
+            permutation = ZipPermutation(zip_pool, ZipOverlayer.permutation_seed(seed, code_suffix))
+            permutation_suffix = code_suffix
+        codes.append(permutation[position] * ZipOverlayer.CODE_SUFFIX_RANGE + code_suffix)
+    return codes
+
+def convert_node_file(args):
+    '''
+    Write the converted copy of one node file, using
+    a mapping saved by ZipOverlayer.save_mapping().
+    
+    @param args: (mapfile, node_file, outfile, columns, delimiter, firstLineIsColHeader)
+    @type args: tuple
+    '''
+    (mapfile, node_file, outfile, columns, delimiter, first_line_is_col_header) = args
+    overlayer = ZipOverlayer.open_mapping(mapfile)
+    overlayer.node_file = node_file
+    overlayer.columns   = columns
+    overlayer.delimiter = delimiter
+    overlayer.first_line_is_col_header = first_line_is_col_header
+    overlayer.convert_file(outfile, overlayer.lookup_zipcodes)
 
 if __name__ == '__main__':
     
@@ -351,14 +901,56 @@ if __name__ == '__main__':
     parser.add_argument('-o', '--outfile',
                         help='Full output CSV file name if result output desired.',
                         default=None)
+    parser.add_argument('-s', '--seed',
+                        help='Seed for reproducible zip code assignment. Default: random assignment',
+                        default=None)
+    parser.add_argument('-g', '--geo',
+                        help='Place nodes that appear on the same line near each other.',
+                        action='store_true')
+    parser.add_argument('-4', '--zip4',
+                        help='When zip codes run out, continue with ZIP+4 style codes zzzzz-0001, zzzzz-0002, ...',
+                        action='store_true')
+    parser.add_argument('-m', '--mapfile',
+                        help='File to save the node/zip code mapping to, for later reversal.',
+                        default=None)
+    parser.add_argument('-r', '--reverse',
+                        help='''Convert node_file from zip codes back to nodes, using the mapping
+                        saved earlier in --mapfile. Requires --mapfile and --outfile.''',
+                        action='store_true')
+    parser.add_argument('-p', '--processes',
+                        help='Worker processes for several node files. Default: number of CPUs',
+                        type=int,
+                        default=None)
     parser.add_argument('node_file',
-                        help='Fully qualified name of file with nodes to overlay onto zip codes',
+                        nargs='+',
+                        help='''Fully qualified name of file with nodes to overlay onto zip codes.
+                        Several files or glob patterns share one mapping; -o then names
+                        an output directory.''',
                         default=None)
     args = parser.parse_args();
     args.columns = [int(col_num) for col_num in args.columns] 
+    if args.reverse:
+        if args.mapfile is None or args.outfile is None:
+            parser.error('--reverse requires --mapfile and --outfile')
+        if len(args.node_file) > 1:
+            parser.error('--reverse takes a single file')
+        reverser = ZipOverlayer.open_mapping(args.mapfile).get_overlay_reverser()
+        reverser.export_reversed_input(args.node_file[0],
+                                       args.outfile,
+                                       columns=args.columns or [0],
+                                       delimiter=args.delimiter,
+                                       firstLineIsColHeader=args.firstLine)
+        sys.exit(0)
+    # With an outfile, assignment and conversion
+    # happen in a single pass over node_file:
     zipOverlayer = ZipOverlayer(args.node_file,
                                 columns=args.columns,
                                 delimiter=args.delimiter,
-                                firstLineIsColHeader=args.firstLine)
-    if args.outfile is not None:
-        zipOverlayer.export_converted_input(args.outfile)
\ No newline at end of file
+                                firstLineIsColHeader=args.firstLine,
+                                seed=args.seed,
+                                outfile=args.outfile,
+                                geoPlacement=args.geo,
+                                zip4=args.zip4,
+                                processes=args.processes)
+    if args.mapfile is not None:
+        zipOverlayer.save_mapping(args.mapfile)
@@ -0,0 +1,319 @@
+'''
+Created on Oct 18, 2026
+
+@author: paepcke
+'''
+from array import array
+import mmap
+import struct
+import zlib
+
+class NodeZipMap(object):
+    '''
+    Memory-compact, bidirectional map between node
+    names and int overlay codes (see ZipOverlayer.CODE_SUFFIX_RANGE).
+
+    Every node receives an ordinal in order of insertion.
+    All storage is in flat arrays:
+
+        self.arena      : UTF-8 bytes of all node names, back to back
+        self.offsets    : start of node i's name in arena is offsets[i],
+                          its end is offsets[i+1]
+        self.codes      : code of node i
+        self.node_index : open addressing hash table from the CRC32
+                          of a node name to the node's ordinal
+        self.code_index : open addressing hash table from a code
+                          to the ordinal of its node
+
+    Both directions of lookup thus share the names and
+    codes, and only keep one small int per hash table slot
+    on top. Hash tables are kept at most half full, and
+    use linear probing; empty slots hold -1.
+
+    save() writes the arrays, hash tables included, to
+    a file. open() maps such a file into memory, and 
+    reads entries straight from the mapped pages, so 
+    reopening costs neither parsing nor rehashing. 
+    Opened maps are read-only.
+    '''
+
+    INITIAL_INDEX_SIZE = 1024
+    EMPTY = -1
+
+    # Saved file: header, then arena, offsets, codes,
+    # node_index, and code_index, each starting at a
+    # multiple of SECTION_ALIGNMENT. The header records
+    # the array item sizes of the writing platform:
+    FILE_MAGIC = b'NODEZIP1'
+    HEADER_FORMAT = '<8sQQQBB'
+    SECTION_ALIGNMENT = 8
+
+    def __init__(self):
+        self.arena   = bytearray()
+        self.offsets = array('L', [0])
+        self.codes   = array('i')
+        self.node_index = array('i', [NodeZipMap.EMPTY]) * NodeZipMap.INITIAL_INDEX_SIZE
+        self.code_index = array('i', [NodeZipMap.EMPTY]) * NodeZipMap.INITIAL_INDEX_SIZE
+        self.read_only = False
+
+    #-----------------------------
+    # open
+    #-----------------------
+
+    @classmethod
+    def open(cls, path):
+        '''
+        Return a read-only map over a file written by save().
+
+        @raise ValueError: if path is not a saved map from a
+            platform with the same array item sizes.
+        '''
+        with open(path, 'rb') as fd:
+            mapped = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        header_size = struct.calcsize(NodeZipMap.HEADER_FORMAT)
+        if len(mapped) < header_size:
+            raise ValueError("File %s is not a saved overlay map." % path)
+        (magic, num_nodes, arena_len, index_size, offset_size, code_size) =\
+            struct.unpack_from(NodeZipMap.HEADER_FORMAT, mapped)
+        if magic != NodeZipMap.FILE_MAGIC or\
+           offset_size != array('L').itemsize or code_size != array('i').itemsize:
+            raise ValueError("File %s is not a saved overlay map of this platform." % path)
+
+        node_map = cls.__new__(cls)
+        node_map.read_only = True
+        node_map.mapped_file = mapped
+        pos = cls.aligned(header_size)
+        node_map.arena = MappedBytes(mapped, pos, arena_len)
+        pos = cls.aligned(pos + arena_len)
+        node_map.offsets = MappedArray(mapped, pos, 'L', num_nodes + 1)
+        pos = cls.aligned(pos + (num_nodes + 1) * offset_size)
+        node_map.codes = MappedArray(mapped, pos, 'i', num_nodes)
+        pos = cls.aligned(pos + num_nodes * code_size)
+        node_map.node_index = MappedArray(mapped, pos, 'i', index_size)
+        pos = cls.aligned(pos + index_size * code_size)
+        node_map.code_index = MappedArray(mapped, pos, 'i', index_size)
+        return node_map
+
+    #-----------------------------
+    # save
+    #-----------------------
+
+    def save(self, path):
+        '''
+        Write the map to path in the format that open() reads.
+        '''
+        with open(path, 'wb') as fd:
+            fd.write(struct.pack(NodeZipMap.HEADER_FORMAT,
+                                 NodeZipMap.FILE_MAGIC,
+                                 len(self.codes),
+                                 len(self.arena),
+                                 len(self.node_index),
+                                 self.offsets.itemsize,
+                                 self.codes.itemsize))
+            for section in (self.arena, self.offsets, self.codes, self.node_index, self.code_index):
+                fd.write(b'\0' * (self.aligned(fd.tell()) - fd.tell()))
+                if isinstance(section, bytearray):
+                    fd.write(section)
+                else:
+                    section.tofile(fd)
+
+    #-----------------------------
+    # add
+    #-----------------------
+
+    def add(self, node, code):
+        '''
+        Add a node and its code. Neither may be
+        in the map yet.
+
+        @return: the node's ordinal
+        @rtype: int
+        @raise ValueError: if the node or the code are already mapped,
+            or if the map was opened read-only.
+        '''
+        if self.read_only:
+            raise ValueError("Overlay map opened from file is read-only.")
+        node_bytes = self.to_bytes(node)
+        if 2 * (len(self.codes) + 1) > len(self.node_index):
+            self.rebuild_indexes(2 * len(self.node_index))
+        (node_ordinal, node_slot) = self.find_node(node_bytes)
+        (code_ordinal, code_slot) = self.find_code(code)
+        if node_ordinal != NodeZipMap.EMPTY or code_ordinal != NodeZipMap.EMPTY:
+            raise ValueError("Node %s or code %s already in overlay map." % (node, code))
+
+        ordinal = len(self.codes)
+        self.arena.extend(node_bytes)
+        self.offsets.append(len(self.arena))
+        self.codes.append(code)
+        self.node_index[node_slot] = ordinal
+        self.code_index[code_slot] = ordinal
+        return ordinal
+
+    #-----------------------------
+    # code_of
+    #-----------------------
+
+    def code_of(self, node):
+        '''
+        @raise KeyError: if node is not in the map.
+        '''
+        ordinal = self.find_node(self.to_bytes(node))[0]
+        if ordinal == NodeZipMap.EMPTY:
+            raise KeyError(node)
+        return self.codes[ordinal]
+
+    #-----------------------------
+    # node_of
+    #-----------------------
+
+    def node_of(self, code):
+        '''
+        @raise KeyError: if code is not in the map.
+        '''
+        ordinal = self.find_code(code)[0]
+        if ordinal == NodeZipMap.EMPTY:
+            raise KeyError(code)
+        return self.node_at(ordinal)
+
+    #-----------------------------
+    # node_at
+    #-----------------------
+
+    def node_at(self, ordinal):
+        return bytes(self.arena[self.offsets[ordinal]:self.offsets[ordinal + 1]])
+
+    #-----------------------------
+    # nodes
+    #-----------------------
+
+    def nodes(self):
+        '''
+        Generate all nodes in insertion order.
+        '''
+        for ordinal in range(len(self.codes)):
+            yield self.node_at(ordinal)
+
+    #-----------------------------
+    # __contains__
+    #-----------------------
+
+    def __contains__(self, node):
+        return self.find_node(self.to_bytes(node))[0] != NodeZipMap.EMPTY
+
+    #-----------------------------
+    # __len__
+    #-----------------------
+
+    def __len__(self):
+        return len(self.codes)
+
+    # ------------------------- Hash Tables --------------
+
+    #-----------------------------
+    # find_node
+    #-----------------------
+
+    def find_node(self, node_bytes):
+        '''
+        Probe node_index for node_bytes. Return (ordinal, slot),
+        where ordinal is EMPTY if the node is not in the map,
+        and slot is where the search ended.
+        '''
+        mask = len(self.node_index) - 1
+        slot = zlib.crc32(node_bytes) & mask
+        while True:
+            ordinal = self.node_index[slot]
+            if ordinal == NodeZipMap.EMPTY or\
+               self.arena[self.offsets[ordinal]:self.offsets[ordinal + 1]] == node_bytes:
+                return (ordinal, slot)
+            slot = (slot + 1) & mask
+
+    #-----------------------------
+    # find_code
+    #-----------------------
+
+    def find_code(self, code):
+        '''
+        Probe code_index for code. Return (ordinal, slot)
+        as find_node() does.
+        '''
+        mask = len(self.code_index) - 1
+        slot = self.code_hash(code) & mask
+        while True:
+            ordinal = self.code_index[slot]
+            if ordinal == NodeZipMap.EMPTY or self.codes[ordinal] == code:
+                return (ordinal, slot)
+            slot = (slot + 1) & mask
+
+    #-----------------------------
+    # rebuild_indexes
+    #-----------------------
+
+    def rebuild_indexes(self, index_size):
+        self.node_index = array('i', [NodeZipMap.EMPTY]) * index_size
+        self.code_index = array('i', [NodeZipMap.EMPTY]) * index_size
+        for ordinal in range(len(self.codes)):
+            self.node_index[self.find_node(self.node_at(ordinal))[1]] = ordinal
+            self.code_index[self.find_code(self.codes[ordinal])[1]] = ordinal
+
+    @staticmethod
+    def code_hash(code):
+        # Codes are multiples of 10000 plus small suffixes;
+        # spread them with Knuth's multiplicative hash,
+        # keeping the well-mixed upper product bits:
+        return ((code * 2654435761) & 0xffffffffffff) >> 16
+
+    @staticmethod
+    def aligned(pos):
+        return (pos + NodeZipMap.SECTION_ALIGNMENT - 1) // NodeZipMap.SECTION_ALIGNMENT * NodeZipMap.SECTION_ALIGNMENT
+
+    @staticmethod
+    def to_bytes(node):
+        if isinstance(node, unicode):
+            return node.encode('utf-8')
+        return node
+
+class MappedArray(object):
+    '''
+    Read-only stand-in for an array of the given typecode
+    that lies in a memory-mapped file at the given offset.
+    Items are unpacked on access.
+    '''
+
+    def __init__(self, mapped, offset, typecode, length):
+        self.mapped = mapped
+        self.offset = offset
+        self.item   = struct.Struct(typecode)
+        self.length = length
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self.length
+        if index < 0 or index >= self.length:
+            raise IndexError(index)
+        return self.item.unpack_from(self.mapped, self.offset + index * self.item.size)[0]
+
+    def __iter__(self):
+        for index in range(self.length):
+            yield self[index]
+
+    def __len__(self):
+        return self.length
+
+class MappedBytes(object):
+    '''
+    Read-only stand-in for the bytearray arena within
+    a memory-mapped file. Supports the slicing that
+    NodeZipMap does.
+    '''
+
+    def __init__(self, mapped, offset, length):
+        self.mapped = mapped
+        self.offset = offset
+        self.length = length
+
+    def __getitem__(self, byte_range):
+        return self.mapped[self.offset + byte_range.start:self.offset + byte_range.stop]
+
+    def __len__(self):
+        return self.length
@@ -4,12 +4,19 @@ Created on Nov 18, 2017
 @author: paepcke
 '''
 import csv
+import gzip
+import math
 import os
+import shutil
 import unittest
 
 from wheel.signatures import assertTrue
 
-from overlay.build_zipcode_overlay import ZipOverlayer
+from overlay.build_zipcode_overlay import ZipOverlayer, seeded_codes
+from overlay.node_zip_map import NodeZipMap
+from overlay.zip_database import ZipCodeDatabase
+from overlay.zip_sampler import ZipPermutation, ZipSampler
+from overlay.zip_spatial_index import ZipGridIndex
 
 
 TEST_ALL = True
@@ -236,6 +243,245 @@ class TestZipOverlayer(unittest.TestCase):
             exported_line = nodes_file_reader.next()
             self.assertTrue(self.is_zip(exported_line[0]))
 
+    #-----------------------------
+    # test_single_pass_export 
+    #-----------------------    
+    
+    @unittest.skipIf(not TEST_ALL, "Temporarily disabled")
+    def test_single_pass_export(self):
+        overlayer = ZipOverlayer(TestZipOverlayer.TEST_FILE_TWO_COLS_EXTRA_COLS, columns=[0,2], seed=7)
+        overlayer.export_converted_input(self.outfile)
+        with open(self.outfile, 'r') as fd:
+            two_pass_output = fd.read()
+        
+        single_pass_overlayer = ZipOverlayer(TestZipOverlayer.TEST_FILE_TWO_COLS_EXTRA_COLS, 
+                                             columns=[0,2], 
+                                             seed=7, 
+                                             outfile=self.outfile)
+        with open(self.outfile, 'r') as fd:
+            self.assertEqual(fd.read(), two_pass_output)
+        self.assertEqual(dict(single_pass_overlayer), dict(overlayer))
+
+    #-----------------------------
+    # test_reverse_export 
+    #-----------------------    
+    
+    @unittest.skipIf(not TEST_ALL, "Temporarily disabled")
+    def test_reverse_export(self):
+        overlayer = ZipOverlayer(TestZipOverlayer.TEST_FILE_TWO_COLS_EXTRA_COLS, columns=[0,2])
+        overlayer.export_converted_input(self.outfile)
+        reversed_file = os.path.join(os.path.dirname(__file__), 'output_test_reversed.csv')
+        try:
+            overlayer.get_overlay_reverser().export_reversed_input(self.outfile, 
+                                                                   reversed_file, 
+                                                                   columns=[0,2])
+            with open(TestZipOverlayer.TEST_FILE_TWO_COLS_EXTRA_COLS, 'r') as fd:
+                original = fd.read()
+            with open(reversed_file, 'r') as fd:
+                self.assertEqual(fd.read().replace('\r\n', '\n'), original.replace('\r\n', '\n'))
+            self.assertRaises(ValueError, 
+                              overlayer.get_overlay_reverser().export_reversed_input,
+                              self.outfile, reversed_file, columns=[0,5])
+        finally:
+            os.remove(reversed_file)
+
+    #-----------------------------
+    # test_multiple_node_files 
+    #-----------------------    
+    
+    @unittest.skipIf(not TEST_ALL, "Temporarily disabled")
+    def test_multiple_node_files(self):
+        node_files = [TestZipOverlayer.TEST_FILE_ONE_COL, TestZipOverlayer.TEST_FILE_TWO_COLS]
+        outdir = os.path.join(os.path.dirname(__file__), 'output_test_dir')
+        try:
+            # Same mapping as for the concatenated files:
+            with open(self.outfile, 'w') as out_fd:
+                for node_file in node_files:
+                    with open(node_file, 'r') as fd:
+                        out_fd.write(fd.read())
+            concatenated_overlayer = ZipOverlayer(self.outfile, seed=5)
+            overlayer = ZipOverlayer(node_files, seed=5, outfile=outdir, processes=2)
+            self.assertEqual(dict(overlayer), dict(concatenated_overlayer))
+            self.assertEqual(len(overlayer), 3)
+            
+            for node_file in node_files:
+                with open(node_file, 'r') as fd:
+                    nodes = [line[0] for line in csv.reader(fd)]
+                with open(os.path.join(outdir, os.path.basename(node_file)), 'r') as fd:
+                    zipcodes = [line[0] for line in csv.reader(fd)]
+                self.assertEqual(zipcodes, [overlayer[node] for node in nodes])
+            
+            # Glob patterns are expanded in sorted order:
+            self.assertEqual(ZipOverlayer.expand_node_files(os.path.join(os.path.dirname(__file__), 'test_*_col*.csv')),
+                             sorted([TestZipOverlayer.TEST_FILE_ONE_COL, 
+                                     TestZipOverlayer.TEST_FILE_TWO_COLS,
+                                     TestZipOverlayer.TEST_FILE_TWO_COLS_EXTRA_COLS]))
+            self.assertRaises(IOError, ZipOverlayer.expand_node_files, '/no/such/dir/*.csv')
+            self.assertRaises(ValueError, overlayer.export_converted_input, self.outfile)
+        finally:
+            shutil.rmtree(outdir, ignore_errors=True)
+
+    #-----------------------------
+    # test_compressed_files 
+    #-----------------------    
+    
+    @unittest.skipIf(not TEST_ALL, "Temporarily disabled")
+    def test_compressed_files(self):
+        node_file = os.path.join(os.path.dirname(__file__), 'test_two_cols_extras.csv.gz')
+        outfile = os.path.join(os.path.dirname(__file__), 'output_test.csv.gz')
+        try:
+            with open(TestZipOverlayer.TEST_FILE_TWO_COLS_EXTRA_COLS, 'r') as fd:
+                plain_content = fd.read()
+            with gzip.open(node_file, 'wb') as fd:
+                fd.write(plain_content)
+            overlayer = ZipOverlayer(node_file, columns=[0,2], seed=7, outfile=outfile)
+            
+            plain_overlayer = ZipOverlayer(TestZipOverlayer.TEST_FILE_TWO_COLS_EXTRA_COLS, columns=[0,2], seed=7)
+            plain_overlayer.export_converted_input(self.outfile)
+            self.assertEqual(dict(overlayer), dict(plain_overlayer))
+            with gzip.open(outfile, 'rb') as compressed_fd, open(self.outfile, 'r') as plain_fd:
+                self.assertEqual(compressed_fd.read(), plain_fd.read())
+        finally:
+            for path in (node_file, outfile):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    #-----------------------------
+    # test_zip_database_cache 
+    #-----------------------    
+    
+    @unittest.skipIf(not TEST_ALL, "Temporarily disabled")
+    def test_zip_database_cache(self):
+        cache_path = os.path.join(os.path.dirname(__file__), 'test_zip_database.cache')
+        try:
+            parsed_db = ZipCodeDatabase(ZipOverlayer.ZIPCODE_SOURCE, cache_path=cache_path)
+            self.assertTrue(os.path.exists(cache_path))
+            cached_db = ZipCodeDatabase(ZipOverlayer.ZIPCODE_SOURCE, cache_path=cache_path)
+            self.assertEqual(cached_db.zips, parsed_db.zips)
+            self.assertEqual(cached_db.state_names, parsed_db.state_names)
+            self.assertEqual(cached_db.zips_by_county(), parsed_db.zips_by_county())
+            self.assertEqual(list(parsed_db.zips), sorted(parsed_db.zips))
+        finally:
+            os.remove(cache_path)
+
+    #-----------------------------
+    # test_geo_placement 
+    #-----------------------    
+    
+    @unittest.skipIf(not TEST_ALL, "Temporarily disabled")
+    def test_geo_placement(self):
+        '''
+        Input is:
+        
+        'node1,node2'
+        'node3,node4'
+        'node1,node4'
+        
+        So node2 must be at the zip code closest to node1's,
+        and node4 at the one closest to node3's, except for
+        zip codes that were already taken.
+        '''
+        overlayer = ZipOverlayer(TestZipOverlayer.TEST_FILE_TWO_COLS, columns=[0,1], geoPlacement=True)
+        zip_db = overlayer.zip_db
+        used_rows = set()
+        for (anchor_node, placed_node) in [('node1', 'node2'), ('node3', 'node4')]:
+            anchor_row = zip_db.row_of(int(overlayer[anchor_node]))
+            placed_row = zip_db.row_of(int(overlayer[placed_node]))
+            used_rows.update([anchor_row, placed_row])
+            
+            (lat, longitude) = (zip_db.lats[anchor_row], zip_db.longs[anchor_row])
+            long_scale = math.cos(math.radians(lat))
+            placed_dist = ZipGridIndex.distance(lat, longitude, 
+                                                zip_db.lats[placed_row], zip_db.longs[placed_row], 
+                                                long_scale)
+            for row in range(len(zip_db)):
+                if row in used_rows or math.isnan(zip_db.lats[row]):
+                    continue
+                self.assertLessEqual(placed_dist, 
+                                     ZipGridIndex.distance(lat, longitude, 
+                                                           zip_db.lats[row], zip_db.longs[row], 
+                                                           long_scale))
+        self.assertEqual(len(set(overlayer.values())), 4)
+
+    #-----------------------------
+    # test_zip4_capacity 
+    #-----------------------    
+    
+    @unittest.skipIf(not TEST_ALL, "Temporarily disabled")
+    def test_zip4_capacity(self):
+        num_zips  = len(ZipCodeDatabase.get(ZipOverlayer.ZIPCODE_SOURCE))
+        num_nodes = num_zips + 10
+        with open(self.outfile, 'w') as fd:
+            for node_num in range(num_nodes):
+                fd.write('node%s\n' % node_num)
+        
+        try:
+            ZipOverlayer(self.outfile)
+            self.fail("Should have ValueError for running out of zip codes")
+        except ValueError:
+            pass
+        
+        overlayer = ZipOverlayer(self.outfile, zip4=True, seed=3)
+        self.assertEqual(len(overlayer), num_nodes)
+        self.assertEqual(len(set(overlayer.values())), num_nodes)
+        self.assertTrue(self.is_zip(overlayer['node0']))
+        
+        # Nodes beyond the zip codes get ZIP+4 codes:
+        last_node = max(overlayer.keys())
+        last_code = overlayer[last_node]
+        self.assertTrue(self.is_zip(last_code[:5]))
+        self.assertEqual(last_code[5:], '-0001')
+        self.assertEqual(overlayer.get_overlay_reverser()[last_code], last_node)
+
+    #-----------------------------
+    # test_node_zip_map 
+    #-----------------------    
+    
+    @unittest.skipIf(not TEST_ALL, "Temporarily disabled")
+    def test_node_zip_map(self):
+        node_map = NodeZipMap()
+        # Enough entries to grow the hash tables:
+        num_nodes = 3 * NodeZipMap.INITIAL_INDEX_SIZE
+        for node_num in range(num_nodes):
+            node_map.add('node%s' % node_num, 100000000 + node_num * 10000)
+        self.assertEqual(len(node_map), num_nodes)
+        for node_num in range(num_nodes):
+            self.assertEqual(node_map.code_of('node%s' % node_num), 100000000 + node_num * 10000)
+            self.assertEqual(node_map.node_of(100000000 + node_num * 10000), 'node%s' % node_num)
+        self.assertEqual(list(node_map.nodes())[:2], ['node0', 'node1'])
+        self.assertTrue('node5' in node_map)
+        self.assertFalse('node%s' % num_nodes in node_map)
+        self.assertRaises(KeyError, node_map.code_of, 'no such node')
+        self.assertRaises(KeyError, node_map.node_of, 12345)
+        self.assertRaises(ValueError, node_map.add, 'node0', 1)
+
+    #-----------------------------
+    # test_saved_mapping 
+    #-----------------------    
+    
+    @unittest.skipIf(not TEST_ALL, "Temporarily disabled")
+    def test_saved_mapping(self):
+        mapfile = os.path.join(os.path.dirname(__file__), 'test_overlay.map')
+        overlayer = ZipOverlayer(TestZipOverlayer.TEST_FILE_TWO_COLS, columns=[0,1])
+        try:
+            overlayer.save_mapping(mapfile)
+            reopened = ZipOverlayer.open_mapping(mapfile)
+            self.assertEqual(dict(reopened), dict(overlayer))
+            self.assertEqual(dict(reopened.get_overlay_reverser()), 
+                             dict(overlayer.get_overlay_reverser()))
+            self.assertRaises(KeyError, reopened.__getitem__, 'no such node')
+            
+            reopened.export_nodes_to_zipcodes(self.outfile)
+            with open(self.outfile, 'r') as fd:
+                self.assertEqual(dict(csv.reader(fd)), dict(overlayer))
+            reopened.export_zipcodes_to_nodes(self.outfile)
+            with open(self.outfile, 'r') as fd:
+                self.assertEqual(dict(csv.reader(fd)), dict(overlayer.get_overlay_reverser()))
+        finally:
+            os.remove(mapfile)
+
     #-----------------------------
     # test_bad_cols_spec 
     #-----------------------    
@@ -248,9 +494,122 @@ class TestZipOverlayer(unittest.TestCase):
         except ValueError:
             pass
         
+    #-----------------------------
+    # test_sampler_no_duplicates 
+    #-----------------------    
+
+    @unittest.skipIf(not TEST_ALL, "Temporarily disabled")
+    def test_sampler_no_duplicates(self):
+        state_zips = {'CA' : ['94305', '94306', '94025'],
+                      'NY' : ['10001'],
+                      'MA' : ['02138', '02139']
+                      }
+        all_zips = set(zipcode for zips in state_zips.values() for zipcode in zips)
+        sampler = ZipSampler(state_zips)
+        self.assertEqual(len(sampler), 6)
+        
+        drawn = [sampler.draw() for _ in range(6)]
+        self.assertEqual(set(drawn), all_zips)
+        self.assertEqual(len(sampler), 0)
+        
+        # Pool is exhausted:
+        try:
+            sampler.draw()
+            self.fail("Should have ValueError for exhausted zip codes")
+        except ValueError:
+            pass
+    
+    #-----------------------------
+    # test_seeded_assignment 
+    #-----------------------    
+
+    @unittest.skipIf(not TEST_ALL, "Temporarily disabled")
+    def test_seeded_assignment(self):
+        overlayer1 = ZipOverlayer(TestZipOverlayer.TEST_FILE_TWO_COLS, columns=[0,1], seed=42)
+        overlayer2 = ZipOverlayer(TestZipOverlayer.TEST_FILE_TWO_COLS, columns=[0,1], seed=42)
+        self.assertEqual(dict(overlayer1), dict(overlayer2))
+        self.assertEqual(len(set(overlayer1.values())), 4)
+        
+        # Zip codes follow the sorted nodes, not the 
+        # order of the input:
+        permutation = ZipPermutation(overlayer1.zip_db.zips, 42)
+        self.assertEqual([ZipCodeDatabase.format_zip(zip_num) for zip_num in permutation.zips(0, 4)],
+                         [overlayer1[node] for node in ['node1', 'node2', 'node3', 'node4']])
+        with open(TestZipOverlayer.TEST_FILE_TWO_COLS, 'r') as fd:
+            lines = fd.readlines()
+        with open(self.outfile, 'w') as fd:
+            fd.writelines(reversed(lines))
+        self.assertEqual(dict(ZipOverlayer(self.outfile, columns=[0,1], seed=42)), dict(overlayer1))
+
+    #-----------------------------
+    # test_seeded_chunks 
+    #-----------------------    
+
+    @unittest.skipIf(not TEST_ALL, "Temporarily disabled")
+    def test_seeded_chunks(self):
+        zip_pool = range(1000)
+        # Ordinals of three code suffixes:
+        num_nodes = 2500
+        sequential = seeded_codes((zip_pool, 'chunks', 0, num_nodes))
+        for (first, second) in [((0, 1200), (1200, num_nodes)), ((1200, num_nodes), (0, 1200))]:
+            chunk_codes = {first  : seeded_codes((zip_pool, 'chunks') + first),
+                           second : seeded_codes((zip_pool, 'chunks') + second)}
+            chunked = chunk_codes[(0, 1200)] + chunk_codes[(1200, num_nodes)]
+            self.assertEqual(self.codes_bytes(chunked), self.codes_bytes(sequential))
+        self.assertEqual(len(set(sequential)), num_nodes)
+        
+        # Overlays assigned by a pool in small chunks are 
+        # the same as those assigned in one chunk:
+        node_file = os.path.join(os.path.dirname(__file__), 'output_test_nodes.csv')
+        chunked_outfile = os.path.join(os.path.dirname(__file__), 'output_test_chunked.csv')
+        chunk_size = ZipOverlayer.SEEDED_CHUNK_SIZE
+        try:
+            with open(node_file, 'w') as fd:
+                for node_num in range(50):
+                    fd.write('node%s,node%s\n' % (node_num, (node_num * 7) % 60))
+            ZipOverlayer(node_file, columns=[0,1], seed='chunks', outfile=self.outfile)
+            ZipOverlayer.SEEDED_CHUNK_SIZE = 7
+            ZipOverlayer(node_file, columns=[0,1], seed='chunks', outfile=chunked_outfile, processes=2)
+            with open(self.outfile, 'rb') as fd, open(chunked_outfile, 'rb') as chunked_fd:
+                self.assertEqual(chunked_fd.read(), fd.read())
+        finally:
+            ZipOverlayer.SEEDED_CHUNK_SIZE = chunk_size
+            for path in (node_file, chunked_outfile):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    #-----------------------------
+    # test_permutation_is_bijection 
+    #-----------------------    
+
+    @unittest.skipIf(not TEST_ALL, "Temporarily disabled")
+    def test_permutation_is_bijection(self):
+        zip_pool = ['%05d' % zip_num for zip_num in range(1000)]
+        permutation = ZipPermutation(zip_pool, 'my seed')
+        drawn = [permutation.draw() for _ in range(len(zip_pool))]
+        self.assertEqual(sorted(drawn), zip_pool)
+        self.assertEqual(drawn, permutation.zips(0, len(zip_pool)))
+        self.assertNotEqual(drawn, zip_pool)
+        try:
+            permutation.draw()
+            self.fail("Should have ValueError for exhausted zip codes")
+        except ValueError:
+            pass
     
     # ------------------ Utilities --------------------
 
+    #-----------------------------
+    # codes_bytes 
+    #-----------------------    
+
+    def codes_bytes(self, codes):
+        '''
+        Return the overlay text of a list of int codes.
+        '''
+        return '\n'.join(ZipOverlayer.format_code(code) for code in codes)
+
     #-----------------------------
     # build_test_files 
     #-----------------------    
@@ -0,0 +1,302 @@
+'''
+Created on Oct 18, 2026
+
+@author: paepcke
+'''
+from array import array
+import bisect
+import cPickle as pickle
+import csv
+import os
+import sys
+
+# Compressed file support is shared with the ip_dict package.
+# The other overlay modules take open_file from here. When 
+# this module is not imported as part of the source tree, as 
+# when build_zipcode_overlay.py runs as a script, the ip_dict
+# dir is appended to the module search path, once, so that
+# its modules do not shadow others:
+try:
+    from ip_dict.compressed_files import open_file
+except ImportError:
+    ip_dict_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ip_dict')
+    if ip_dict_dir not in sys.path:
+        sys.path.append(ip_dict_dir)
+    from compressed_files import open_file
+
+class ZipCodeDatabase(object):
+    '''
+    Compact, read-only copy of the non-military rows of
+    the zip code database CSV file. Rows are sorted by
+    zip code, and stored column-wise:
+
+        self.zips       : array of zip codes as ints
+        self.lats       : array of latitudes as doubles (NaN if unknown)
+        self.longs      : array of longitudes as doubles (NaN if unknown)
+        self.state_ids  : array of indexes into self.state_names
+        self.county_ids : array of indexes into self.county_names
+
+    Parsing the CSV file takes most of the time of
+    a ZipOverlayer construction. The arrays are therefore
+    saved to a binary cache file next to the CSV file,
+    and are loaded from there as long as the CSV file's
+    size and modification time are unchanged. Within one
+    process, get() hands out the same instance for the
+    same CSV file.
+    '''
+
+    ZIP_INDEX = 0
+    ZIP_TYPE = 1       # 'STANDARD', 'PO BOX', 'UNIQUE', 'MILITARY'
+    STATE_INDEX = 5
+    COUNTY_INDEX = 6
+    LAT_INDEX = 9
+    LONG_INDEX = 10
+
+    # Increment when the cache layout changes:
+    CACHE_VERSION = 1
+
+    # Instances loaded so far: {(csv_path, size, mtime) : ZipCodeDatabase}
+    loaded_dbs = {}
+
+    #-----------------------------
+    # get
+    #-----------------------
+
+    @classmethod
+    def get(cls, csv_path):
+        '''
+        Return a database for the given CSV file, reusing
+        one that was loaded earlier in this process if the
+        file did not change since.
+        '''
+        key = (csv_path,) + cls.file_signature(csv_path)
+        try:
+            return cls.loaded_dbs[key]
+        except KeyError:
+            zip_db = cls(csv_path)
+            cls.loaded_dbs[key] = zip_db
+            return zip_db
+
+    def __init__(self, csv_path, cache_path=None):
+        '''
+        @param csv_path: zip code database CSV file
+        @type csv_path: str
+        @param cache_path: binary cache file. Default: csv_path
+            with extension .cache
+        @type cache_path: {None | str}
+        '''
+        self.csv_path = csv_path
+        if cache_path is None:
+            cache_path = os.path.splitext(csv_path)[0] + '.cache'
+        self.cache_path = cache_path
+        if not self.load_cache():
+            self.parse_csv()
+            self.save_cache()
+
+    #-----------------------------
+    # format_zip
+    #-----------------------
+
+    @staticmethod
+    def format_zip(zip_num):
+        '''
+        Return the five-digit string of an int zip code.
+        '''
+        return '%05d' % zip_num
+
+    #-----------------------------
+    # row_of
+    #-----------------------
+
+    def row_of(self, zip_num):
+        '''
+        Return the row of the given int zip code.
+
+        @raise KeyError: if the zip code is not in the database.
+        '''
+        row = bisect.bisect_left(self.zips, zip_num)
+        if row == len(self.zips) or self.zips[row] != zip_num:
+            raise KeyError(zip_num)
+        return row
+
+    #-----------------------------
+    # state_of
+    #-----------------------
+
+    def state_of(self, row):
+        return self.state_names[self.state_ids[row]]
+
+    #-----------------------------
+    # county_of
+    #-----------------------
+
+    def county_of(self, row):
+        return self.county_names[self.county_ids[row]]
+
+    #-----------------------------
+    # zips_by_state
+    #-----------------------
+
+    def zips_by_state(self):
+        '''
+        Return a new {state : array of int zip codes}.
+        '''
+        return self.group_zips(self.state_ids, self.state_names)
+
+    #-----------------------------
+    # zips_by_county
+    #-----------------------
+
+    def zips_by_county(self):
+        '''
+        Return a new {county : array of int zip codes}.
+        '''
+        return self.group_zips(self.county_ids, self.county_names)
+
+    #-----------------------------
+    # group_zips
+    #-----------------------
+
+    def group_zips(self, group_ids, group_names):
+        groups = [array('i') for _ in group_names]
+        for (the_zip, group_id) in zip(self.zips, group_ids):
+            groups[group_id].append(the_zip)
+        return dict(zip(group_names, groups))
+
+    #-----------------------------
+    # __len__
+    #-----------------------
+
+    def __len__(self):
+        return len(self.zips)
+
+    # ------------------------- CSV and Cache Files --------------
+
+    #-----------------------------
+    # parse_csv
+    #-----------------------
+
+    def parse_csv(self):
+        '''
+        Read the zip code CSV file, skipping military
+        zip codes, which have no lat/long.
+        '''
+        rows = []
+        with open_file(self.csv_path) as source_fd:
+            reader = csv.reader(source_fd,
+                                delimiter=',',
+                                quotechar='"')
+            # Discard header of zip codes dataset:
+            reader.next()
+            for line in reader:
+                if line[ZipCodeDatabase.ZIP_TYPE] == 'MILITARY':
+                    continue
+                rows.append((int(line[ZipCodeDatabase.ZIP_INDEX]),
+                             line[ZipCodeDatabase.STATE_INDEX],
+                             line[ZipCodeDatabase.COUNTY_INDEX],
+                             self.to_float(line[ZipCodeDatabase.LAT_INDEX]),
+                             self.to_float(line[ZipCodeDatabase.LONG_INDEX])
+                             ))
+        rows.sort()
+
+        self.zips       = array('i')
+        self.lats       = array('d')
+        self.longs      = array('d')
+        self.state_ids  = array('H')
+        self.county_ids = array('H')
+        self.state_names  = []
+        self.county_names = []
+        state_id_of  = {}
+        county_id_of = {}
+        for (the_zip, state, county, lat, longitude) in rows:
+            self.zips.append(the_zip)
+            self.lats.append(lat)
+            self.longs.append(longitude)
+            self.state_ids.append(self.name_id(state, state_id_of, self.state_names))
+            self.county_ids.append(self.name_id(county, county_id_of, self.county_names))
+
+    #-----------------------------
+    # load_cache
+    #-----------------------
+
+    def load_cache(self):
+        '''
+        Load the arrays from the cache file. Return False
+        if there is no cache file, or if it is outdated.
+        '''
+        try:
+            with open(self.cache_path, 'rb') as cache_fd:
+                header = pickle.load(cache_fd)
+                if header['version'] != ZipCodeDatabase.CACHE_VERSION or\
+                   header['csv_signature'] != self.file_signature(self.csv_path):
+                    return False
+                num_zips = header['num_zips']
+                self.state_names  = header['state_names']
+                self.county_names = header['county_names']
+                self.zips       = self.read_array(cache_fd, 'i', num_zips)
+                self.lats       = self.read_array(cache_fd, 'd', num_zips)
+                self.longs      = self.read_array(cache_fd, 'd', num_zips)
+                self.state_ids  = self.read_array(cache_fd, 'H', num_zips)
+                self.county_ids = self.read_array(cache_fd, 'H', num_zips)
+        except (IOError, EOFError, KeyError, pickle.UnpicklingError):
+            return False
+        return True
+
+    #-----------------------------
+    # save_cache
+    #-----------------------
+
+    def save_cache(self):
+        '''
+        Write the arrays to the cache file. The file is
+        written under a temporary name, and then renamed,
+        so concurrent jobs never read a partial cache.
+        A cache that cannot be written is silently skipped.
+        '''
+        header = {'version'       : ZipCodeDatabase.CACHE_VERSION,
+                  'csv_signature' : self.file_signature(self.csv_path),
+                  'num_zips'      : len(self.zips),
+                  'state_names'   : self.state_names,
+                  'county_names'  : self.county_names
+                  }
+        tmp_path = '%s.%s.tmp' % (self.cache_path, os.getpid())
+        try:
+            with open(tmp_path, 'wb') as cache_fd:
+                pickle.dump(header, cache_fd, pickle.HIGHEST_PROTOCOL)
+                for column in (self.zips, self.lats, self.longs, self.state_ids, self.county_ids):
+                    column.tofile(cache_fd)
+            os.rename(tmp_path, self.cache_path)
+        except (IOError, OSError):
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    # ------------------------- Utilities --------------
+
+    @staticmethod
+    def file_signature(path):
+        stat = os.stat(path)
+        return (stat.st_size, stat.st_mtime)
+
+    @staticmethod
+    def read_array(fd, typecode, length):
+        column = array(typecode)
+        column.fromfile(fd, length)
+        return column
+
+    @staticmethod
+    def name_id(name, id_of, names):
+        try:
+            return id_of[name]
+        except KeyError:
+            id_of[name] = len(names)
+            names.append(name)
+            return id_of[name]
+
+    @staticmethod
+    def to_float(num_str):
+        try:
+            return float(num_str)
+        except ValueError:
+            return float('nan')
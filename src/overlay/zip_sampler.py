@@ -0,0 +1,202 @@
+'''
+Created on Oct 18, 2026
+
+@author: paepcke
+'''
+import hashlib
+import random
+
+class ZipSampler(object):
+    '''
+    Draws zip codes without replacement: first a
+    random state among the states that still have
+    unused zip codes, then a random unused zip code
+    within that state.
+
+    Each draw is O(1): the chosen zip code is
+    overwritten by the last zip code of its state's
+    pool, and the pool is shortened by one. States
+    whose pool runs empty are removed from the state
+    list the same way.
+    '''
+
+    def __init__(self, state_zips, rand=random):
+        '''
+        @param state_zips: {state : [zip1,zip2,...]}. The lists
+            or arrays are used as the sampler's pools, and are 
+            emptied as zip codes are drawn.
+        @type state_zips: {str : {[str] | array}}
+        @param rand: source of randomness; the random module,
+            or a random.Random instance.
+        @type rand: {module | random.Random}
+        '''
+        self.rand = rand
+        self.states = [state for state in state_zips.keys()
+                       if len(state_zips[state]) > 0]
+        self.pools  = [state_zips[state] for state in self.states]
+
+    #-----------------------------
+    # draw
+    #-----------------------
+
+    def draw(self, node=None):
+        '''
+        Return a random, not yet drawn zip code. The
+        node is accepted for symmetry with ZipPermutation,
+        and does not influence the draw.
+
+        @raise ValueError: if all zip codes have been drawn.
+        '''
+        if len(self.states) == 0:
+            raise ValueError("Not enough zipcodes in the US to cover this dataset.")
+        state_pos = self.rand.randrange(len(self.states))
+        pool      = self.pools[state_pos]
+        zip_pos   = self.rand.randrange(len(pool))
+        the_zip   = pool[zip_pos]
+
+        # Fill the hole with the pool's last zip code:
+        pool[zip_pos] = pool[-1]
+        pool.pop()
+
+        if len(pool) == 0:
+            # Same for the state list:
+            self.states[state_pos] = self.states[-1]
+            self.pools[state_pos]  = self.pools[-1]
+            self.states.pop()
+            self.pools.pop()
+        return the_zip
+
+    #-----------------------------
+    # __len__
+    #-----------------------
+
+    def __len__(self):
+        '''
+        Number of zip codes not yet drawn.
+        '''
+        return sum(len(pool) for pool in self.pools)
+
+class ZipPermutation(object):
+    '''
+    Seeded alternative to ZipSampler. The node with
+    ordinal i, its position in the sorted list of all
+    distinct nodes, is given the zip code at position
+    perm(i) of a zip pool, where perm is a permutation
+    of the pool positions that is fully determined by 
+    the seed.
+
+    A node's zip code thus depends only on the seed, 
+    the pool, and the node's ordinal. Any chunk of 
+    ordinals can be mapped on its own (see zips()), by 
+    any process and in any order, with the same result
+    as mapping all ordinals in one run.
+
+    The permutation is a four-round Feistel network 
+    over the smallest even-bit-width domain that covers 
+    the pool. Values that fall beyond the pool are 
+    encrypted again until they land inside it (cycle
+    walking), which keeps the mapping a bijection.
+    Unlike ZipSampler, zip codes are drawn uniformly
+    over all zip codes, not first by state.
+    '''
+
+    NUM_ROUNDS = 4
+
+    def __init__(self, zip_pool, seed):
+        '''
+        @param zip_pool: all usable zip codes. Must be in 
+            the same order in every run, e.g. sorted.
+        @type zip_pool: {[str] | array}
+        @param seed: key of the permutation
+        @type seed: {int | str}
+        '''
+        self.zip_pool = zip_pool
+        self.seed = seed
+        
+        # Bits of each Feistel half:
+        self.half_bits = max(1, ((len(zip_pool) - 1).bit_length() + 1) // 2)
+        self.half_mask = (1 << self.half_bits) - 1
+        
+        # Ordinal of the next draw():
+        self.num_drawn = 0
+
+    #-----------------------------
+    # draw
+    #-----------------------
+
+    def draw(self, node=None):
+        '''
+        Return the zip code of the next ordinal, for 
+        callers that place nodes in input order, as 
+        ZipSampler does. The node does not influence
+        the draw.
+
+        @raise ValueError: if all zip codes have been drawn.
+        '''
+        the_zip = self[self.num_drawn]
+        self.num_drawn += 1
+        return the_zip
+
+    #-----------------------------
+    # zips
+    #-----------------------
+
+    def zips(self, start, stop):
+        '''
+        Return the zip codes of ordinals start to stop - 1.
+        
+        @raise ValueError: if stop is beyond the pool.
+        '''
+        return [self[ordinal] for ordinal in range(start, stop)]
+
+    #-----------------------------
+    # __getitem__
+    #-----------------------
+
+    def __getitem__(self, ordinal):
+        '''
+        Return the zip code at permuted position 
+        perm(ordinal) of the pool.
+
+        @raise ValueError: if ordinal is beyond the pool.
+        '''
+        if ordinal < 0 or ordinal >= len(self.zip_pool):
+            raise ValueError("Not enough zipcodes in the US to cover this dataset.")
+        permuted = self.encrypt(ordinal)
+        while permuted >= len(self.zip_pool):
+            permuted = self.encrypt(permuted)
+        return self.zip_pool[permuted]
+
+    #-----------------------------
+    # __len__
+    #-----------------------
+
+    def __len__(self):
+        '''
+        Number of zip codes not yet drawn.
+        '''
+        return len(self.zip_pool) - self.num_drawn
+
+    #-----------------------------
+    # encrypt
+    #-----------------------
+
+    def encrypt(self, value):
+        left  = value >> self.half_bits
+        right = value & self.half_mask
+        for round_num in range(ZipPermutation.NUM_ROUNDS):
+            (left, right) = (right, left ^ (self.hash_int('%s:%s' % (round_num, right)) & self.half_mask))
+        return (left << self.half_bits) | right
+
+    #-----------------------------
+    # hash_int
+    #-----------------------
+
+    def hash_int(self, text):
+        '''
+        Return a seeded 64-bit hash of text.
+        '''
+        if not isinstance(text, bytes):
+            text = text.encode('utf-8')
+        digest = hashlib.sha1(('%s:' % self.seed).encode('utf-8') + text).hexdigest()
+        return int(digest[:16], 16)
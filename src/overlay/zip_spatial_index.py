@@ -0,0 +1,157 @@
+'''
+Created on Oct 18, 2026
+
+@author: paepcke
+'''
+from array import array
+import math
+
+class ZipGridIndex(object):
+    '''
+    Spatial index over the lat/long centroids of the
+    rows of a ZipCodeDatabase. The map is cut into square
+    cells of CELL_DEGREES; each cell holds the rows of its
+    not yet used zip codes. nearest_unused() searches the
+    cells around the query point in growing rings, and
+    stops as soon as no farther ring can hold a closer
+    zip code. Its cost therefore depends on the density of
+    zip codes around the point, not on the number of zip
+    codes.
+
+    Removing a used row is O(1): the row is overwritten by
+    the last row of its cell, whose position is tracked
+    in self.positions.
+
+    Distances are planar, with longitude differences
+    scaled by the cosine of the query latitude, which
+    is accurate enough for picking neighbors.
+    '''
+
+    CELL_DEGREES = 0.5
+
+    def __init__(self, zip_db, cell_degrees=None):
+        '''
+        @param zip_db: zip code database whose rows to index.
+            Rows without lat/long are not indexed.
+        @type zip_db: ZipCodeDatabase
+        @param cell_degrees: edge length of grid cells. Default: CELL_DEGREES
+        @type cell_degrees: {None | float}
+        '''
+        if cell_degrees is None:
+            cell_degrees = ZipGridIndex.CELL_DEGREES
+        self.zip_db = zip_db
+        self.cell_degrees = cell_degrees
+        self.cells = {}
+        self.positions = array('i', [-1]) * len(zip_db)
+        self.num_indexed = 0
+        for row in range(len(zip_db)):
+            (lat, longitude) = (zip_db.lats[row], zip_db.longs[row])
+            if math.isnan(lat) or math.isnan(longitude):
+                continue
+            cell_rows = self.cells.setdefault(self.cell_of(lat, longitude), array('i'))
+            self.positions[row] = len(cell_rows)
+            cell_rows.append(row)
+            self.num_indexed += 1
+
+    #-----------------------------
+    # nearest_unused
+    #-----------------------
+
+    def nearest_unused(self, lat, longitude):
+        '''
+        Return the row of the indexed zip code that
+        is closest to the given point, or None if all
+        indexed zip codes have been removed.
+        '''
+        if self.num_indexed == 0:
+            return None
+        (center_lat_cell, center_long_cell) = self.cell_of(lat, longitude)
+        long_scale = max(math.cos(math.radians(lat)), 0.01)
+        best = (float('inf'), None)
+        ring = 0
+        while True:
+            # Any point in this ring is at least ring-1
+            # cells away along latitude or longitude:
+            if (ring - 1) * self.cell_degrees * long_scale > best[0]:
+                return best[1]
+            if (2 * ring + 1) ** 2 > 4 * len(self.cells):
+                # Few unused zip codes are left nearby; rings
+                # now cover more cells than are occupied, so
+                # just check all occupied cells:
+                return self.closest_in(self.cells.values(), lat, longitude, long_scale, best)[1]
+            ring_rows = [self.cells[cell] 
+                         for cell in self.ring_cells(center_lat_cell, center_long_cell, ring)
+                         if cell in self.cells]
+            best = self.closest_in(ring_rows, lat, longitude, long_scale, best)
+            ring += 1
+
+    #-----------------------------
+    # remove
+    #-----------------------
+
+    def remove(self, row):
+        '''
+        Remove the given row from the index, if it is
+        indexed.
+        '''
+        position = self.positions[row]
+        if position < 0:
+            return
+        cell = self.cell_of(self.zip_db.lats[row], self.zip_db.longs[row])
+        cell_rows = self.cells[cell]
+        last_row = cell_rows[-1]
+        cell_rows[position] = last_row
+        self.positions[last_row] = position
+        cell_rows.pop()
+        self.positions[row] = -1
+        if len(cell_rows) == 0:
+            del self.cells[cell]
+        self.num_indexed -= 1
+
+    #-----------------------------
+    # __len__
+    #-----------------------
+
+    def __len__(self):
+        return self.num_indexed
+
+    # ------------------------- Utilities --------------
+
+    def closest_in(self, cells_rows, lat, longitude, long_scale, best):
+        '''
+        Return (distance, row) of the row in cells_rows that 
+        is closest to the given point, or best if none is closer.
+        '''
+        (best_dist, best_row) = best
+        for cell_rows in cells_rows:
+            for row in cell_rows:
+                dist = self.distance(lat, longitude,
+                                     self.zip_db.lats[row], self.zip_db.longs[row],
+                                     long_scale)
+                if dist < best_dist:
+                    (best_dist, best_row) = (dist, row)
+        return (best_dist, best_row)
+
+    def cell_of(self, lat, longitude):
+        return (int(math.floor(lat / self.cell_degrees)),
+                int(math.floor(longitude / self.cell_degrees)))
+
+    @staticmethod
+    def ring_cells(center_lat_cell, center_long_cell, ring):
+        '''
+        Generate the cells whose Chebyshev distance from
+        the center cell is ring.
+        '''
+        if ring == 0:
+            yield (center_lat_cell, center_long_cell)
+            return
+        for long_cell in range(center_long_cell - ring, center_long_cell + ring + 1):
+            yield (center_lat_cell - ring, long_cell)
+            yield (center_lat_cell + ring, long_cell)
+        for lat_cell in range(center_lat_cell - ring + 1, center_lat_cell + ring):
+            yield (lat_cell, center_long_cell - ring)
+            yield (lat_cell, center_long_cell + ring)
+
+    @staticmethod
+    def distance(lat1, long1, lat2, long2, long_scale):
+        return math.hypot(lat2 - lat1, (long2 - long1) * long_scale)